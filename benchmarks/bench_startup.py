@@ -0,0 +1,82 @@
+"""
+Startup check of the parse/count entry point: runs batch.analyze_structure without SASA in fresh interpreters and
+verifies that it stays within a time budget and never imports the plotting and SASA dependencies, which the entry
+points load only when a plotting or SASA stage is requested. Run from the repository root:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --budget 0.4 --runs 10 data/1FFW_AB_c.pdb
+
+The exit status is 1 when a heavy module was imported or the fastest run exceeded the budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# Modules the parse/count path must not import
+HEAVY_MODULES = ("matplotlib", "seaborn", "pandas", "freesasa", "scipy", "pyarrow", "sasaumure")
+# Seconds allowed for importing the entry point modules and analysing one small structure, interpreter start excluded
+DEFAULT_BUDGET = 0.5
+DEFAULT_FILE = os.path.join(ROOT, "data", "1brs.pdb")
+
+# Run in a fresh interpreter with src/ as working directory, as the entry points are
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import batch, contact_engine, pdb_analyzer, pdb_parser, visualizations
+imported = time.perf_counter()
+batch.analyze_structure(sys.argv[1], sasa=False)
+done = time.perf_counter()
+print(json.dumps({"import_seconds": imported - start, "seconds": done - start,
+                  "modules": sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[2:]))}))
+"""
+
+
+def probe(file: str) -> dict:
+    """
+    Imports the entry point modules and analyses one structure in a fresh interpreter.
+    :param file: The PDB file.
+    :return: The import time, the time including the analysis, the wall time of the process and the heavy modules
+    that were imported.
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", _PROBE, file, *HEAVY_MODULES], cwd=SRC, capture_output=True,
+                             text=True)
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"The startup probe failed:\n{process.stderr}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["wall_seconds"] = wall
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", default=DEFAULT_FILE, help="The structure analysed.")
+    parser.add_argument("--runs", type=int, default=5, help="The number of fresh interpreters; the fastest is kept.")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="The allowed seconds.")
+    args = parser.parse_args(argv)
+
+    runs = [probe(os.path.abspath(args.file)) for _ in range(args.runs)]
+    fastest = min(runs, key=lambda run: run["seconds"])
+    heavy = sorted({name for run in runs for name in run["modules"]})
+    print(f"imports {fastest['import_seconds']:.4f} s, imports + parse/count {fastest['seconds']:.4f} s "
+          f"(budget {args.budget:.4f} s), process {fastest['wall_seconds']:.4f} s")
+    failed = False
+    if heavy:
+        print(f"Heavy modules imported: {', '.join(heavy)}")
+        failed = True
+    if fastest["seconds"] > args.budget:
+        print(f"Over budget by {fastest['seconds'] - args.budget:.4f} s")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark suite: times every stage of the analysis pipeline (parse, index, contacts in atom and centroid mode, the
+interfaces of every chain pair, SASA, heat map rendering) and its peak traced memory, on the structures of data/ and
+on synthetic structures of increasing size, and writes the results as JSON so that runs can be compared across
+commits.
+
+Synthetic cases are given as ATOMS:CHAINS and are generated once into the work directory. Run from the repository
+root:
+
+    python benchmarks/bench_suite.py -o results.json
+    python benchmarks/bench_suite.py --cases 10000:2 1000000:24 -o new.json --compare results.json --tolerance 0.2
+
+With --compare, stages slower than the baseline by more than the tolerance are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import contact_engine  # noqa: E402
+import pdb_parser  # noqa: E402
+from pdb_index import StructureIndex  # noqa: E402
+
+DEFAULT_CASES = ["5000:2", "50000:4", "500000:16", "2000000:40"]
+DATA_FILES = ["1brs.pdb", "1FFW_AB_c.pdb"]
+STAGES = ("parse", "index", "contacts_atom", "contacts_centroid", "interfaces", "sasa", "plot")
+CHAIN_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+AMINO_ACIDS = ["ALA", "ARG", "ASN", "ASP", "CYS", "GLN", "GLU", "GLY", "HIS", "ILE", "LEU", "LYS", "MET", "PHE",
+               "PRO", "SER", "THR", "TRP", "TYR", "VAL"]
+RESIDUE_ATOMS = ["N", "CA", "C", "O", "CB", "CG", "CD", "CE"]
+# Protein interiors hold about one heavy atom per 20 cubic angstroms
+VOLUME_PER_ATOM = 20.0
+CONTACT_CUTOFF = 10.0
+
+
+def synthetic_pdb(path: str, n_atoms: int, n_chains: int, seed: int = 0) -> int:
+    """
+    Writes a synthetic PDB file: chains are random walks of CA atoms with 3.8 angstrom steps, folded into a box
+    sized for protein density, each residue carrying eight atoms around its CA.
+    :param path: The output file.
+    :param n_atoms: The approximate number of atoms.
+    :param n_chains: The number of chains. Labels repeat beyond 62 chains.
+    :param seed: The random seed.
+    :return: The number of atoms written.
+    """
+    rng = np.random.default_rng(seed)
+    per_residue = len(RESIDUE_ATOMS)
+    residues_per_chain = max(1, n_atoms // (per_residue * n_chains))
+    if residues_per_chain > 9999:
+        raise ValueError("Too many residues per chain for the PDB format, use more chains.")
+    side = (n_atoms * VOLUME_PER_ATOM) ** (1 / 3)
+    serial = 0
+    with open(path, "w") as out:
+        for chain in range(n_chains):
+            steps = rng.normal(size=(residues_per_chain, 3))
+            steps *= 3.8 / np.linalg.norm(steps, axis=1, keepdims=True)
+            walk = rng.uniform(0, side, 3) + np.cumsum(steps, axis=0)
+            # Fold the walk back into the box
+            walk = side - np.abs(side - np.mod(walk, 2 * side))
+            atoms = walk[:, np.newaxis, :] + rng.normal(scale=0.9, size=(residues_per_chain, per_residue, 3))
+            atoms[:, 1] = walk
+            names = rng.integers(len(AMINO_ACIDS), size=residues_per_chain)
+            label = CHAIN_LABELS[chain % len(CHAIN_LABELS)]
+            lines = []
+            for residue in range(residues_per_chain):
+                resname = AMINO_ACIDS[names[residue]]
+                for atom, (x, y, z) in zip(RESIDUE_ATOMS, atoms[residue].tolist()):
+                    serial += 1
+                    lines.append(f"ATOM  {serial % 100000:5d}  {atom:<3s} {resname} {label}{residue + 1:4d}    "
+                                 f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00 20.00           {atom[0]}  \n")
+            lines.append("TER\n")
+            out.writelines(lines)
+    return serial
+
+
+def case_files(cases: list, workdir: str, data: bool = True) -> list:
+    """
+    Resolves benchmark cases to files, generating synthetic structures that are not in the work directory yet.
+    :param cases: ATOMS:CHAINS strings.
+    :param workdir: The directory holding generated structures.
+    :param data: Whether the structures of data/ are included.
+    :return: (case name, file) pairs.
+    """
+    files = [(name.split(".")[0], os.path.join(ROOT, "data", name)) for name in DATA_FILES] if data else []
+    os.makedirs(workdir, exist_ok=True)
+    for case in cases:
+        atoms, chains = (int(float(value)) for value in case.split(":"))
+        path = os.path.join(workdir, f"synthetic_{atoms}_{chains}.pdb")
+        if not os.path.exists(path):
+            print(f"Generating {path}", file=sys.stderr)
+            synthetic_pdb(path + ".partial", atoms, chains)
+            os.replace(path + ".partial", path)
+        files.append((f"synthetic_{atoms}_{chains}", path))
+    return files
+
+
+def measure(function, repeat: int) -> tuple:
+    """
+    Times a stage and measures its peak traced memory.
+    :param function: The stage, called without arguments.
+    :param repeat: The number of timed runs; the fastest is kept. Memory is measured in one extra run.
+    :return: (seconds, peak bytes, result of the last call)
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def _sasa(structure):
+    import freesasa
+    import sasaumure
+    # Synthetic residues carry atom names freesasa does not know, which it would report atom by atom
+    freesasa.setVerbosity(freesasa.silent)
+    return sasaumure.structure_sasa(structure)
+
+
+def _plot(contacts, output: str):
+    import visualizations
+    visualizations.heat_mapper(contacts, "one", "two", output=output)
+
+
+def run_case(name: str, path: str, stages: tuple, repeat: int, sasa_max_atoms: int, plot_max_residues: int,
+             scratch: str) -> list:
+    """
+    Runs every stage on one structure.
+    :return: One result dictionary per stage.
+    """
+    results = []
+
+    def record(stage, function, **extra):
+        seconds, peak, result = measure(function, repeat)
+        results.append({"case": name, "stage": stage, "seconds": seconds, "peak_bytes": peak, **extra})
+        print(f"{name:<28} {stage:<18} {seconds:10.4f} s {peak / 2 ** 20:10.1f} MiB", file=sys.stderr)
+        return result
+
+    structure = record("parse", lambda: pdb_parser.parse_pdb(path))
+    sizes = {"atoms": structure.n_atoms, "residues": structure.n_residues, "chains": structure.n_chains}
+    for entry in results:
+        entry.update(sizes)
+    if "index" in stages:
+        record("index", lambda: StructureIndex(structure).counts_per_chain(), **sizes)
+
+    chains = structure["chains"][:2]
+    contacts = {}
+    if len(chains) == 2:
+        one, two = structure.residues(chains[0]), structure.residues(chains[1])
+        for mode in ("atom", "centroid"):
+            if f"contacts_{mode}" in stages:
+                contacts[mode] = record(f"contacts_{mode}",
+                                        lambda: contact_engine.residue_distances(one, two, CONTACT_CUTOFF, mode),
+                                        **sizes)
+    if "interfaces" in stages:
+        record("interfaces", lambda: contact_engine.chain_interfaces(structure, CONTACT_CUTOFF), **sizes)
+    heat_map = contacts.get("atom", contacts.get("centroid"))
+    if "sasa" in stages and structure.n_atoms <= sasa_max_atoms:
+        # As compute_sasa does, on the structure parsed without HETATM records
+        without_hetatm = pdb_parser.parse_pdb(path, hetatm=False)
+        record("sasa", lambda: _sasa(without_hetatm), **sizes)
+    if "plot" in stages and heat_map is not None and max(heat_map.shape) <= plot_max_residues:
+        record("plot", lambda: _plot(heat_map, os.path.join(scratch, f"{name}.png")), **sizes)
+    return results
+
+
+def metadata() -> dict:
+    """Describes the code and machine a run was made on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: list, baseline: list, tolerance: float, min_seconds: float) -> list:
+    """
+    Finds the stages slower than in a baseline run.
+    :param results: The results of this run.
+    :param baseline: The results of the baseline run.
+    :param tolerance: The allowed relative slowdown, e.g. 0.2 for 20 %.
+    :param min_seconds: Slowdowns smaller than this are ignored as noise.
+    :return: (case, stage, baseline seconds, seconds) of every regression.
+    """
+    reference = {(entry["case"], entry["stage"]): entry["seconds"] for entry in baseline}
+    regressions = []
+    for entry in results:
+        before = reference.get((entry["case"], entry["stage"]))
+        if before is None:
+            continue
+        if entry["seconds"] > before * (1 + tolerance) and entry["seconds"] - before > min_seconds:
+            regressions.append((entry["case"], entry["stage"], before, entry["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="*", default=DEFAULT_CASES, help="Synthetic cases as ATOMS:CHAINS.")
+    parser.add_argument("--no-data", dest="data", action="store_false", help="Skip the structures of data/.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "pdb_benchmarks"),
+                        help="Directory where synthetic structures are generated and kept.")
+    parser.add_argument("--sasa-max-atoms", type=int, default=200000)
+    parser.add_argument("--plot-max-residues", type=int, default=2000)
+    parser.add_argument("-o", "--output", help="The JSON result file.")
+    parser.add_argument("--compare", help="A JSON result file of a baseline run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown.")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Slowdowns ignored below this duration.")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for name, path in case_files(args.cases, args.workdir, args.data):
+            results += run_case(name, path, tuple(args.stages), args.repeat, args.sasa_max_atoms,
+                                args.plot_max_residues, scratch)
+    run = {"meta": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_seconds)
+        print(f"Compared with {baseline['meta'].get('commit', '')[:12] or args.compare}: "
+              f"{len(regressions)} regression(s)")
+        for case, stage, before, after in regressions:
+            print(f"  {case} {stage}: {before:.4f} s -> {after:.4f} s ({after / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
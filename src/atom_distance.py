@@ -1,6 +1,17 @@
+from collections import OrderedDict
 from pprint import pprint
 import numpy as np
 
+import contact_engine
+import geometry
+from pdb_structure import ResidueView
+from profiling import count, timed
+
+# Residue pairs whose distances a DistanceService remembers
+DEFAULT_MAX_PAIRS = 1 << 16
+# Atom pairs compared at once by DistanceService.distances
+PAIR_BLOCK = 1 << 22
+
 
 def euclidean_distance(coordinate_1: list, coordinate_2: list):
     """
@@ -28,6 +39,19 @@ def coordinate_extractor(residue: dict, atom: str) -> list:
     return [residue[atom]['x'], residue[atom]['y'], residue[atom]['z']]
 
 
+def residue_coordinates(residue) -> np.ndarray:
+    """
+    Gives the coordinates of all atoms of a residue as an (n_atoms, 3) array. Residue views of a Structure expose
+    their coordinate block directly; legacy residue dictionaries are gathered atom by atom.
+    :param residue: A residue view or a residue dictionary with an "atomlist" key.
+    :return: An array holding one row of x, y, z coordinates per atom.
+    """
+    coords = getattr(residue, "coords", None)
+    if coords is not None:
+        return coords
+    return np.array([coordinate_extractor(residue, atom) for atom in residue['atomlist']], dtype=np.float64)
+
+
 def centroid_searcher(residue: dict):
     """
     Calculate the centroid of a residue.
@@ -40,10 +64,21 @@ def centroid_searcher(residue: dict):
     :return: A list representing the x, y, and z coordinates of the
     centroid.
     """
-    coordinates = [coordinate_extractor(residue, atom) for atom in residue['atomlist']]
-    return np.mean(coordinates, axis=0)
+    return np.mean(residue_coordinates(residue), axis=0)
+
+
+def minimum_distance(coords1: np.ndarray, coords2: np.ndarray) -> float:
+    """
+    Gives the smallest distance between two blocks of atom coordinates.
+    :param coords1: An (n, 3) coordinate array.
+    :param coords2: An (m, 3) coordinate array.
+    :return: The minimum over all n x m atom pairs.
+    """
+    differences = coords1[:, np.newaxis, :] - coords2[np.newaxis, :, :]
+    return float(np.sqrt(np.min(np.einsum('ijk,ijk->ij', differences, differences))))
 
 
+@timed
 def calculate_distance(mode: str, first_residue: dict, second_residue: dict) -> float:
     """
     Calculate the minimum distance between all pairs of atoms or the distance between centroids of two residues.
@@ -51,53 +86,248 @@ def calculate_distance(mode: str, first_residue: dict, second_residue: dict) ->
     if mode not in ["atom", "centroid"]:
         raise ValueError("Mode must be 'atom' or 'centroid'.")
 
-    if mode == "atom":
-        # Extract and store coordinates for all atoms in each residue to prevent repetitive calculations
-        coords1 = [np.array(coordinate_extractor(first_residue, atom)) for atom in first_residue["atomlist"]]
-        coords2 = [np.array(coordinate_extractor(second_residue, atom)) for atom in second_residue["atomlist"]]
+    coords1 = residue_coordinates(first_residue)
+    coords2 = residue_coordinates(second_residue)
 
-        # Calculate all pairwise distances and return the minimum
-        distances = [np.linalg.norm(c1 - c2) for c1 in coords1 for c2 in coords2]
-        return min(distances)
+    if mode == "atom":
+        # Broadcast every atom pair at once and return the minimum
+        return minimum_distance(coords1, coords2)
 
     elif mode == "centroid":
-        # Use NumPy for efficient centroid calculation
-        centroid_1 = np.mean(
-            np.array([coordinate_extractor(first_residue, atom) for atom in first_residue["atomlist"]]), axis=0)
-        centroid_2 = np.mean(
-            np.array([coordinate_extractor(second_residue, atom) for atom in second_residue["atomlist"]]), axis=0)
-
         # Calculate and return the distance between centroids
-        return np.linalg.norm(centroid_1 - centroid_2)
+        return np.linalg.norm(np.mean(coords1, axis=0) - np.mean(coords2, axis=0))
 
 
-def residue_residue(residue1: list, residue2: list, threshold: float = float('inf'), mode: str = "atom") -> list:
+@timed
+def centroid_distances(residue1: list, residue2: list) -> np.ndarray:
     """
-    Refactored function description...
+    Calculate the distances between the centroids of two lists of residues.
+    :param residue1: The first list of residues.
+    :param residue2: The second list of residues.
+    :return: A len(residue1) x len(residue2) distance matrix.
     """
+    # Centroids of all residues of a structure come from one segment reduction
+    centroids1 = geometry.residues_centroids(residue1)
+    centroids2 = geometry.residues_centroids(residue2)
+    count(pairs=len(centroids1) * len(centroids2))
+    # Calculate the distances between all centroids, a block of rows at a time
+    return geometry.centroid_distances(centroids1, centroids2)
+
+
+@timed
+def residue_residue(residue1: list, residue2: list, threshold: float = float('inf'), mode: str = "atom",
+                    backend: str = "grid", sparse: bool = False):
+    """
+    Calculate the contacts between two lists of residues.
+    For every residue of the first list, returns the list of distances (minimum atom-atom distance in "atom" mode,
+    centroid-centroid distance in "centroid" mode) to the residues of the second list that are closer than the
+    threshold. A residue is never compared with itself.
+    :param residue1: The first list of residues.
+    :param residue2: The second list of residues.
+    :param threshold: Only distances strictly below the threshold are kept.
+    :param mode: "atom" or "centroid".
+    :param backend: How atom mode searches atom pairs: "grid" uses the cell list of contact_engine, "pairwise"
+    compares every residue pair in turn.
+    :param sparse: Whether the contacts are returned as a sparse contact map, keeping which residues are in contact.
+    :return: A list holding one list of distances per residue of the first list, or with sparse, the
+    contact_engine.ResidueContacts of the pairs (always computed with the grid backend).
+    """
+    if backend not in ["grid", "pairwise"]:
+        raise ValueError("Backend must be 'grid' or 'pairwise'.")
+    if sparse:
+        return contact_engine.residue_distances(residue1, residue2, threshold, mode)
+
+    count(residues=len(residue1) + len(residue2))
     contact_list = []
 
-    if mode == "atom":
+    if mode == "atom" and backend == "grid":
+        contact_list = contact_engine.residue_contacts(residue1, residue2, threshold).rows()
+
+    elif mode == "atom":
+        # Gather each coordinate block once instead of once per residue pair
+        blocks2 = [residue_coordinates(r) for r in residue2]
         for residue_one in residue1:
+            coords1 = residue_coordinates(residue_one)
             distances = []
-            for residue_two in residue2:
+            for residue_two, coords2 in zip(residue2, blocks2):
                 if residue_one == residue_two:
                     # Skip redundant calculations for the same residue
                     continue
-                distance = calculate_distance(mode, residue_one, residue_two)
+                distance = minimum_distance(coords1, coords2)
                 if distance < threshold:
                     distances.append(distance)
             # Append the list of distances for the current residue pair
             contact_list.append(distances)
 
     elif mode == "centroid":
-        # Using numpy to calculate centroid distances
-        centroids1 = np.array([centroid_searcher(r) for r in residue1])
-        centroids2 = np.array([centroid_searcher(r) for r in residue2])
-        # Calculate the distances between all centroids
-        distances = np.linalg.norm(centroids1[:, np.newaxis, :] - centroids2[np.newaxis, :, :], axis=2)
+        distances = centroid_distances(residue1, residue2)
         # Filter the distances by the threshold
         for dist_row in distances:
             contact_list.append(dist_row[dist_row < threshold].tolist())
 
     return contact_list
+
+
+class DistanceService:
+    """
+    Residue-residue distances of one Structure, for notebooks and scripts asking for the same residue pairs again
+    and again.
+
+    The coordinates are converted to float64 once, so the block of a residue is a view of the coordinate array, and
+    the centroids of every residue come from one segment reduction on the first centroid query. Pair results are
+    remembered in a least recently used cache of at most max_pairs entries, keyed by the mode and the two residues
+    (a residue index stands for its chain and residue number), and hits and misses are counted:
+
+        distances = DistanceService(structure)
+        distances.distance("atom", ("A", "8"), ("D", "12"))
+        distances.distances("centroid", [(("A", "8"), ("D", "12")), (("A", "9"), ("D", "12"))])
+        distances.cache_info()
+    """
+
+    def __init__(self, structure, max_pairs: int = DEFAULT_MAX_PAIRS):
+        """
+        :param structure: The Structure whose residues are compared.
+        :param max_pairs: The number of residue pair results remembered.
+        """
+        self.structure = structure
+        self.max_pairs = max_pairs
+        self.hits = 0
+        self.misses = 0
+        self._coords = np.asarray(structure.coords, dtype=np.float64)
+        self._centroids = None
+        self._pairs = OrderedDict()
+
+    def residue(self, residue) -> int:
+        """
+        Gives the index of a residue of the structure.
+        :param residue: A residue view of the structure, a (chain, residue number) pair or a residue index.
+        :return: The residue index.
+        """
+        if isinstance(residue, ResidueView):
+            if residue.structure is not self.structure:
+                raise ValueError("The residue belongs to another structure.")
+            return residue.index
+        if isinstance(residue, tuple):
+            return self.structure.residue_index(*residue)
+        return int(residue)
+
+    def coordinates(self, residue) -> np.ndarray:
+        """
+        Gives the coordinates of the atoms of a residue.
+        :param residue: The residue, see residue.
+        :return: An (n_atoms, 3) view of the coordinate array.
+        """
+        return self._coords[self.structure.residue_atoms(self.residue(residue))]
+
+    def centroids(self) -> np.ndarray:
+        """
+        Gives the centroid of every residue, computed on the first call.
+        :return: An (n_residues, 3) array.
+        """
+        if self._centroids is None:
+            self._centroids = geometry.residue_centroids(self.structure)
+        return self._centroids
+
+    def _remember(self, key: tuple, distance: float):
+        self._pairs[key] = distance
+        if len(self._pairs) > self.max_pairs:
+            self._pairs.popitem(last=False)
+
+    def distance(self, mode: str, first_residue, second_residue) -> float:
+        """
+        Gives the distance between two residues, as calculate_distance does.
+        :param mode: "atom" for the minimum atom-atom distance, "centroid" for the centroid-centroid distance.
+        :param first_residue: The first residue, see residue.
+        :param second_residue: The second residue.
+        :return: The distance.
+        """
+        if mode not in ["atom", "centroid"]:
+            raise ValueError("Mode must be 'atom' or 'centroid'.")
+        first, second = sorted((self.residue(first_residue), self.residue(second_residue)))
+        key = (mode, first, second)
+        distance = self._pairs.get(key)
+        if distance is not None:
+            self._pairs.move_to_end(key)
+            self.hits += 1
+            return distance
+        self.misses += 1
+        if mode == "atom":
+            distance = minimum_distance(self.coordinates(first), self.coordinates(second))
+        else:
+            centroids = self.centroids()
+            distance = float(np.linalg.norm(centroids[first] - centroids[second]))
+        self._remember(key, distance)
+        return distance
+
+    def _atom_distances(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """Computes the minimum atom-atom distance of residue pairs, comparing the atom pairs of many at once."""
+        starts = self.structure.residue_starts
+        lengths1, lengths2 = starts[first + 1] - starts[first], starts[second + 1] - starts[second]
+        sizes = lengths1 * lengths2
+        ends = np.cumsum(sizes)
+        result = np.empty(len(first))
+        pair = 0
+        while pair < len(first):
+            # Blocks of whole residue pairs holding about PAIR_BLOCK atom pairs
+            stop = max(pair + 1, int(np.searchsorted(ends, ends[pair] - sizes[pair] + PAIR_BLOCK, side="right")))
+            block_sizes = sizes[pair:stop]
+            owner = np.repeat(np.arange(pair, stop), block_sizes)
+            offsets = np.cumsum(block_sizes) - block_sizes
+            within = np.arange(int(block_sizes.sum())) - np.repeat(offsets, block_sizes)
+            atoms1 = starts[first[owner]] + within // lengths2[owner]
+            atoms2 = starts[second[owner]] + within % lengths2[owner]
+            squared = contact_engine._squared_distances(self._coords[atoms1], self._coords[atoms2])
+            result[pair:stop] = np.sqrt(np.minimum.reduceat(squared, offsets))
+            pair = stop
+        return result
+
+    @timed("distance_service")
+    def distances(self, mode: str, pairs: list) -> np.ndarray:
+        """
+        Gives the distances of many residue pairs. Pairs not in the cache are computed together: centroid distances
+        in one array operation, atom distances by comparing the atom pairs of many residue pairs at once.
+        :param mode: "atom" or "centroid", see distance.
+        :param pairs: (first residue, second residue) pairs, see residue.
+        :return: One distance per pair.
+        """
+        if mode not in ["atom", "centroid"]:
+            raise ValueError("Mode must be 'atom' or 'centroid'.")
+        indices = np.array([[self.residue(first), self.residue(second)] for first, second in pairs],
+                           dtype=np.int64).reshape(-1, 2)
+        indices.sort(axis=1)
+        keys = [(mode, first, second) for first, second in indices.tolist()]
+        result = np.empty(len(keys))
+        missing = []
+        for position, key in enumerate(keys):
+            distance = self._pairs.get(key)
+            if distance is None:
+                missing.append(position)
+            else:
+                self._pairs.move_to_end(key)
+                result[position] = distance
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        count(pairs=len(keys), misses=len(missing))
+        if missing:
+            first, second = indices[missing, 0], indices[missing, 1]
+            if mode == "atom":
+                computed = self._atom_distances(first, second)
+            else:
+                centroids = self.centroids()
+                computed = np.linalg.norm(centroids[first] - centroids[second], axis=1)
+            result[missing] = computed
+            for position, distance in zip(missing, computed.tolist()):
+                self._remember(keys[position], distance)
+        return result
+
+    def cache_info(self) -> dict:
+        """
+        Describes the use of the pair cache.
+        :return: The hits, misses, number of remembered pairs and maximum number of pairs.
+        """
+        return {"hits": self.hits, "misses": self.misses, "pairs": len(self._pairs), "max_pairs": self.max_pairs}
+
+    def clear(self):
+        """Forgets the remembered pairs and resets the statistics."""
+        self._pairs.clear()
+        self.hits = self.misses = 0
@@ -0,0 +1,454 @@
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import contact_engine
+import pdb_analyzer
+import pdb_parser
+import profiling
+
+# Stages timed for every structure, in execution order
+STAGES = ("parse", "counts", "contacts", "sasa")
+PDB_EXTENSIONS = tuple(f"{extension}{compression}" for extension in (".pdb", ".ent", ".cif", ".mmcif")
+                       for compression in ("", *pdb_parser.COMPRESSIONS))
+SINK_FORMATS = ("csv", "jsonl", "parquet")
+# Number of rows buffered by the Parquet sink before a row group is written
+PARQUET_ROW_GROUP = 256
+
+
+def structure_name(file: str) -> str:
+    """
+    Gives the name under which a structure is reported, the file name without its extensions. Files in different
+    directories or formats (1abc.pdb, 1abc.cif.gz) share a name, so rows are told apart by their file, see
+    input_key.
+    :param file: The path of the structure file.
+    :return: The structure name.
+    """
+    return os.path.basename(file).split(".")[0]
+
+
+def input_key(file: str) -> str:
+    """
+    Gives the key identifying an input across runs, its normalised absolute path.
+    :param file: The path of the structure file, as given or as recorded in the "file" column of a result file.
+    :return: The key.
+    """
+    return os.path.normpath(os.path.abspath(file))
+
+
+def expand_inputs(inputs: list) -> list:
+    """
+    Resolves the command line inputs to a sorted list of PDB files.
+    :param inputs: Directories (searched for PDB and mmCIF files, plain or compressed), glob patterns or file names.
+    :return: The unique file paths, sorted.
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            files.update(os.path.join(item, name) for name in os.listdir(item) if name.lower().endswith(PDB_EXTENSIONS))
+        elif glob.has_magic(item):
+            files.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+        elif os.path.isfile(item):
+            files.add(item)
+        else:
+            raise FileNotFoundError(f"No such file, directory or matching pattern: {item}")
+    return sorted(files)
+
+
+def read_file_list(file: str) -> list:
+    """
+    Reads input paths from a text file, one per line; blank lines and lines starting with # are ignored.
+    :param file: The name of the list file.
+    :return: The paths.
+    """
+    with open(file, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def sasa_areas(structure: pdb_parser.Structure) -> np.ndarray:
+    """
+    Computes the absolute SASA of every residue of a structure with freesasa, from its parsed coordinates.
+    :param structure: The structure, parsed without HETATM records.
+    :return: The residue areas.
+    """
+    import sasaumure
+
+    return sasaumure.structure_sasa(structure)["SASA"]
+
+
+def analyze_structure(file: str, chains: tuple = None, thresholds: tuple = tuple(range(1, 11)),
+                      aa: str = "LYS", sasa: bool = True, data: bytes = None, keep_contacts: bool = False) -> dict:
+    """
+    Runs the analysis of main() on one structure: parsing, pdb_analyzer counts, interface contacts between two
+    chains in atom and centroid mode, and SASA.
+    :param file: The PDB or mmCIF file, plain or compressed.
+    :param chains: The two chains whose interface is analysed. Defaults to the first two chains of the file.
+    :param thresholds: The distance (and SASA) thresholds.
+    :param aa: The amino acid counted.
+    :param sasa: Whether SASA is computed.
+    :param data: The content of the file when it was already read, see pdb_parser.read_data.
+    :param keep_contacts: Whether the atom mode contacts (ResidueContacts) are returned under the "contacts" key of
+    the row, e.g. to draw their heat map.
+    :return: One flat result row, including the time spent in every stage.
+    """
+    timings = {}
+    row = {"structure": structure_name(file), "file": file}
+
+    start = time.perf_counter()
+    with profiling.stage("parse"):
+        if data is None:
+            structure = pdb_parser.parse_pdb(file, hetatm=False)
+        else:
+            structure = pdb_parser.parse_pdb_data(data, file, hetatm=False)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with profiling.stage("counts"):
+        row["chains"] = pdb_analyzer.chain_count(structure)
+        row["residues"] = pdb_analyzer.residue_count(structure)
+        row["atoms"] = structure.n_atoms
+        row[aa.lower()] = pdb_analyzer.total_aa(structure, aa)[1]
+    timings["counts"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with profiling.stage("contacts"):
+        pair = tuple(chains) if chains else tuple(structure["chains"][:2])
+        if len(pair) == 2 and all(chain in structure["chains"] for chain in pair):
+            row["chain_one"], row["chain_two"] = pair
+            residues_one = pdb_analyzer.residues_in_chain(structure, pair[0])
+            residues_two = pdb_analyzer.residues_in_chain(structure, pair[1])
+            for mode in ("atom", "centroid"):
+                contacts = contact_engine.residue_distances(residues_one, residues_two, max(thresholds), mode)
+                counts = contact_engine.interface_residue_counts(contacts, thresholds)
+                for threshold, count in zip(thresholds, counts):
+                    row[f"{mode}_{threshold}"] = count
+                if keep_contacts and mode == "atom":
+                    row["contacts"] = contacts
+    timings["contacts"] = time.perf_counter() - start
+
+    if sasa:
+        import sasaumure
+
+        start = time.perf_counter()
+        with profiling.stage("sasa"):
+            areas = sasa_areas(structure)
+            row["sasa_total"] = float(areas.sum())
+            below = sasaumure.sasa_threshold_counts(areas, thresholds)["all"]
+            for threshold, count in zip(thresholds, below.tolist()):
+                row[f"sasa_{threshold}"] = count
+        timings["sasa"] = time.perf_counter() - start
+
+    for stage, seconds in timings.items():
+        row[f"time_{stage}"] = seconds
+    return row
+
+
+def _safe_analyze(file: str, options: dict, profile: dict = None) -> dict:
+    """
+    Runs analyze_structure in a worker, turning a failure into an error row.
+    :param profile: Keyword arguments of profiling.Profiler; when given, the stages of the structure are profiled and
+    the profile is returned under the "profile" key of the row.
+    """
+    profiler = profiling.Profiler(structure_name(file), **profile) if profile is not None else None
+    try:
+        with profiler or contextlib.nullcontext():
+            row = analyze_structure(file, **options)
+    except Exception as error:
+        row = {"structure": structure_name(file), "file": file, "error": f"{type(error).__name__}: {error}"}
+    if profiler is not None:
+        row["profile"] = profiler.to_dict()
+    return row
+
+
+class CsvSink:
+    """
+    Appends result rows to a CSV file. An existing file must have the columns of this run, e.g. the same thresholds
+    and SASA option, otherwise some values would be silently dropped.
+    """
+
+    def __init__(self, path: str, columns: list):
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, "r", newline="") as f:
+                header = next(csv.reader(f), [])
+            if header != list(columns):
+                raise ValueError(f"{path} has the columns {header}, this run writes {list(columns)}; restart the "
+                                 f"output (--restart) or write to another file.")
+        self.file = open(path, "a", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, extrasaction="ignore")
+        if not exists:
+            self.writer.writeheader()
+
+    def write(self, row: dict):
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlSink:
+    """Appends result rows to a JSON Lines file, one object per line."""
+
+    def __init__(self, path: str, columns: list):
+        self.file = open(path, "a")
+
+    def write(self, row: dict):
+        self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Writes result rows to a Parquet file in row groups of PARQUET_ROW_GROUP rows. Parquet files cannot be appended
+    to, so the rows of an existing file are copied into a new one, which replaces it when the sink is closed.
+    """
+
+    TEXT_COLUMNS = ("structure", "file", "chain_one", "chain_two", "error")
+
+    def __init__(self, path: str, columns: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("The parquet format requires pyarrow (pip install pyarrow).") from None
+        self.pa, self.path, self.rows = pa, path, []
+        previous = pq.read_table(path) if os.path.exists(path) else None
+        if previous is not None:
+            if previous.schema.names != list(columns):
+                raise ValueError(f"{path} has the columns {previous.schema.names}, this run writes {list(columns)}; "
+                                 f"restart the output (--restart) or write to another file.")
+            self.schema = previous.schema
+        else:
+            self.schema = pa.schema([(column, self._column_type(column)) for column in columns])
+        self.temporary = path + ".partial"
+        self.writer = pq.ParquetWriter(self.temporary, self.schema)
+        if previous is not None:
+            self.writer.write_table(previous)
+
+    def _column_type(self, column: str):
+        if column in self.TEXT_COLUMNS:
+            return self.pa.string()
+        if column.startswith("time_") or column == "sasa_total":
+            return self.pa.float64()
+        return self.pa.int64()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def write(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        os.replace(self.temporary, self.path)
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def sink_format(path: str, fmt: str = None) -> str:
+    """
+    Gives the format of a result file, from the explicit format or the file extension.
+    :param path: The result file.
+    :param fmt: One of SINK_FORMATS, or None to use the extension.
+    :return: The format.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in SINK_FORMATS:
+        raise ValueError(f"Output format must be one of {SINK_FORMATS}.")
+    return fmt
+
+
+def completed_files(path: str, fmt: str) -> set:
+    """
+    Reads the inputs already recorded without error in a result file, so that an interrupted run can resume.
+    :param path: The result file.
+    :param fmt: Its format.
+    :return: The input keys of the completed structures, see input_key.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return set()
+    if fmt == "csv":
+        with open(path, "r", newline="") as f:
+            return {input_key(row["file"]) for row in csv.DictReader(f) if not row.get("error")}
+    if fmt == "jsonl":
+        done = set()
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption
+                    continue
+                if not row.get("error"):
+                    done.add(input_key(row["file"]))
+        return done
+    import pyarrow.parquet as pq
+    table = pq.read_table(path).to_pylist()
+    return {input_key(row["file"]) for row in table if not row.get("error")}
+
+
+def result_columns(thresholds: tuple, aa: str, sasa: bool) -> list:
+    """Gives the columns of a result row, in order."""
+    columns = ["structure", "file", "chains", "residues", "atoms", aa.lower(), "chain_one", "chain_two"]
+    columns += [f"{mode}_{threshold}" for mode in ("atom", "centroid") for threshold in thresholds]
+    if sasa:
+        columns += ["sasa_total"] + [f"sasa_{threshold}" for threshold in thresholds]
+    return columns + [f"time_{stage}" for stage in STAGES if sasa or stage != "sasa"] + ["error"]
+
+
+def throughput_report(rows: list, wall_time: float) -> str:
+    """
+    Summarises the time spent in every stage.
+    :param rows: The result rows of the run.
+    :param wall_time: The elapsed time of the run.
+    :return: The report, one line per stage.
+    """
+    succeeded = [row for row in rows if not row.get("error")]
+    atoms = sum(row.get("atoms", 0) for row in succeeded)
+    rate = 1 / wall_time if wall_time else 0
+    lines = [f"{len(rows)} structures ({len(rows) - len(succeeded)} failed) in {wall_time:.2f} s: "
+             f"{len(rows) * rate:.2f} structures/s, {atoms * rate:.0f} atoms/s"]
+    for stage in STAGES:
+        seconds = [row[f"time_{stage}"] for row in succeeded if f"time_{stage}" in row]
+        if seconds:
+            total = sum(seconds)
+            lines.append(f"  {stage:<9}{total:9.2f} s worker time, {len(seconds) / total if total else 0:9.2f} "
+                         f"structures/s per worker")
+    return "\n".join(lines)
+
+
+def run_batch(files: list, output: str, fmt: str = None, workers: int = None, resume: bool = True,
+              progress: bool = True, profile_output: str = None, profile: dict = None, **options) -> list:
+    """
+    Analyses many structures across a process pool, writing one row per structure to the output as soon as it
+    completes.
+    :param files: The PDB files.
+    :param output: The result file.
+    :param fmt: The output format, see sink_format.
+    :param workers: The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    :param resume: Whether files already recorded without error in the output are skipped. Otherwise the output is
+    overwritten.
+    :param progress: Whether progress is reported on stderr.
+    :param profile_output: Optional JSON lines file receiving the profile of every structure, see profiling.Profiler.
+    :param profile: Keyword arguments of profiling.Profiler, e.g. {"memory": True} to measure peak memory per stage.
+    :param options: Keyword arguments of analyze_structure.
+    :return: The rows produced by this run.
+    """
+    fmt = sink_format(output, fmt)
+    if not resume and os.path.exists(output):
+        os.remove(output)
+    done = completed_files(output, fmt) if resume else set()
+    pending = [file for file in files if input_key(file) not in done]
+    if progress and done:
+        print(f"Resuming: {len(files) - len(pending)} of {len(files)} structures already completed", file=sys.stderr)
+
+    columns = result_columns(options.get("thresholds", tuple(range(1, 11))), options.get("aa", "LYS"),
+                             options.get("sasa", True))
+    sink = SINKS[fmt](output, columns)
+    if profile_output is not None:
+        profile = profile or {}
+        profiles = open(profile_output, "a" if resume else "w")
+    else:
+        profile = profiles = None
+    rows = []
+    executor = None
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            results = (_safe_analyze(file, options, profile) for file in pending)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            futures = [executor.submit(_safe_analyze, file, options, profile) for file in pending]
+            results = (future.result() for future in as_completed(futures))
+        for row in results:
+            if profiles is not None:
+                profiles.write(json.dumps(row.pop("profile")) + "\n")
+                profiles.flush()
+            sink.write(row)
+            rows.append(row)
+            if progress:
+                status = row["error"] if row.get("error") else f"{row['atoms']} atoms"
+                print(f"[{len(rows)}/{len(pending)}] {row['structure']}: {status}", file=sys.stderr)
+    finally:
+        sink.close()
+        if profiles is not None:
+            profiles.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    if progress and rows:
+        print(throughput_report(rows, time.perf_counter() - start), file=sys.stderr)
+    return rows
+
+
+def argument_parser(description: str) -> argparse.ArgumentParser:
+    """
+    Builds the command line of the batch entry points: inputs, output and analysis options.
+    :param description: The description of the program.
+    :return: The parser, to which entry points add their own options.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("inputs", nargs="*", help="PDB files, directories or glob patterns.")
+    parser.add_argument("--file-list", help="A text file listing inputs, one per line.")
+    parser.add_argument("-o", "--output", required=True, help="The result file (.csv, .jsonl or .parquet).")
+    parser.add_argument("--format", choices=SINK_FORMATS, help="The output format, if not given by the extension.")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="The number of worker processes.")
+    parser.add_argument("--chains", nargs=2, metavar=("CHAIN_ONE", "CHAIN_TWO"),
+                        help="The chains whose interface is analysed. Defaults to the first two chains.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=list(range(1, 11)),
+                        help="The distance and SASA thresholds.")
+    parser.add_argument("--aa", default="LYS", help="The amino acid counted.")
+    parser.add_argument("--no-sasa", dest="sasa", action="store_false", help="Skip the SASA computation.")
+    parser.add_argument("--restart", dest="resume", action="store_false",
+                        help="Overwrite the output instead of skipping the structures already in it.")
+    return parser
+
+
+def parse_inputs(parser: argparse.ArgumentParser, args: argparse.Namespace) -> tuple:
+    """
+    Resolves the inputs and thresholds given on the command line.
+    :return: (files, thresholds)
+    """
+    inputs = list(args.inputs) + (read_file_list(args.file_list) if args.file_list else [])
+    if not inputs:
+        parser.error("no input given")
+    thresholds = tuple(int(threshold) if float(threshold).is_integer() else threshold for threshold in args.thresholds)
+    return expand_inputs(inputs), thresholds
+
+
+def main(argv: list = None):
+    parser = argument_parser("Batch analysis of PDB files: counts, interface contacts and SASA.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write the time and counters of every stage of every structure to a JSON lines file.")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Also measure the peak memory of every stage with tracemalloc (slower).")
+    parser.add_argument("--cprofile", action="store_true", help="Also capture every structure with cProfile.")
+    args = parser.parse_args(argv)
+
+    files, thresholds = parse_inputs(parser, args)
+    run_batch(files, args.output, args.format, args.workers, args.resume, chains=args.chains,
+              profile_output=args.profile, profile={"memory": args.profile_memory, "cprofile": args.cprofile},
+              thresholds=thresholds, aa=args.aa, sasa=args.sasa)
+
+
+if __name__ == "__main__":
+    main()
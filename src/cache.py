@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from importlib import metadata
+
+import numpy as np
+
+import pdb_parser
+from pdb_structure import Structure
+from profiling import count, timed
+
+# Version of the cache layout; entries written by another version are never read
+CACHE_VERSION = 1
+# Environment variable overriding the default cache directory
+CACHE_DIR_VARIABLE = "PDB_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdb_parser")
+DEFAULT_MAX_BYTES = 1 << 30
+# Size of the blocks read when hashing a file
+HASH_BLOCK = 1 << 20
+
+
+def file_digest(file: str) -> str:
+    """
+    Hashes the content of a file.
+    :param file: The file name.
+    :return: The hexadecimal SHA-256 digest of the content.
+    """
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sasa_version() -> str:
+    """Gives the version of freesasa, part of the cache keys of SASA results."""
+    # The freesasa module has no __version__, the installed distribution gives it
+    try:
+        return metadata.version("freesasa")
+    except metadata.PackageNotFoundError:
+        import freesasa
+        return str(getattr(freesasa, "__version__", "unknown"))
+
+
+class StructureCache:
+    """
+    Content-addressed on-disk cache of parsed structures and per-residue SASA.
+
+    Entries are .npz files named after a hash of the file content, the kind of result, its parameters and the
+    versions of the code producing it, so editing a file, changing a parameter or upgrading the parser or freesasa
+    simply misses the old entry. The total size of the entries is kept under max_bytes by evicting the least
+    recently used ones (the modification time of an entry is refreshed on every hit).
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get(CACHE_DIR_VARIABLE) or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        # Content digests of the files seen by this process, keyed by (path, size, modification time)
+        self._digests = {}
+
+    def digest(self, file: str) -> str:
+        """
+        Gives the content digest of a file, hashing it only once per process unless it changes on disk.
+        :param file: The file name.
+        :return: The hexadecimal digest.
+        """
+        stat = os.stat(file)
+        signature = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+        if signature not in self._digests:
+            self._digests[signature] = file_digest(file)
+        return self._digests[signature]
+
+    def key(self, file: str, kind: str, **params) -> str:
+        """
+        Gives the cache key of a result.
+        :param file: The input file.
+        :param kind: The kind of result, e.g. "structure" or "sasa".
+        :param params: The parameters and code versions the result depends on.
+        :return: The hexadecimal key.
+        """
+        description = json.dumps({"cache": CACHE_VERSION, "content": self.digest(file), "kind": kind, **params},
+                                 sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key: str):
+        """
+        Reads an entry and marks it as recently used. An unreadable entry (truncated or corrupt) is removed, so it is
+        recomputed and stored again instead of failing every later run.
+        :param key: The cache key.
+        :return: A dictionary of arrays, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another process meanwhile
+            return None
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return arrays
+
+    def store(self, key: str, arrays: dict) -> None:
+        """
+        Writes an entry atomically, then evicts the least recently used entries beyond max_bytes.
+        :param key: The cache key.
+        :param arrays: A dictionary of arrays.
+        """
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def entries(self) -> list:
+        """
+        Lists the entries of the cache.
+        :return: (last use, size, path) of every entry, least recently used first.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        for _, _, path in self.entries():
+            os.unlink(path)
+
+    @timed("cached_parse_pdb")
+    def parse_pdb(self, file: str, model: int = None, altloc: str = "first", hetatm: bool = True,
+                  dtype=np.float64) -> Structure:
+        """
+        Cached version of pdb_parser.parse_pdb.
+        :param file: The name of the PDB file to parse.
+        :param model: The MODEL number to read, see pdb_parser.parse_pdb.
+        :param altloc: The alternate location policy, see pdb_parser.parse_pdb.
+        :param hetatm: Whether HETATM records are kept.
+        :param dtype: The floating point type of the coordinate array.
+        :return: The parsed Structure.
+        """
+        key = self.key(file, "structure", parser=pdb_parser.PARSER_VERSION, model=model, altloc=altloc,
+                       hetatm=hetatm, dtype=np.dtype(dtype).name)
+        arrays = self.load(key)
+        count(cache_hits=arrays is not None, cache_misses=arrays is None)
+        if arrays is not None:
+            return Structure.from_arrays(arrays)
+        structure = pdb_parser.parse_pdb(file, model=model, altloc=altloc, hetatm=hetatm, dtype=dtype)
+        self.store(key, structure.arrays())
+        return structure
+
+    @timed("cached_residue_sasa")
+    def residue_sasa(self, file: str, structure: Structure = None, **settings) -> dict:
+        """
+        Cached version of sasaumure.structure_sasa.
+        :param file: The PDB file.
+        :param structure: The file parsed by parse_pdb(file, hetatm=False), if already available; otherwise the file
+        is parsed on a miss.
+        :param settings: Keyword arguments of sasaumure.sasa_parameters.
+        :return: The per-residue SASA arrays, see sasaumure.structure_sasa.
+        """
+        import sasaumure
+
+        # The number of threads does not change the result
+        params = {name: value for name, value in settings.items() if name != "threads"}
+        key = self.key(file, "sasa", freesasa=_sasa_version(), sasa=sasaumure.SASA_VERSION,
+                       parser=pdb_parser.PARSER_VERSION, **params)
+        arrays = self.load(key)
+        count(cache_hits=arrays is not None, cache_misses=arrays is None)
+        if arrays is None:
+            structure = structure if structure is not None else self.parse_pdb(file, hetatm=False)
+            arrays = sasaumure.structure_sasa(structure, sasaumure.sasa_parameters(**settings))
+            self.store(key, arrays)
+        return arrays
+
+
+_default_cache = None
+
+
+def default_cache() -> StructureCache:
+    """
+    Gives the cache shared by the whole process, in the directory named by the PDB_CACHE_DIR environment variable
+    or ~/.cache/pdb_parser.
+    :return: The cache.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = StructureCache()
+    return _default_cache
@@ -0,0 +1,477 @@
+from typing import NamedTuple
+
+import numpy as np
+
+import atom_distance as ad
+from profiling import count, timed
+
+# Number of atoms of the first set handled at once, bounding the number of candidate atom pairs held in memory
+ATOM_CHUNK = 1 << 12
+# Number of distances computed at once by the dense search
+DENSE_BLOCK = 1 << 22
+# Offsets of a cell and its 26 neighbours
+_NEIGHBOURS = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=np.int64)
+
+
+class ResidueContacts(NamedTuple):
+    """
+    Sparse residue-residue distances (a contact map in coordinate format): for every pair of residues closer than
+    the cutoff, the index of the residue in the first list, the index of the residue in the second list and their
+    minimum atom-atom distance, sorted by first then second index.
+    """
+    first: np.ndarray
+    second: np.ndarray
+    distance: np.ndarray
+    shape: tuple
+
+    def below(self, threshold: float) -> "ResidueContacts":
+        """
+        Keeps the pairs closer than a threshold.
+        :param threshold: Only distances strictly below the threshold are kept.
+        :return: The remaining residue pairs, still sorted.
+        """
+        keep = self.distance < threshold
+        return ResidueContacts(self.first[keep], self.second[keep], self.distance[keep], self.shape)
+
+    def rows(self) -> list:
+        """
+        Gives the distances grouped by residue of the first list, in the order of the second list, as returned by
+        atom_distance.residue_residue.
+        :return: A list holding one list of distances per residue of the first list.
+        """
+        bounds = self.csr()[0]
+        distances = self.distance.tolist()
+        return [distances[start:stop] for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+    def csr(self) -> tuple:
+        """
+        Gives the contact map in compressed sparse row format, rows being the residues of the first list.
+        :return: (indptr, indices, distances): the pairs of row r are indices[indptr[r]:indptr[r + 1]].
+        """
+        return np.searchsorted(self.first, np.arange(self.shape[0] + 1)), self.second, self.distance
+
+    def dense(self, fill: float = np.nan) -> np.ndarray:
+        """
+        Gives the contact map as a matrix, e.g. for visualizations.heat_mapper.
+        :param fill: The value of the pairs that are not in contact.
+        :return: A first x second array.
+        """
+        matrix = np.full(self.shape, fill, dtype=np.float64)
+        matrix[self.first, self.second] = self.distance
+        return matrix
+
+    def interface_residues(self, threshold: float = float('inf')) -> tuple:
+        """
+        Gives the residues having at least one contact closer than a threshold.
+        :param threshold: Only distances strictly below the threshold count.
+        :return: (first, second): the sorted indices of the residues of each list.
+        """
+        keep = self.distance < threshold
+        return np.unique(self.first[keep]), np.unique(self.second[keep])
+
+    def to_frame(self, residues1: list = None, residues2: list = None):
+        """
+        Gives the contacts as a pandas DataFrame, one row per residue pair.
+        :param residues1: Optional residue views of the first list, adding their chain, number and name.
+        :param residues2: Optional residue views of the second list.
+        :return: A DataFrame with columns first, second and distance, and the residue labels when given.
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame({"first": self.first, "second": self.second, "distance": self.distance})
+        for side, residues in (("first", residues1), ("second", residues2)):
+            if residues is not None:
+                indices = frame[side].to_numpy()
+                frame[f"{side}_chain"] = np.array([residue.chain for residue in residues], dtype=str)[indices]
+                frame[f"{side}_number"] = np.array([residue.number for residue in residues], dtype=str)[indices]
+                frame[f"{side}_name"] = np.array([residue["resname"] for residue in residues], dtype=str)[indices]
+        return frame
+
+    def save(self, file: str, dtype=np.float32) -> None:
+        """
+        Writes the contacts to a compressed .npz file, with the smallest index type fitting the shape.
+        :param file: The output file.
+        :param dtype: The type the distances are stored with; float32 keeps them to about a micro-angstrom.
+        """
+        index = np.min_scalar_type(max(self.shape + (1,)))
+        np.savez_compressed(file, first=self.first.astype(index), second=self.second.astype(index),
+                            distance=self.distance.astype(dtype), shape=np.asarray(self.shape, dtype=np.int64))
+
+    @classmethod
+    def load(cls, file: str) -> "ResidueContacts":
+        """
+        Reads contacts written by save.
+        :param file: The .npz file.
+        :return: The contacts, with int64 indices and float64 distances.
+        """
+        with np.load(file) as arrays:
+            return cls(arrays["first"].astype(np.int64), arrays["second"].astype(np.int64),
+                       arrays["distance"].astype(np.float64), tuple(arrays["shape"].tolist()))
+
+
+def atom_table(residues: list) -> tuple:
+    """
+    Stacks the atoms of a list of residues.
+    :param residues: Residue views of a Structure or legacy residue dictionaries.
+    :return: (coords, residue_starts): an (n_atoms, 3) float64 array and the offsets of each residue in it, of
+    length len(residues) + 1.
+    """
+    blocks = [ad.residue_coordinates(residue) for residue in residues]
+    starts = np.zeros(len(blocks) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum([len(block) for block in blocks])
+    if not blocks:
+        return np.empty((0, 3), dtype=np.float64), starts
+    return np.concatenate(blocks).astype(np.float64, copy=False), starts
+
+
+def _atom_owner(starts: np.ndarray) -> np.ndarray:
+    """Gives the index of the residue of every atom from residue offsets."""
+    return np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+
+
+def _squared_distances(coords1: np.ndarray, coords2: np.ndarray) -> np.ndarray:
+    """Squared distances between paired rows of two coordinate arrays."""
+    differences = coords1 - coords2
+    return np.einsum('ij,ij->i', differences, differences)
+
+
+def _pair_minimum(keys: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Reduces values sharing a key to their minimum.
+    :param keys: Integer keys.
+    :param values: Values, one per key.
+    :return: (unique sorted keys, minimum value of each key)
+    """
+    if len(keys) == 0:
+        return keys, values
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.minimum.reduceat(values, starts)
+
+
+def close_pairs(coords1: np.ndarray, coords2: np.ndarray, cutoff: float):
+    """
+    Finds the point pairs closer than the cutoff with a cell list: points are binned into cubic cells of side cutoff,
+    so only points of the 27 cells around a point have to be compared with it.
+    :param coords1: An (n, 3) float64 array.
+    :param coords2: An (m, 3) float64 array.
+    :param cutoff: Only pairs strictly closer than the cutoff are kept.
+    :return: A generator of (rows, columns, squared distances) chunks, rows indexing coords1 and columns coords2,
+    covering at most ATOM_CHUNK rows each.
+    """
+    if len(coords1) == 0 or len(coords2) == 0:
+        return
+    origin = np.minimum(coords1.min(axis=0), coords2.min(axis=0))
+    # Cells are shifted by one so that the neighbours of border cells never wrap around
+    cells1 = np.floor((coords1 - origin) / cutoff).astype(np.int64) + 1
+    cells2 = np.floor((coords2 - origin) / cutoff).astype(np.int64) + 1
+    dims = np.maximum(cells1.max(axis=0), cells2.max(axis=0)) + 2
+    strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+    keys1 = cells1 @ strides
+    keys2 = cells2 @ strides
+    order2 = np.argsort(keys2, kind="stable")
+    sorted_keys2 = keys2[order2]
+    neighbour_keys = _NEIGHBOURS @ strides
+    squared_cutoff = cutoff * cutoff
+
+    for chunk in range(0, len(coords1), ATOM_CHUNK):
+        atoms = np.arange(chunk, min(chunk + ATOM_CHUNK, len(coords1)))
+        rows, columns = [], []
+        for offset in neighbour_keys.tolist():
+            lower = np.searchsorted(sorted_keys2, keys1[atoms] + offset, side="left")
+            counts = np.searchsorted(sorted_keys2, keys1[atoms] + offset, side="right") - lower
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand every [lower, lower + count) range into candidate pairs
+            first_of_range = np.cumsum(counts) - counts
+            positions = np.arange(total) - np.repeat(first_of_range - lower, counts)
+            rows.append(np.repeat(atoms, counts))
+            columns.append(order2[positions])
+        if not rows:
+            continue
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        squared = _squared_distances(coords1[rows], coords2[columns])
+        close = squared < squared_cutoff
+        yield rows[close], columns[close], squared[close]
+
+
+def _cell_search(coords1: np.ndarray, owner1: np.ndarray, coords2: np.ndarray, owner2: np.ndarray,
+                 n_second: int, cutoff: float) -> tuple:
+    """
+    Finds the minimum squared distance of every residue pair having an atom pair closer than the cutoff, see
+    close_pairs.
+    :return: (residue pair keys first * n_second + second, squared distances)
+    """
+    pair_keys, pair_values = [], []
+    for rows, columns, squared in close_pairs(coords1, coords2, cutoff):
+        keys, values = _pair_minimum(owner1[rows] * n_second + owner2[columns], squared)
+        pair_keys.append(keys)
+        pair_values.append(values)
+
+    if not pair_keys:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    # Residues split across atom chunks are reduced once more
+    return _pair_minimum(np.concatenate(pair_keys), np.concatenate(pair_values))
+
+
+def _dense_search(coords1: np.ndarray, starts1: np.ndarray, coords2: np.ndarray, starts2: np.ndarray) -> np.ndarray:
+    """
+    Computes the minimum squared distance between every pair of residues, comparing every atom pair in blocks.
+    :return: An (n_first, n_second) array of squared distances.
+    """
+    n_first, n_second = len(starts1) - 1, len(starts2) - 1
+    minimum = np.full((n_first, n_second), np.inf)
+    nonempty2 = np.flatnonzero(np.diff(starts2))
+    if len(coords2) == 0:
+        return minimum
+    rows_per_block = max(1, DENSE_BLOCK // len(coords2))
+    residue = 0
+    while residue < n_first:
+        # Blocks hold whole residues of the first list
+        last = max(residue + 1, int(np.searchsorted(starts1, starts1[residue] + rows_per_block, side="right")) - 1)
+        last = min(last, n_first)
+        block = coords1[starts1[residue]:starts1[last]]
+        if len(block):
+            differences = block[:, np.newaxis, :] - coords2[np.newaxis, :, :]
+            squared = np.einsum('ijk,ijk->ij', differences, differences)
+            per_second = np.minimum.reduceat(squared, starts2[nonempty2], axis=1)
+            local = starts1[residue:last + 1] - starts1[residue]
+            nonempty1 = np.flatnonzero(np.diff(local))
+            minimum[residue + nonempty1[:, np.newaxis], nonempty2] = np.minimum.reduceat(per_second, local[nonempty1],
+                                                                                         axis=0)
+        residue = last
+    return minimum
+
+
+@timed
+def residue_contacts(residues1: list, residues2: list, cutoff: float = float('inf')) -> ResidueContacts:
+    """
+    Computes the minimum atom-atom distance of every pair of residues closer than the cutoff.
+
+    Atoms are binned once into a cell list of side cutoff and only neighbouring cells are searched, so the work
+    grows with the number of atoms rather than with the number of residue pairs. Without a finite cutoff every
+    atom pair is compared, in blocks. A residue is never compared with itself (residues comparing equal).
+
+    :param residues1: The first list of residues.
+    :param residues2: The second list of residues.
+    :param cutoff: Only distances strictly below the cutoff are kept.
+    :return: The sparse residue-residue distances.
+    """
+    coords1, starts1 = atom_table(residues1)
+    coords2, starts2 = atom_table(residues2)
+    n_first, n_second = len(residues1), len(residues2)
+
+    if cutoff <= 0 or len(coords1) == 0 or len(coords2) == 0:
+        keys, squared = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    elif np.isfinite(cutoff):
+        keys, squared = _cell_search(coords1, _atom_owner(starts1), coords2, _atom_owner(starts2), n_second, cutoff)
+    else:
+        squared = _dense_search(coords1, starts1, coords2, starts2).ravel()
+        keys = np.flatnonzero(np.isfinite(squared))
+        squared = squared[keys]
+
+    distance = np.sqrt(squared)
+    keep = distance < cutoff
+    # Identical residues are at distance 0, so only those pairs need an equality check
+    for position in np.flatnonzero(keep & (distance == 0)).tolist():
+        first, second = divmod(int(keys[position]), n_second)
+        if residues1[first] == residues2[second]:
+            keep[position] = False
+    keys, distance = keys[keep], distance[keep]
+    count(atoms=len(coords1) + len(coords2), pairs=len(keys))
+    return ResidueContacts(keys // n_second if n_second else keys, keys % n_second if n_second else keys, distance,
+                           (n_first, n_second))
+
+
+@timed
+def residue_distances(residues1: list, residues2: list, cutoff: float = float('inf'),
+                      mode: str = "atom") -> ResidueContacts:
+    """
+    Computes the residue-residue distances below a cutoff once, in the sparse form used to derive contact cards for
+    several thresholds.
+    :param residues1: The first list of residues.
+    :param residues2: The second list of residues.
+    :param cutoff: Only distances strictly below the cutoff are kept. Use the largest threshold of interest.
+    :param mode: "atom" for minimum atom-atom distances, "centroid" for centroid-centroid distances.
+    :return: The sparse residue-residue distances.
+    """
+    if mode == "atom":
+        return residue_contacts(residues1, residues2, cutoff)
+    if mode != "centroid":
+        raise ValueError("Mode must be 'atom' or 'centroid'.")
+    distances = ad.centroid_distances(residues1, residues2)
+    first, second = np.nonzero(distances < cutoff)
+    return ResidueContacts(first, second, distances[first, second], distances.shape)
+
+
+@timed
+def contact_cards(contacts: ResidueContacts, thresholds: list) -> list:
+    """
+    Derives the contact lists of several thresholds from distances computed once up to the largest one.
+    :param contacts: The sparse residue-residue distances, see residue_distances.
+    :param thresholds: The distance thresholds.
+    :return: One contact list per threshold, each as returned by atom_distance.residue_residue.
+    """
+    return [contacts.below(threshold).rows() for threshold in thresholds]
+
+
+def interface_residue_counts(contacts: ResidueContacts, thresholds: list) -> list:
+    """
+    Counts the residues having a contact below each threshold, from the closest contact of every residue, sorted
+    once. A residue present in both lists is counted once per list.
+    :param contacts: The sparse residue-residue distances, see residue_distances.
+    :param thresholds: The distance thresholds.
+    :return: The number of interface residues for every threshold.
+    """
+    first = _pair_minimum(contacts.first, contacts.distance)[1]
+    second = _pair_minimum(contacts.second, contacts.distance)[1]
+    closest = np.sort(np.concatenate((first, second)))
+    return np.searchsorted(closest, np.asarray(thresholds, dtype=np.float64), side="left").tolist()
+
+
+def interface_counts(contacts: ResidueContacts, thresholds: list) -> list:
+    """
+    Counts the distinct contact distances below each threshold (the figure computed by
+    main.calculate_interface_residues from contact cards) from one sorted array of the distinct distances.
+    :param contacts: The sparse residue-residue distances, see residue_distances.
+    :param thresholds: The distance thresholds.
+    :return: The count for every threshold.
+    """
+    distinct = np.unique(contacts.distance)
+    return np.searchsorted(distinct, np.asarray(thresholds, dtype=np.float64), side="left").tolist()
+
+
+class ChainInterface(NamedTuple):
+    """
+    The interface of two chains: the residue pairs closer than the cutoff, indexed by position in each chain as
+    residue_distances(structure.residues(chain1), structure.residues(chain2), cutoff, mode) indexes them, the
+    number of atom pairs closer than the cutoff (residue pairs in centroid mode) and the minimum distance.
+    """
+    chain1: str
+    chain2: str
+    contacts: ResidueContacts
+    atom_contacts: int
+    min_distance: float
+
+    def interface_residues(self, threshold: float = float('inf')) -> tuple:
+        """
+        Gives the residues of each chain having a contact closer than a threshold.
+        :param threshold: Only distances strictly below the threshold count.
+        :return: (first, second): the sorted positions of the residues in each chain.
+        """
+        return self.contacts.interface_residues(threshold)
+
+
+def _chain_boxes(points: np.ndarray, point_starts: np.ndarray) -> tuple:
+    """Gives the lower and upper corners of the bounding box of the points of every chain, NaN for empty chains."""
+    lower = np.full((len(point_starts) - 1, 3), np.nan)
+    upper = np.full((len(point_starts) - 1, 3), np.nan)
+    nonempty = np.flatnonzero(np.diff(point_starts))
+    if len(nonempty):
+        lower[nonempty] = np.minimum.reduceat(points, point_starts[nonempty], axis=0)
+        upper[nonempty] = np.maximum.reduceat(points, point_starts[nonempty], axis=0)
+    return lower, upper
+
+
+def _box_gaps(points: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """Gives the squared distance of every point to every box, as a (points, boxes) array."""
+    gaps = np.maximum(lower[np.newaxis] - points[:, np.newaxis], 0) + np.maximum(points[:, np.newaxis]
+                                                                                 - upper[np.newaxis], 0)
+    return np.einsum('ijk,ijk->ij', gaps, gaps)
+
+
+@timed
+def chain_interfaces(structure, cutoff: float = 8.0, mode: str = "atom", chains: list = None) -> dict:
+    """
+    Finds the interfaces of every pair of chains of a structure in one pass.
+
+    The bounding boxes of every chain are computed once and chain pairs whose boxes are farther apart than the
+    cutoff are pruned. Every chain is then searched with one cell list (see close_pairs) against all the later
+    chains it may touch, each side keeping only the atoms closer than the cutoff to the box of the other side (the
+    core of large chains is never binned), so the work grows with the number of atoms near an interface rather than
+    with the number of chain pairs.
+
+    :param structure: The Structure.
+    :param cutoff: Only distances strictly below the cutoff are contacts.
+    :param mode: "atom" for minimum atom-atom distances, "centroid" for centroid-centroid distances.
+    :param chains: The chain identifiers considered. Defaults to every chain.
+    :return: A dictionary mapping (chain1, chain2) pairs, in chain order, to their ChainInterface, for the chain
+    pairs having at least one contact.
+    """
+    if mode not in ["atom", "centroid"]:
+        raise ValueError("Mode must be 'atom' or 'centroid'.")
+    if not np.isfinite(cutoff) or cutoff <= 0:
+        raise ValueError("The cutoff must be a positive finite distance.")
+    residue_starts = structure.residue_starts
+    chain_starts = structure.chain_starts
+    n_residues, n_chains = structure.n_residues, structure.n_chains
+    coords = np.asarray(structure.coords, dtype=np.float64)
+    if mode == "atom":
+        points, point_starts = coords, residue_starts[chain_starts]
+        residue_of_point = _atom_owner(residue_starts)
+    else:
+        points = np.add.reduceat(coords, residue_starts[:-1], axis=0) / np.diff(residue_starts)[:, np.newaxis] \
+            if n_residues else np.empty((0, 3))
+        point_starts, residue_of_point = chain_starts, np.arange(n_residues)
+    chain_of_residue = np.repeat(np.arange(n_chains), np.diff(chain_starts))
+    chain_of_point = chain_of_residue[residue_of_point]
+
+    # Chain pairs whose boxes are closer than the cutoff
+    lower, upper = _chain_boxes(points, point_starts)
+    gaps = np.maximum(lower[:, np.newaxis] - upper[np.newaxis], 0) + np.maximum(lower[np.newaxis]
+                                                                                - upper[:, np.newaxis], 0)
+    candidate = np.einsum('ijk,ijk->ij', gaps, gaps) < cutoff * cutoff
+    np.fill_diagonal(candidate, False)
+    if chains is not None:
+        selected = np.zeros(n_chains, dtype=bool)
+        selected[[structure.chain_index(chain) for chain in chains]] = True
+        candidate &= selected[:, np.newaxis] & selected[np.newaxis]
+
+    # Every chain against the later chains it may touch, each side reduced to the points close enough to the box of
+    # the other, so that a pair of atoms is compared once and pairs within a chain never are
+    pair_keys, pair_values, atom_contacts = [], [], np.zeros(n_chains * n_chains, dtype=np.int64)
+    squared_cutoff = cutoff * cutoff
+    for chain in range(n_chains):
+        partners = np.flatnonzero(candidate[chain, chain + 1:]) + chain + 1
+        if len(partners) == 0:
+            continue
+        rows = np.arange(point_starts[chain], point_starts[chain + 1])
+        rows = np.concatenate([block[(_box_gaps(points[block], lower[partners], upper[partners])
+                                      < squared_cutoff).any(axis=1)]
+                               for block in np.array_split(rows, -(-len(rows) // ATOM_CHUNK))])
+        columns = np.concatenate([np.arange(point_starts[partner], point_starts[partner + 1]) for partner in partners])
+        columns = columns[_box_gaps(points[columns], lower[[chain]], upper[[chain]])[:, 0] < squared_cutoff]
+        for found_rows, found_columns, squared in close_pairs(points[rows], points[columns], cutoff):
+            found_rows, found_columns = rows[found_rows], columns[found_columns]
+            atom_contacts[chain * n_chains:(chain + 1) * n_chains] += np.bincount(chain_of_point[found_columns],
+                                                                                  minlength=n_chains)
+            keys, values = _pair_minimum(residue_of_point[found_rows] * n_residues
+                                         + residue_of_point[found_columns], squared)
+            pair_keys.append(keys)
+            pair_values.append(values)
+    keys, squared = _pair_minimum(np.concatenate(pair_keys), np.concatenate(pair_values)) if pair_keys \
+        else (np.empty(0, dtype=np.int64), np.empty(0))
+
+    # Split the residue pairs by chain pair, keeping them sorted by first then second residue
+    first, second = keys // n_residues, keys % n_residues
+    chain1, chain2 = chain_of_residue[first], chain_of_residue[second]
+    order = np.lexsort((keys, chain1 * n_chains + chain2))
+    first, second, distance = first[order], second[order], np.sqrt(squared[order])
+    chain_pair = (chain1 * n_chains + chain2)[order]
+    bounds = np.concatenate(([0], np.flatnonzero(chain_pair[1:] != chain_pair[:-1]) + 1, [len(chain_pair)])) \
+        if len(chain_pair) else np.zeros(1, dtype=np.int64)
+    chain_ids = structure.chain_ids.tolist()
+    lengths = np.diff(chain_starts)
+    interfaces = {}
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        one, two = divmod(int(chain_pair[start]), n_chains)
+        contacts = ResidueContacts(first[start:stop] - chain_starts[one], second[start:stop] - chain_starts[two],
+                                   distance[start:stop], (int(lengths[one]), int(lengths[two])))
+        interfaces[chain_ids[one], chain_ids[two]] = ChainInterface(
+            chain_ids[one], chain_ids[two], contacts,
+            int(atom_contacts[chain_pair[start]]) if mode == "atom" else stop - start,
+            float(distance[start:stop].min()))
+    count(points=len(points), chain_pairs=int(candidate.sum()) // 2, interfaces=len(interfaces))
+    return interfaces
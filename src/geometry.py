@@ -0,0 +1,162 @@
+import numpy as np
+
+import atom_distance
+from pdb_structure import ResidueView, Structure
+
+# Atoms of the peptide backbone, excluded from side chains
+BACKBONE_ATOMS = ("N", "CA", "C", "O", "OXT")
+# Standard atomic weights of the elements found in biomolecular structures
+ATOMIC_MASSES = {
+    "H": 1.008, "D": 2.014, "C": 12.011, "N": 14.007, "O": 15.999, "P": 30.974, "S": 32.06, "F": 18.998,
+    "CL": 35.45, "BR": 79.904, "I": 126.904, "SE": 78.971, "NA": 22.990, "MG": 24.305, "K": 39.098,
+    "CA": 40.078, "MN": 54.938, "FE": 55.845, "CO": 58.933, "NI": 58.693, "CU": 63.546, "ZN": 65.38,
+}
+# Number of rows of the first centroid set compared at once by centroid_distances
+CENTROID_CHUNK = 1 << 10
+
+
+def _segments(structure: Structure) -> tuple:
+    """Gives the first atom of every residue and the number of atoms of every residue."""
+    return structure.residue_starts[:-1], np.diff(structure.residue_starts)
+
+
+def _segment_sum(values: np.ndarray, structure: Structure) -> np.ndarray:
+    """Sums per-atom values (or rows of values) over every residue."""
+    if structure.n_residues == 0:
+        return np.zeros((0,) + values.shape[1:], dtype=values.dtype)
+    return np.add.reduceat(values, structure.residue_starts[:-1], axis=0)
+
+
+def atom_elements(structure: Structure) -> np.ndarray:
+    """
+    Gives the element of every atom, from the element column or, where it is blank, from the atom name.
+    :param structure: The structure.
+    :return: Upper case element symbols.
+    """
+    elements = np.char.upper(np.char.strip(structure.element))
+    blank = elements == ""
+    if blank.any():
+        names = np.char.lstrip(structure.atom_name[blank], "0123456789")
+        elements[blank] = np.char.upper(np.char.ljust(names, 1).astype("<U1"))
+    return elements
+
+
+def atom_masses(structure: Structure) -> np.ndarray:
+    """
+    Gives the atomic mass of every atom; unknown elements weigh as carbon.
+    :param structure: The structure.
+    :return: The masses.
+    """
+    elements = atom_elements(structure)
+    symbols, inverse = np.unique(elements, return_inverse=True)
+    table = np.array([ATOMIC_MASSES.get(symbol, ATOMIC_MASSES["C"]) for symbol in symbols.tolist()])
+    return table[inverse.reshape(-1)] if len(symbols) else np.empty(0)
+
+
+def residue_centroids(structure: Structure) -> np.ndarray:
+    """
+    Computes the centroid (geometric center) of every residue with one segment reduction over the coordinate array.
+    :param structure: The structure.
+    :return: An (n_residues, 3) array.
+    """
+    _, counts = _segments(structure)
+    return _segment_sum(structure.coords.astype(np.float64, copy=False), structure) / counts[:, np.newaxis]
+
+
+def residue_centres_of_mass(structure: Structure) -> np.ndarray:
+    """
+    Computes the mass-weighted centre of every residue.
+    :param structure: The structure.
+    :return: An (n_residues, 3) array.
+    """
+    masses = atom_masses(structure)
+    weighted = _segment_sum(structure.coords * masses[:, np.newaxis], structure)
+    return weighted / _segment_sum(masses, structure)[:, np.newaxis]
+
+
+def side_chain_centroids(structure: Structure) -> np.ndarray:
+    """
+    Computes the centroid of the side chain of every residue, i.e. of its atoms outside BACKBONE_ATOMS. Residues
+    without side chain atoms (glycine) use their CA atom, or their centroid when they have no CA either.
+    :param structure: The structure.
+    :return: An (n_residues, 3) array.
+    """
+    side = ~np.isin(np.char.strip(structure.atom_name), BACKBONE_ATOMS)
+    counts = _segment_sum(side.astype(np.int64), structure)
+    sums = _segment_sum(np.where(side[:, np.newaxis], structure.coords, 0.0), structure)
+    centroids = sums / np.maximum(counts, 1)[:, np.newaxis]
+    empty = counts == 0
+    if empty.any():
+        alpha = np.char.strip(structure.atom_name) == "CA"
+        alpha_counts = _segment_sum(alpha.astype(np.int64), structure)
+        alpha_coords = _segment_sum(np.where(alpha[:, np.newaxis], structure.coords, 0.0), structure)
+        alpha_coords /= np.maximum(alpha_counts, 1)[:, np.newaxis]
+        fallback = np.where((alpha_counts > 0)[:, np.newaxis], alpha_coords, residue_centroids(structure))
+        centroids[empty] = fallback[empty]
+    return centroids
+
+
+def _centred_squares(structure: Structure, centres: np.ndarray) -> np.ndarray:
+    """Gives the squared distance of every atom to the centre of its residue."""
+    differences = structure.coords - np.repeat(centres, np.diff(structure.residue_starts), axis=0)
+    return np.einsum('ij,ij->i', differences, differences)
+
+
+def radius_of_gyration(structure: Structure, mass_weighted: bool = False) -> np.ndarray:
+    """
+    Computes the radius of gyration of every residue.
+    :param structure: The structure.
+    :param mass_weighted: Whether atoms are weighted by their mass (around the centre of mass).
+    :return: The radii.
+    """
+    if mass_weighted:
+        masses = atom_masses(structure)
+        squares = _centred_squares(structure, residue_centres_of_mass(structure)) * masses
+        return np.sqrt(_segment_sum(squares, structure) / _segment_sum(masses, structure))
+    _, counts = _segments(structure)
+    return np.sqrt(_segment_sum(_centred_squares(structure, residue_centroids(structure)), structure) / counts)
+
+
+def bounding_spheres(structure: Structure) -> tuple:
+    """
+    Computes a bounding sphere of every residue, centred on its centroid. The sphere is not the smallest enclosing
+    one, but is cheap and tight enough to prune residue pairs before comparing atoms.
+    :param structure: The structure.
+    :return: (centres, radii): an (n_residues, 3) array and the radii.
+    """
+    centres = residue_centroids(structure)
+    if structure.n_residues == 0:
+        return centres, np.empty(0)
+    squares = _centred_squares(structure, centres)
+    return centres, np.sqrt(np.maximum.reduceat(squares, structure.residue_starts[:-1]))
+
+
+def centroid_distances(centroids1: np.ndarray, centroids2: np.ndarray, chunk: int = CENTROID_CHUNK) -> np.ndarray:
+    """
+    Computes the distances between two sets of points (e.g. residue centroids) in row blocks, so that only a
+    chunk x n2 x 3 difference tensor exists at any time instead of the full n1 x n2 x 3 one. The values are the same
+    as those of np.linalg.norm over the full tensor.
+    :param centroids1: An (n1, 3) array.
+    :param centroids2: An (n2, 3) array.
+    :param chunk: The number of rows of the first set handled at once.
+    :return: The n1 x n2 distance matrix.
+    """
+    distances = np.empty((len(centroids1), len(centroids2)))
+    for start in range(0, len(centroids1), chunk):
+        differences = centroids1[start:start + chunk, np.newaxis, :] - centroids2[np.newaxis, :, :]
+        distances[start:start + chunk] = np.linalg.norm(differences, axis=2)
+    return distances
+
+
+def residues_centroids(residues: list) -> np.ndarray:
+    """
+    Gives the centroids of a list of residues. Residue views of one structure are computed together with one
+    segment reduction; other residues one by one.
+    :param residues: Residue views or legacy residue dictionaries.
+    :return: An (n, 3) array.
+    """
+    structures = {id(residue.structure): residue.structure for residue in residues if isinstance(residue, ResidueView)}
+    if len(structures) == 1 and all(isinstance(residue, ResidueView) for residue in residues):
+        structure = next(iter(structures.values()))
+        return residue_centroids(structure)[[residue.index for residue in residues]]
+    return np.array([atom_distance.centroid_searcher(residue) for residue in residues]).reshape(-1, 3)
@@ -3,23 +3,20 @@ from pprint import pprint
 import pdb_analyzer
 import pdb_parser
 import atom_distance as ad
+import contact_engine
+import profiling
+from cache import default_cache
 import visualizations as vis
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-import seaborn as sns
-import freesasa
-import pickle
 
-from src.sasaumure import compute_sasa
+# pandas, seaborn and freesasa (through sasaumure) are imported by the stages using them, see the startup check of
+# benchmarks/bench_startup.py
 
 
-def get_contact_card(residues_one, residues_two, mode):
-    border_residues = []
-    for threshold in range(1, 11):
-        contact_card_chains = ad.residue_residue(residues_one, residues_two, threshold=threshold, mode=mode)
-        border_residues.append(contact_card_chains)
-    return border_residues
+def get_contact_card(residues_one, residues_two, mode, thresholds=range(1, 11)):
+    # Distances are computed once up to the largest threshold and filtered for the others
+    contacts = contact_engine.residue_distances(residues_one, residues_two, max(thresholds), mode)
+    return contact_engine.contact_cards(contacts, thresholds)
 
 
 def calculate_interface_residues(contact_data):
@@ -32,38 +29,50 @@ def calculate_interface_residues(contact_data):
     return unique_residues_counts
 
 
+def interface_table(thresholds, contact_atom, contact_centroid, sasa_values):
+    """
+    Builds the per-threshold interface table: interface residues counted in atom, centroid and SASA mode, and the
+    difference between the SASA and centroid counts, each column computed for all thresholds at once.
+    :param thresholds: The distance and SASA thresholds.
+    :param contact_atom: The sparse atom-mode distances, see contact_engine.residue_distances.
+    :param contact_centroid: The sparse centroid-mode distances.
+    :param sasa_values: The SASA of every residue.
+    :return: A DataFrame with one row per threshold.
+    """
+    import pandas as pd
+    from src.sasaumure import sasa_threshold_counts
+
+    thresholds = list(thresholds)
+    atom = np.asarray(contact_engine.interface_residue_counts(contact_atom, thresholds))
+    center = np.asarray(contact_engine.interface_residue_counts(contact_centroid, thresholds))
+    sasa = sasa_threshold_counts(sasa_values, thresholds)["all"]
+    return pd.DataFrame({
+        'Threshold': thresholds,
+        'Atom_Mode': atom,
+        'Centroid_Mode': center,
+        'SASA_Mode': sasa,
+        'SASA - Centroid': sasa - center
+    })
+
+
 def main():
-    pickle_file = '../data/1brs.pkl'
+    from src.sasaumure import compute_sasa
+
     # Parsing of the pdb file
     pdb_file = "../data/1brs.pdb"
     pdb_file_two = "../data/1FFW_AB_c.pdb"
-    compute_sasa(pdb_file)
-
-    with open(pickle_file, 'rb') as file:
-        protein_structure = pickle.load(file)
+    # Parsed structure annotated with SASA, both read from the cache on repeated runs
+    protein_structure = compute_sasa(pdb_file)
 
     # Load the PDB data using your custom parser
-    pdb_data = pdb_parser.pdb_parser_optimized(pdb_file)
-
-    # Initialize a dictionary to hold the count of residues below each threshold
-    data = {key: 0 for key in range(1, 11)}
-
-    # Iterate over each threshold
-    for threshold in data.keys():
-        # Iterate over each chain and residue in the protein structure
-        for chain in pdb_data["chains"]:
-            for residue in pdb_data[chain]:
-                # Access the SASA value for the current residue
-                sasa = protein_structure[chain][residue]['SASA']
-                # Increment the count for the current threshold if the SASA is below the threshold
-                if sasa < threshold:
-                    data[threshold] += 1
-    sasa = data.values()
+    pdb_data = protein_structure
+
+    # SASA of every residue, counted below each threshold in one pass by interface_table
+    sasa_values = protein_structure.residue_data['SASA']
     # Parsing of the pdb file
 
-    pdb_data = pdb_parser.pdb_parser_optimized(pdb_file)
     # print(f"{calculate_sasa(pdb_file) = }")
-    pdf_data_2 = pdb_parser.pdb_parser_optimized(pdb_file_two)
+    pdf_data_2 = default_cache().parse_pdb(pdb_file_two, hetatm=False)
     # pprint(pdb_data)
     name1 = pdb_file.split("/")[-1].split(".")[0]
     name2 = pdb_file_two.split("/")[-1].split(".")[0]
@@ -86,40 +95,32 @@ def main():
     residue_1 = pdb_data["A"]["8"]
     residue_2 = pdb_data["A"]["12"]
 
-    # Manipulation of the pdb file
-    print(f"shortest: {ad.calculate_distance("atom", residue_1, residue_2)}")
-    print(f"centroid: {ad.calculate_distance("centroid", residue_1, residue_2)}")
+    # Manipulation of the pdb file, repeated residue pairs answered from the cache of the distance service
+    distances = ad.DistanceService(pdb_data)
+    print(f"shortest: {distances.distance("atom", residue_1, residue_2)}")
+    print(f"centroid: {distances.distance("centroid", residue_1, residue_2)}")
     # Inter chain contact card
     chain_one_residues = pdb_analyzer.residues_in_chain(pdb_data, "A")
     chain_two_residues = pdb_analyzer.residues_in_chain(pdb_data, "D")
 
-    # Calculate contacts
-    contact_atom = get_contact_card(chain_one_residues, chain_two_residues, mode="atom")
-    contact_centroid = get_contact_card(chain_one_residues, chain_two_residues, mode="centroid")
+    # Calculate contacts once up to the largest threshold
+    thresholds = list(range(1, 11))
+    contact_atom = contact_engine.residue_distances(chain_one_residues, chain_two_residues, max(thresholds), "atom")
+    contact_centroid = contact_engine.residue_distances(chain_one_residues, chain_two_residues, max(thresholds),
+                                                        "centroid")
+
+    # Interfaces of every chain pair, found in one pass over the structure
+    for (chain_one, chain_two), interface in contact_engine.chain_interfaces(pdb_data, max(thresholds)).items():
+        first, second = interface.interface_residues()
+        print(f"Interface {chain_one}-{chain_two}: {len(first)} + {len(second)} residues, "
+              f"{interface.atom_contacts} atom contacts, minimum distance {interface.min_distance:.2f}")
 
     # Prepare DataFrame
-    center = calculate_interface_residues(contact_centroid)
-    atom = calculate_interface_residues(contact_atom)
-    diff = np.array(list(sasa)) - np.array(center)
-    data = {
-        'Threshold': list(range(1, 11)),
-        'Atom_Mode': calculate_interface_residues(contact_atom),
-        'Centroid_Mode': calculate_interface_residues(contact_centroid),
-        'SASA_Mode': sasa,
-        'SASA - Centroid': diff
-    }
-    df = pd.DataFrame(data)
+    df = interface_table(thresholds, contact_atom, contact_centroid, sasa_values)
 
     vis.plot_interface_residues(df, "threshold.png")
-    thresholds = list(range(1, 11))
     # Prepare the data for plotting
-    data = {
-        'Threshold': thresholds,
-        'Difference': diff
-    }
-
-    # Convert the data to a DataFrame
-    df = pd.DataFrame(data)
+    df = df[['Threshold']].assign(Difference=df['SASA - Centroid'])
     vis.plot_interface_difference(df, "Difference_Threshold.png")
 
     # vis.density_mapper(contact_atom_chains, "atom")
@@ -134,4 +135,15 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Analysis of the example structures.")
+    parser.add_argument("--profile", metavar="FILE", help="Write the time and counters of every stage to a JSON file.")
+    parser.add_argument("--profile-memory", action="store_true", help="Also measure the peak memory of every stage.")
+    parser.add_argument("--cprofile", action="store_true", help="Also capture the run with cProfile.")
+    args = parser.parse_args()
+    if args.profile:
+        with profiling.Profiler("main", memory=args.profile_memory, cprofile=args.cprofile) as profiler:
+            main()
+        profiler.to_json(args.profile)
+        print(profiler.report())
+    else:
+        main()
@@ -1,5 +1,7 @@
 from pprint import pprint
 
+from pdb_structure import Structure, structure_from_dict
+
 
 def chain_count(pdb_data: dict) -> int:
     """
@@ -16,6 +18,8 @@ def residue_count(pdb_data: dict) -> int:
     :param pdb_data: The dictionary holding the pdb data
     :return: The number of residues
     """
+    if isinstance(pdb_data, Structure):
+        return pdb_data.n_residues
     total = 0
     for chain in pdb_data["chains"]:
         total += len(pdb_data[chain])
@@ -29,6 +33,8 @@ def total_aa(pdb_data: dict, aa: str) -> list:
     :param aa: The aa to count
     :return: [aa, total]
     """
+    if isinstance(pdb_data, Structure):
+        return [aa, pdb_data.index.count(aa)]
     total = 0
     for chain in pdb_data["chains"]:
         for residue in pdb_data[chain]:
@@ -44,6 +50,8 @@ def total_aa_per_chain(pdb_data: dict, aa: str) -> dict:
     :param aa: The aa to count
     :return: dictionary with the number of aa per chain
     """
+    if isinstance(pdb_data, Structure):
+        return {aa: {chain: pdb_data.index.count(aa, chain) for chain in pdb_data["chains"]}}
     response = {aa: {}}
     for chain in pdb_data["chains"]:
         total = 0
@@ -64,6 +72,8 @@ def residue_list(pdb_data: dict) -> list:
 
     :return: A list of dictionaries. Each dictionary represents a residue in a chain.
     """
+    if isinstance(pdb_data, Structure):
+        return pdb_data.residues()
     response = []
     for chain in pdb_data["chains"]:
         for residue in pdb_data[chain]:
@@ -82,7 +92,39 @@ def residues_in_chain(pdb_data: dict, chain: str) -> list:
 
     :return: A list of dictionaries. Each dictionary represents a residue in the given chain.
     """
+    if isinstance(pdb_data, Structure):
+        return pdb_data.residues(chain)
     response = []
     for residue in pdb_data[chain]:
         response.append(pdb_data[chain][residue])
     return response
+
+
+def aa_counts_per_chain(pdb_data: dict) -> dict:
+    """
+    Gives the number of residues of every type in every chain, in one pass
+    :param pdb_data: The dictionary holding the pdb data
+    :return: {chain: {resname: count}}
+    """
+    if isinstance(pdb_data, Structure):
+        return pdb_data.index.counts_per_chain()
+    response = {}
+    for chain in pdb_data["chains"]:
+        counts = response.setdefault(chain, {})
+        for residue in pdb_data[chain]:
+            resname = pdb_data[chain][residue]["resname"]
+            counts[resname] = counts.get(resname, 0) + 1
+    return response
+
+
+def select_residues(pdb_data: dict, expression: str) -> list:
+    """
+    Gives the residues matching a selection expression such as "chain A and resname LYS"
+    (see pdb_index.parse_selection for the syntax)
+    :param pdb_data: The parsed structure
+    :param expression: The selection expression
+    :return: A list of residue views
+    """
+    if not isinstance(pdb_data, Structure):
+        pdb_data = structure_from_dict(pdb_data)
+    return pdb_data.select(expression)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+import pdb_parser
+from pdb_structure import Structure, structure_from_dict
+
+# File layout: MAGIC, the byte length of the JSON header as a little-endian uint64, the header, then every array at
+# an ALIGNMENT-byte boundary. The header gives the dtype, shape and offset of each array.
+MAGIC = b"PDBBIN\x00\x01"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+EXTENSION = ".pdbbin"
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_structure(structure: Structure, file: str) -> None:
+    """
+    Writes a structure in the binary format: its coordinate block, fixed-width string columns, residue and chain
+    offset tables and per-residue annotations (e.g. SASA), each stored as a raw array that read_structure can map
+    into memory.
+    :param structure: The structure to write.
+    :param file: The name of the output file.
+    """
+    arrays = {key: np.ascontiguousarray(value) for key, value in structure.arrays().items() if key != "name"}
+    entries, offset = {}, 0
+    for key, array in arrays.items():
+        entries[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = {"version": FORMAT_VERSION, "name": structure.name, "arrays": entries}
+    encoded = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(encoded))
+
+    temporary = file + ".partial"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        for key, array in arrays.items():
+            f.seek(data_start + entries[key]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary, file)
+
+
+def read_header(file: str) -> tuple:
+    """
+    Reads the header of a binary structure file.
+    :param file: The name of the file.
+    :return: (header, data_start): the decoded header and the offset of the first array in the file.
+    """
+    with open(file, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file} is not a binary structure file.")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    if header["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary structure version {header['version']} in {file}.")
+    return header, _aligned(len(MAGIC) + 8 + length)
+
+
+def read_structure(file: str, mmap: bool = True) -> Structure:
+    """
+    Opens a binary structure file.
+
+    With mmap, the arrays of the structure are views of a copy-on-write numpy.memmap of the file: opening costs
+    only the header, and reading a chain or residue range (e.g. structure.chain_structure("A")) only loads the
+    pages holding it. Annotations written to the structure stay in memory and never change the file.
+
+    :param file: The name of the file.
+    :param mmap: Whether the file is memory-mapped instead of read at once.
+    :return: The structure.
+    """
+    header, data_start = read_header(file)
+    if mmap:
+        raw = np.memmap(file, dtype=np.uint8, mode="c")
+    else:
+        raw = np.fromfile(file, dtype=np.uint8)
+    arrays = {"name": header["name"]}
+    for key, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        start = data_start + entry["offset"]
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[key] = raw[start:start + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+    return Structure.from_arrays(arrays)
+
+
+def read_chains(file: str, chains: list) -> list:
+    """
+    Reads some chains of a binary structure file, touching only their part of the file.
+    :param file: The name of the file.
+    :param chains: The chain identifiers.
+    :return: One structure per chain, with its arrays copied into memory.
+    """
+    structure = read_structure(file)
+    selected = []
+    for chain in chains:
+        part = structure.chain_structure(chain)
+        selected.append(Structure.from_arrays({key: np.array(value) for key, value in part.arrays().items()}))
+    return selected
+
+
+def load_any(file: str, hetatm: bool = False) -> Structure:
+    """
+    Loads a structure from a PDB file, a pickle (a Structure or a nested dictionary of the original parser) or a
+    binary structure file.
+    :param file: The name of the file.
+    :param hetatm: Whether the HETATM records of a PDB file are kept. They are not by default, as in the pickles
+    written by sasaumure.compute_sasa.
+    :return: The structure.
+    """
+    name = os.path.basename(file).split(".")[0]
+    with open(file, "rb") as f:
+        start = f.read(len(MAGIC))
+    if start == MAGIC:
+        return read_structure(file)
+    if file.endswith(".pkl") or start[:1] == b"\x80":
+        with open(file, "rb") as f:
+            data = pickle.load(f)
+        return data if isinstance(data, Structure) else structure_from_dict(data, name)
+    return pdb_parser.parse_pdb(file, hetatm=hetatm)
+
+
+def convert(source: str, destination: str = None, hetatm: bool = False) -> str:
+    """
+    Converts a PDB or pickle file to the binary format.
+    :param source: The input file, see load_any.
+    :param destination: The output file. Defaults to the input name with the .pdbbin extension.
+    :param hetatm: Whether the HETATM records of a PDB file are kept.
+    :return: The name of the output file.
+    """
+    destination = destination or os.path.splitext(source)[0] + EXTENSION
+    write_structure(load_any(source, hetatm), destination)
+    return destination
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Convert PDB and pickle files to the memory-mappable binary format.")
+    parser.add_argument("files", nargs="+", help="PDB or pickle files.")
+    parser.add_argument("-d", "--directory", help="Output directory. Defaults to the directory of each input.")
+    parser.add_argument("--hetatm", action="store_true", help="Keep the HETATM records of PDB files (waters, ligands).")
+    args = parser.parse_args(argv)
+    for source in args.files:
+        destination = None
+        if args.directory:
+            os.makedirs(args.directory, exist_ok=True)
+            destination = os.path.join(args.directory, os.path.splitext(os.path.basename(source))[0] + EXTENSION)
+        print(f"{source} -> {convert(source, destination, args.hetatm)}")
+
+
+if __name__ == "__main__":
+    main()
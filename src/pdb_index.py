@@ -0,0 +1,208 @@
+import re
+
+import numpy as np
+
+# Keywords of selection expressions and the residue property they test
+SELECTION_KEYWORDS = ("chain", "resname", "resid", "hetero", "all")
+_RESID_ALIASES = {"resseq": "resid", "resnum": "resid", "resi": "resid"}
+_OPERATORS = ("and", "or", "not")
+_TOKEN = re.compile(r"\s*(\(|\)|[^\s()]+)")
+_RESID_RANGE = re.compile(r"^(-?\d+)(?:[-:](-?\d+))?$")
+
+
+class StructureIndex:
+    """
+    Precomputed lookup tables of a Structure, built once and shared by every query.
+
+    Residue names are encoded as codes into the sorted table ``residue_types``, with the residues of every type
+    listed in ``type_residues[type_starts[t]:type_starts[t + 1]]``. ``type_counts[c, t]`` holds the number of
+    residues of type t in chain c, and ``residue_seq`` the integer part of every residue number.
+    """
+
+    def __init__(self, structure):
+        self.structure = structure
+        self.residue_types, self.residue_type = np.unique(structure.residue_name, return_inverse=True)
+        self.residue_type = self.residue_type.reshape(-1)
+        self.type_residues = np.argsort(self.residue_type, kind="stable")
+        self.type_starts = np.searchsorted(self.residue_type[self.type_residues],
+                                           np.arange(len(self.residue_types) + 1))
+        chain_of_residue = np.repeat(np.arange(structure.n_chains), np.diff(structure.chain_starts))
+        self.type_counts = np.bincount(chain_of_residue * len(self.residue_types) + self.residue_type,
+                                       minlength=structure.n_chains * len(self.residue_types)
+                                       ).reshape(structure.n_chains, len(self.residue_types))
+        self.chain_ranges = {chain: range(int(start), int(stop)) for chain, start, stop in
+                             zip(structure.chain_ids.tolist(), structure.chain_starts[:-1], structure.chain_starts[1:])}
+        self.residue_seq = _residue_seq(structure.residue_number)
+        self.residue_hetero = np.logical_or.reduceat(structure.hetero, structure.residue_starts[:-1]) \
+            if structure.n_atoms else np.zeros(structure.n_residues, dtype=bool)
+
+    def type_code(self, resname: str) -> int:
+        """
+        Gives the code of a residue name
+        :param resname: The residue name
+        :return: The code, or -1 if no residue has this name
+        """
+        position = int(np.searchsorted(self.residue_types, resname))
+        if position < len(self.residue_types) and self.residue_types[position] == resname:
+            return position
+        return -1
+
+    def residues_of_type(self, resname: str) -> np.ndarray:
+        """
+        Gives the residues with a given name
+        :param resname: The residue name
+        :return: The sorted residue indices
+        """
+        code = self.type_code(resname)
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        return self.type_residues[self.type_starts[code]:self.type_starts[code + 1]]
+
+    def count(self, resname: str, chain: str = None) -> int:
+        """
+        Counts the residues with a given name, in the whole structure or in one chain
+        :param resname: The residue name
+        :param chain: Optional chain identifier
+        :return: The number of residues
+        """
+        code = self.type_code(resname)
+        if code < 0:
+            return 0
+        if chain is None:
+            return int(self.type_starts[code + 1] - self.type_starts[code])
+        return int(self.type_counts[self.structure.chain_index(chain), code])
+
+    def counts_per_chain(self) -> dict:
+        """
+        Counts every residue type of every chain
+        :return: {chain: {resname: count}} with only the types present in each chain
+        """
+        names = self.residue_types.tolist()
+        return {chain: {names[code]: int(row[code]) for code in np.flatnonzero(row).tolist()}
+                for chain, row in zip(self.structure.chain_ids.tolist(), self.type_counts)}
+
+    def select(self, expression: str) -> np.ndarray:
+        """
+        Evaluates a selection expression over the residues, see parse_selection
+        :param expression: The selection, e.g. "chain A and resname LYS ARG"
+        :return: The sorted indices of the selected residues
+        """
+        return np.flatnonzero(parse_selection(expression)(self))
+
+    # Residue masks of the selection keywords
+
+    def chain_mask(self, chains: list) -> np.ndarray:
+        mask = np.zeros(self.structure.n_residues, dtype=bool)
+        for chain in chains:
+            residues = self.chain_ranges.get(chain)
+            if residues is not None:
+                mask[residues.start:residues.stop] = True
+        return mask
+
+    def resname_mask(self, names: list) -> np.ndarray:
+        codes = [self.type_code(name) for name in names]
+        return np.isin(self.residue_type, [code for code in codes if code >= 0])
+
+    def resid_mask(self, values: list) -> np.ndarray:
+        mask = np.zeros(self.structure.n_residues, dtype=bool)
+        for value in values:
+            match = _RESID_RANGE.match(value)
+            if match is None:
+                # A residue number with an insertion code, matched exactly
+                mask |= self.structure.residue_number == value
+            else:
+                low = int(match.group(1))
+                high = low if match.group(2) is None else int(match.group(2))
+                mask |= (self.residue_seq >= low) & (self.residue_seq <= high)
+        return mask
+
+
+def _residue_seq(residue_number: np.ndarray) -> np.ndarray:
+    """
+    Gives the integer part of residue numbers, dropping insertion codes
+    :param residue_number: The residue numbers as written in the file
+    :return: An int64 array
+    """
+    if len(residue_number) == 0:
+        return np.empty(0, dtype=np.int64)
+    digits = np.char.rstrip(residue_number, "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+    try:
+        return digits.astype(np.int64)
+    except ValueError:
+        return np.array([int(value) if value.lstrip("-").isdigit() else 0 for value in digits.tolist()],
+                        dtype=np.int64)
+
+
+def parse_selection(expression: str):
+    """
+    Compiles a residue selection expression.
+
+    Terms are "chain", "resname" and "resid" followed by one or more values ("resid" accepts numbers, ranges such as
+    10-20 and numbers with insertion codes such as 52A), "hetero" and "all". Terms combine with "and", "or", "not"
+    and parentheses, e.g. "chain A D and not resname HOH".
+
+    :param expression: The selection expression
+    :return: A function taking a StructureIndex and returning a boolean mask over its residues
+    """
+    tokens = _TOKEN.findall(expression)
+    position = 0
+
+    def peek():
+        return tokens[position].lower() if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def values():
+        found = []
+        while peek() is not None and peek() not in _OPERATORS and peek() not in ("(", ")") \
+                and peek() not in SELECTION_KEYWORDS and peek() not in _RESID_ALIASES:
+            found.append(take())
+        return found
+
+    def term():
+        token = peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of selection: {expression!r}")
+        take()
+        if token == "(":
+            inner = disjunction()
+            if peek() != ")":
+                raise ValueError(f"Missing closing parenthesis in selection: {expression!r}")
+            take()
+            return inner
+        if token == "not":
+            inner = term()
+            return lambda index: ~inner(index)
+        if token == "all":
+            return lambda index: np.ones(index.structure.n_residues, dtype=bool)
+        if token == "hetero":
+            return lambda index: index.residue_hetero.copy()
+        keyword = _RESID_ALIASES.get(token, token)
+        if keyword not in SELECTION_KEYWORDS:
+            raise ValueError(f"Unknown selection keyword {tokens[position - 1]!r} in {expression!r}")
+        arguments = values()
+        if not arguments:
+            raise ValueError(f"Missing value after {keyword!r} in selection: {expression!r}")
+        return lambda index: getattr(index, f"{keyword}_mask")(arguments)
+
+    def conjunction():
+        left = term()
+        while peek() == "and":
+            take()
+            left = (lambda first, second: lambda index: first(index) & second(index))(left, term())
+        return left
+
+    def disjunction():
+        left = conjunction()
+        while peek() == "or":
+            take()
+            left = (lambda first, second: lambda index: first(index) | second(index))(left, conjunction())
+        return left
+
+    selection = disjunction()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected {tokens[position]!r} in selection: {expression!r}")
+    return selection
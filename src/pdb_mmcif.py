@@ -0,0 +1,184 @@
+import re
+
+import numpy as np
+
+from pdb_parser import ALTLOC_POLICIES, _select_alternates, _structure_name
+from pdb_structure import Structure, build_structure
+from profiling import count, timed
+
+# Values of a CIF row: quoted strings (a quote only closes a value when followed by a blank) or bare words
+_VALUE = re.compile(rb"'(?:[^']|'(?=\S))*'(?=\s|$)|\"(?:[^\"]|\"(?=\S))*\"(?=\s|$)|\S+")
+_ATOM_SITE = re.compile(rb"^_atom_site\.", re.MULTILINE)
+# Lines ending a loop: a comment, a new loop, a data item or a new data block
+_LOOP_END = re.compile(rb"^(?:#|loop_|_|data_|save_)", re.MULTILINE)
+# Values standing for missing (?) or inapplicable (.) data
+_MISSING = (b"?", b".")
+
+
+def _values(text: bytes) -> list:
+    """Splits CIF text into values, removing the quotes of quoted ones."""
+    if b"'" not in text and b'"' not in text:
+        return text.split()
+    return [value[1:-1] if value[:1] in (b"'", b'"') else value for value in _VALUE.findall(text)]
+
+
+def atom_site_table(data: bytes) -> dict:
+    """
+    Reads the _atom_site category of mmCIF content.
+    :param data: The content of the mmCIF file.
+    :return: The items of the category by name (e.g. "Cartn_x"), each an array of bytes values, one per atom site.
+    """
+    match = _ATOM_SITE.search(data)
+    if match is None:
+        raise ValueError("No _atom_site category found.")
+    names, position = [], match.start()
+    # Item names, one per line; in the single row form each name is followed by its value
+    single = {}
+    while data.startswith(b"_atom_site.", position):
+        stop = data.find(b"\n", position)
+        stop = len(data) if stop < 0 else stop
+        line = data[position:stop].split(None, 1)
+        name = line[0][len(b"_atom_site."):].decode()
+        names.append(name)
+        if len(line) > 1:
+            single[name] = _values(line[1])[0]
+        position = stop + 1
+    if single:
+        return {name: np.array([single.get(name, b"?")]) for name in names}
+
+    end = _LOOP_END.search(data, position)
+    values = _values(data[position:end.start() if end is not None else len(data)])
+    if len(values) % len(names):
+        raise ValueError(f"The _atom_site loop holds {len(values)} values for {len(names)} items.")
+    table = np.array(values, dtype=bytes).reshape(-1, len(names))
+    return {name: table[:, column] for column, name in enumerate(names)}
+
+
+def _column(table: dict, *names: str, default: bytes = b"?") -> np.ndarray:
+    """Gives the first of the items present, missing values replaced by the default."""
+    for name in names:
+        if name in table:
+            values = table[name].copy()
+            values[np.isin(values, _MISSING)] = default
+            return values
+    return np.full(len(next(iter(table.values()))), default)
+
+
+def _numbers(values: np.ndarray, dtype, default) -> np.ndarray:
+    """Converts CIF values to numbers, missing values becoming the default."""
+    missing = np.isin(values, _MISSING)
+    if missing.any():
+        values = np.where(missing, str(default).encode(), values)
+    return values.astype(dtype)
+
+
+def _table_to_structure(table: dict, rows: np.ndarray, altloc: str, dtype, name: str) -> Structure:
+    """
+    Converts the atom sites of one model into a Structure, as pdb_parser does with the records of a model.
+    Author-given chain, residue and atom identifiers are used, as written in the PDB format, falling back to the
+    label ones when absent.
+    """
+    if altloc not in ALTLOC_POLICIES and len(altloc) != 1:
+        raise ValueError(f"altloc must be one of {ALTLOC_POLICIES} or a single alternate location letter.")
+    table = {item: values[rows] for item, values in table.items()}
+    chain = _column(table, "auth_asym_id", "label_asym_id", default=b"")
+    residue_seq = _column(table, "auth_seq_id", "label_seq_id", default=b"")
+    insertion = _column(table, "pdbx_PDB_ins_code", default=b"")
+    atom_name = _column(table, "auth_atom_id", "label_atom_id", default=b"")
+    occupancy = _numbers(_column(table, "occupancy"), np.float32, 1.0)
+
+    codes = _column(table, "label_alt_id", default=b"")
+    alternates = np.flatnonzero(codes != b"")
+    if len(alternates):
+        # Residue runs: consecutive atom sites sharing chain, residue number and insertion code
+        key = np.char.add(np.char.add(np.char.add(chain, b" "), residue_seq), np.char.add(b" ", insertion))
+        runs = np.concatenate(([0], np.cumsum(key[1:] != key[:-1])))[alternates]
+        if altloc == "first":
+            priority = np.arange(len(alternates))
+        elif altloc == "occupancy":
+            priority = -occupancy[alternates]
+        else:
+            priority = (codes[alternates] != altloc.encode()).astype(np.int64)
+        keep = _select_alternates(len(codes), alternates, runs, atom_name[alternates], priority)
+        table = {item: values[keep] for item, values in table.items()}
+        chain, residue_seq, insertion, atom_name, occupancy = (values[keep] for values in
+                                                               (chain, residue_seq, insertion, atom_name, occupancy))
+
+    serial = _column(table, "id")
+    try:
+        serial = serial.astype(np.int64)
+    except ValueError:
+        serial = np.arange(1, len(serial) + 1)
+    coords = np.column_stack([_numbers(_column(table, f"Cartn_{axis}"), np.float64, "nan") for axis in "xyz"])
+    return build_structure(
+        coords,
+        atom_name.astype(str),
+        serial,
+        _numbers(_column(table, "B_iso_or_equiv"), np.float32, 0.0),
+        chain.astype(str),
+        np.char.add(residue_seq, insertion).astype(str),
+        _column(table, "auth_comp_id", "label_comp_id", default=b"").astype(str),
+        occupancy=occupancy,
+        element=_column(table, "type_symbol", default=b"").astype(str),
+        hetero=_column(table, "group_PDB") == b"HETATM",
+        dtype=dtype,
+        name=name,
+    )
+
+
+def _models(table: dict, hetatm: bool) -> tuple:
+    """Gives the model of every kept atom site and the model numbers in order of first appearance."""
+    model = _numbers(_column(table, "pdbx_PDB_model_num", default=b"1"), np.int64, 1)
+    if not hetatm:
+        model = np.where(_column(table, "group_PDB") == b"HETATM", np.iinfo(np.int64).min, model)
+    numbers, first = np.unique(model, return_index=True)
+    numbers = numbers[np.argsort(first)]
+    return model, numbers[numbers != np.iinfo(np.int64).min]
+
+
+@timed
+def parse_mmcif_data(data: bytes, name: str = "", model: int = None, altloc: str = "first", hetatm: bool = True,
+                     dtype=np.float64) -> Structure:
+    """
+    Reads the _atom_site table of mmCIF content into the Structure parse_pdb gives for the same entry in PDB format.
+    The table is split into values in one pass and every item is converted as a whole column, so that large entries
+    only distributed as mmCIF are read without temporary PDB files.
+    :param data: The content of the mmCIF file.
+    :param name: The name of the structure, e.g. its file name.
+    :param model: The model number (pdbx_PDB_model_num) to read. Defaults to the first model.
+    :param altloc: Alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM atom sites are kept.
+    :param dtype: The floating point type of the coordinate array.
+    :return: The Structure.
+    """
+    table = atom_site_table(data)
+    models, numbers = _models(table, hetatm)
+    if model is None:
+        model = int(numbers[0]) if len(numbers) else 1
+    elif model not in numbers:
+        raise ValueError(f"Model {model} not found in {name}.")
+    structure = _table_to_structure(table, np.flatnonzero(models == model), altloc, dtype, _structure_name(name))
+    count(atoms=structure.n_atoms, residues=structure.n_residues)
+    return structure
+
+
+@timed
+def parse_mmcif_models(data: bytes, name: str = "", altloc: str = "first", hetatm: bool = True,
+                       dtype=np.float64) -> dict:
+    """
+    Reads every model of mmCIF content, e.g. an NMR ensemble.
+    :param data: The content of the mmCIF file.
+    :param name: The name of the structure, e.g. its file name.
+    :param altloc: Alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM atom sites are kept.
+    :param dtype: The floating point type of the coordinate arrays.
+    :return: A dictionary mapping model numbers to Structures, in file order.
+    """
+    table = atom_site_table(data)
+    models, numbers = _models(table, hetatm)
+    result = {}
+    for number in numbers.tolist():
+        result[number] = _table_to_structure(table, np.flatnonzero(models == number), altloc, dtype,
+                                             _structure_name(name))
+        count(atoms=result[number].n_atoms, residues=result[number].n_residues)
+    return result
@@ -1,4 +1,27 @@
-def pdb_parser_optimized(file: str) -> dict:
+import bz2
+import gzip
+import lzma
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from pdb_structure import Structure, build_structure
+from profiling import count, timed
+
+# Version of the parsed output, part of the cache keys of parsed structures: bump it whenever parse_pdb changes what
+# it produces for the same file
+PARSER_VERSION = 2
+# Openers of the compressed files read directly, by file extension
+COMPRESSIONS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+# Bytes read (decompressed) at once from compressed files
+READ_BUFFER = 1 << 22
+# Extensions of mmCIF files, read by pdb_mmcif
+MMCIF_EXTENSIONS = (".cif", ".mmcif")
+
+
+@timed
+def pdb_parser_dict(file: str) -> dict:
     """
     This function reads a PDB file line by line, and for each line that starts with "ATOM", it splits the line into
     fields, extracts the necessary information, and stores it in a dictionary.
@@ -36,3 +59,573 @@ def pdb_parser_optimized(file: str) -> dict:
                 if atom_type not in residue_dict["atomlist"]:
                     residue_dict["atomlist"].append(atom_type)
     return pdb_dict
+
+
+# Fixed PDB columns (0-based, end exclusive) of ATOM/HETATM records
+RECORD_WIDTH = 80
+COLUMNS = {
+    "record": (0, 6),
+    "serial": (6, 11),
+    "name": (12, 16),
+    "altloc": (16, 17),
+    "resname": (17, 20),
+    "chain": (21, 22),
+    "resseq": (22, 26),
+    "icode": (26, 27),
+    "x": (30, 38),
+    "y": (38, 46),
+    "z": (46, 54),
+    "occupancy": (54, 60),
+    "bfactor": (60, 66),
+    "element": (76, 78),
+}
+ALTLOC_POLICIES = ("first", "occupancy")
+# Decimals of the fixed-point numeric columns of coordinate records
+NUMERIC_COLUMNS = {"serial": 0, "x": 3, "y": 3, "z": 3, "occupancy": 2, "bfactor": 2}
+
+# Number of records whose fixed-point fields _fixed_point decodes at once, small enough for the temporaries to stay
+# in cache
+FIXED_POINT_CHUNK = 1 << 14
+
+# Size (in bits) of the hash table _strings groups the fields of a text column with
+STRING_TABLE_BITS = 20
+
+
+class RecordTable(NamedTuple):
+    """Lines of a PDB file: the raw bytes (padded with spaces) and the offset and length of each line."""
+    padded: np.ndarray
+    starts: np.ndarray
+    lengths: np.ndarray
+
+    def subset(self, rows) -> "RecordTable":
+        return RecordTable(self.padded, self.starts[rows], self.lengths[rows])
+
+
+def _pad(data) -> np.ndarray:
+    """
+    Copies raw file content into a uint8 array followed by a full record of spaces, so that a whole record can be
+    read at any line start.
+    :param data: The raw file content.
+    :return: The padded byte array.
+    """
+    return np.concatenate((np.frombuffer(data, dtype=np.uint8), np.full(RECORD_WIDTH, ord(" "), dtype=np.uint8)))
+
+
+def compression(file: str) -> str:
+    """
+    Gives the compression of a file from its extension.
+    :param file: The file name.
+    :return: The extension of a supported compression (".gz", ".bz2" or ".xz"), or "" for plain files.
+    """
+    extension = os.path.splitext(file)[1].lower()
+    return extension if extension in COMPRESSIONS else ""
+
+
+def strip_compression(file: str) -> str:
+    """
+    Removes the compression extension of a file name, e.g. 1brs.pdb.gz -> 1brs.pdb.
+    :param file: The file name.
+    :return: The name of the uncompressed file.
+    """
+    return file[:len(file) - len(compression(file))]
+
+
+def is_mmcif(file: str) -> bool:
+    """
+    Tells whether a file is in mmCIF format from its extension, compressed or not.
+    :param file: The file name.
+    :return: True for .cif and .mmcif files.
+    """
+    return strip_compression(file).lower().endswith(MMCIF_EXTENSIONS)
+
+
+def open_structure(file: str):
+    """
+    Opens a structure file for binary reading, decompressing it on the fly when its extension names a supported
+    compression.
+    :param file: The file name.
+    :return: A binary file object.
+    """
+    opener = COMPRESSIONS.get(compression(file))
+    return opener(file, "rb") if opener is not None else open(file, "rb")
+
+
+def _read_padded(file: str) -> tuple:
+    """
+    Reads a whole file straight into a space-padded byte array. Compressed files are decompressed in READ_BUFFER
+    blocks into a buffer grown as needed, without holding the decompressed content twice.
+    :param file: The file name.
+    :return: (padded array, size of the file content)
+    """
+    if not compression(file):
+        with open(file, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            padded = np.full(size + RECORD_WIDTH, ord(" "), dtype=np.uint8)
+            size = f.readinto(memoryview(padded)[:size])
+        return padded, size
+    # Structure files typically compress four to five times
+    padded = np.empty(4 * os.path.getsize(file) + READ_BUFFER + RECORD_WIDTH, dtype=np.uint8)
+    size = 0
+    with open_structure(file) as f:
+        while True:
+            if len(padded) - size < READ_BUFFER + RECORD_WIDTH:
+                grown = np.empty(2 * len(padded), dtype=np.uint8)
+                grown[:size] = padded[:size]
+                padded = grown
+            read = f.readinto(memoryview(padded)[size:size + READ_BUFFER])
+            if not read:
+                break
+            size += read
+    padded[size:size + RECORD_WIDTH] = ord(" ")
+    return padded[:size + RECORD_WIDTH], size
+
+
+def read_data(file: str) -> bytes:
+    """
+    Reads the whole content of a structure file, decompressing compressed files (.gz, .bz2, .xz).
+    :param file: The file name.
+    :return: The content, to be parsed with parse_pdb_data.
+    """
+    with open_structure(file) as f:
+        return f.read()
+
+
+def _line_table(padded: np.ndarray, size: int) -> tuple:
+    """
+    Locates the lines of a file held in a byte array.
+    :param padded: The padded file content.
+    :param size: The length of the file content inside the padded array.
+    :return: (starts, lengths) of every line, without the line terminator.
+    """
+    buffer = padded[:size]
+    ends = np.flatnonzero(buffer == ord("\n"))
+    if size and buffer[-1] != ord("\n"):
+        ends = np.append(ends, size)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts
+    # Windows line endings
+    lengths -= (buffer[np.maximum(ends - 1, 0)] == ord("\r")) & (lengths > 0)
+    return starts, lengths
+
+
+def _record_bytes(records: RecordTable, width: int = RECORD_WIDTH) -> np.ndarray:
+    """
+    Gathers the first columns of every record as an (n_records, width) byte matrix in a single indexing operation
+    over a sliding window of the file, so every field is then a column slice of the matrix.
+    :param records: The record table.
+    :param width: The number of columns gathered.
+    :return: The byte matrix, with spaces past the end of short lines.
+    """
+    rows = np.lib.stride_tricks.sliding_window_view(records.padded, width)[records.starts]
+    short = np.flatnonzero(records.lengths < width)
+    if len(short):
+        past_end = np.arange(width) >= records.lengths[short, np.newaxis]
+        rows[short] = np.where(past_end, ord(" "), rows[short])
+    return rows
+
+
+def _field(rows: np.ndarray, name: str) -> np.ndarray:
+    """
+    Gives one fixed-width column of the records as a byte-string array.
+    :param rows: The record byte matrix, see _record_bytes.
+    :param name: A key of COLUMNS.
+    :return: An array of dtype S<width>.
+    """
+    start, stop = COLUMNS[name]
+    return np.ascontiguousarray(rows[:, start:stop]).view(f"S{stop - start}").ravel()
+
+
+def _fixed_point(rows: np.ndarray, fields: dict) -> dict:
+    """
+    Decodes right-aligned fixed-point columns ("%8.3f" coordinates, "%6.2f" occupancies and B-factors, or integers
+    when decimals is 0) together, without converting every field through a string: the characters of the columns of
+    a block of records are gathered once, transposed to one row per character column, and a weight matrix of powers
+    of ten turns the digit rows into the integer of every field in one matrix product (exact, all partial sums being
+    integers below 2**24). The values are exact, the same as float() of the field.
+    :param rows: The record byte matrix, see _record_bytes.
+    :param fields: The number of digits after the decimal point of every decoded column, keyed by COLUMNS name.
+    :return: The float64 values of every column, or None for a column where a field does not follow the fixed-point
+    layout.
+    """
+    names = list(fields)
+    spans = [COLUMNS[name] for name in names]
+    columns = np.concatenate([np.arange(start, stop) for start, stop in spans])
+    offsets = np.cumsum([0] + [stop - start for start, stop in spans[:-1]])
+    # Weight of every character column in the integer of its field; the decimal point holds no digit
+    weights = np.zeros((len(names), len(columns)), dtype=np.float32)
+    # Character columns of every field, to reduce character rows to field rows with a matrix product
+    member = np.zeros_like(weights)
+    point = np.zeros(len(columns), dtype=bool)
+    for position, (name, (start, stop), offset) in enumerate(zip(names, spans, offsets.tolist())):
+        width, decimals = stop - start, fields[name]
+        powers = 10.0 ** np.arange(width - 1, -1, -1)
+        if decimals:
+            powers[:width - decimals - 1] /= 10
+            powers[width - decimals - 1] = 0
+            point[offset + width - decimals - 1] = True
+        weights[position, offset:offset + width] = powers
+        member[position, offset:offset + width] = 1
+    # Last character column of every field but the last, where a pair of adjacent columns spans two fields
+    boundaries = offsets[1:] - 1
+    # Digits and minus signs stacked into one operand, so that one matrix product gives the integers and the signs
+    stacked = np.zeros((2 * len(names), 2 * len(columns)), dtype=np.float32)
+    stacked[:len(names), :len(columns)] = weights
+    stacked[len(names):, len(columns):] = member
+    operand = np.empty((2 * len(columns), min(len(rows), FIXED_POINT_CHUNK)), dtype=np.float32)
+
+    values = np.empty((len(names), len(rows)), dtype=np.float64)
+    valid = np.ones(len(names), dtype=bool)
+    for chunk in range(0, len(rows), FIXED_POINT_CHUNK):
+        block = rows[chunk:chunk + FIXED_POINT_CHUNK].T[columns]
+        size = block.shape[1]
+        digits = block - np.uint8(ord("0"))
+        is_digit = digits <= 9
+        blank = block == ord(" ")
+        minus = block == ord("-")
+        # Blanks, then an optional minus sign, then digits around the decimal point
+        bad = ~(is_digit | blank | minus)
+        bad[point] = block[point] != ord(".")
+        misplaced = blank[1:] | minus[1:]
+        misplaced &= ~blank[:-1]
+        misplaced[boundaries] = False
+        bad[1:] |= misplaced
+        if bad.any():
+            valid &= ~(member @ bad.astype(np.float32)).any(axis=1)
+        np.multiply(digits, is_digit, out=digits)
+        operand[:len(columns), :size] = digits
+        operand[len(columns):, :size] = minus
+        number = stacked @ operand[:, :size]
+        signed = number[:len(names)]
+        signed[number[len(names):] > 0] *= -1
+        values[:, chunk:chunk + size] = signed
+    values /= 10.0 ** np.array([fields[name] for name in names])[:, np.newaxis]
+    return {name: values[position] if valid[position] else None for position, name in enumerate(names)}
+
+
+def _numeric_field(rows: np.ndarray, name: str, dtype, default=0, decimals: int = None) -> np.ndarray:
+    """
+    Converts a fixed-width column to numbers, using the default for blank or malformed fields.
+    :param rows: The record byte matrix, see _record_bytes.
+    :param name: A key of COLUMNS.
+    :param dtype: The numeric type to convert to.
+    :param default: The value used for blank fields.
+    :param decimals: Number of decimals of the standard fixed-point layout of the column, if it has one.
+    :return: The numeric array.
+    """
+    if decimals is not None:
+        values = _fixed_point(rows, {name: decimals})[name]
+        if values is not None:
+            return values.astype(dtype)
+    values = _field(rows, name)
+    blank = np.char.strip(values) == b""
+    if blank.any():
+        values = values.copy()
+        values[blank] = str(default).encode()
+    try:
+        return values.astype(dtype)
+    except ValueError:
+        return np.array([_to_number(value, dtype, default) for value in values.tolist()], dtype=dtype)
+
+
+def _to_number(value: bytes, dtype, default):
+    try:
+        return dtype(value)
+    except ValueError:
+        return default
+
+
+def _strings(rows: np.ndarray, name: str) -> np.ndarray:
+    """
+    Decodes and strips a text column. Columns such as atom or residue names hold few distinct values, so the fields
+    are read as integers (at most eight bytes each) and only the distinct ones are decoded and stripped.
+    :param rows: The record byte matrix, see _record_bytes.
+    :param name: A key of COLUMNS.
+    :return: The stripped unicode array.
+    """
+    start, stop = COLUMNS[name]
+    padded = np.zeros((len(rows), 8), dtype=np.uint8)
+    padded[:, :stop - start] = rows[:, start:stop]
+    codes = padded.view(np.uint64).ravel()
+    # Multiplicative hashing into a table holding one record per slot replaces the sort of np.unique, unless two
+    # distinct fields share a slot
+    slot = (codes * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - STRING_TABLE_BITS)
+    table = np.empty(1 << STRING_TABLE_BITS, dtype=np.intp)
+    table[slot] = np.arange(len(codes))
+    if np.array_equal(codes[table[slot]], codes):
+        occupied = np.zeros(1 << STRING_TABLE_BITS, dtype=bool)
+        occupied[slot] = True
+        first = table[occupied]
+        table[occupied] = np.arange(len(first))
+        inverse = table[slot]
+    else:
+        _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    return np.char.strip(np.char.decode(_field(rows[first], name), "latin-1"))[inverse.reshape(-1)]
+
+
+def _altloc_keep(rows: np.ndarray, residue_run: np.ndarray, altloc: str) -> np.ndarray:
+    """
+    Selects one alternate location per atom.
+    :param rows: The record byte matrix, see _record_bytes.
+    :param residue_run: Index of the residue run of every record.
+    :param altloc: "first" keeps the first alternate location listed, "occupancy" the most occupied one, and a
+    single letter keeps that alternate location where it exists.
+    :return: A boolean mask of the records to keep, or None when no record has an alternate location.
+    """
+    if altloc not in ALTLOC_POLICIES and len(altloc) != 1:
+        raise ValueError(f"altloc must be one of {ALTLOC_POLICIES} or a single alternate location letter.")
+    codes = rows[:, COLUMNS["altloc"][0]]
+    # Only records carrying an alternate location indicator can collide
+    alternates = np.flatnonzero(codes != ord(" "))
+    if len(alternates) == 0:
+        return None
+    names = _field(rows[alternates], "name")
+    runs = residue_run[alternates]
+    if altloc == "first":
+        priority = np.arange(len(alternates))
+    elif altloc == "occupancy":
+        priority = -_numeric_field(rows[alternates], "occupancy", np.float64, 1.0, 2)
+    else:
+        priority = (codes[alternates] != ord(altloc)).astype(np.int64)
+    return _select_alternates(len(codes), alternates, runs, names, priority)
+
+
+def _select_alternates(size: int, rows: np.ndarray, runs: np.ndarray, names: np.ndarray,
+                       priority: np.ndarray) -> np.ndarray:
+    """
+    Keeps, among the records carrying an alternate location, the one of lowest priority (first listed on ties) for
+    every atom name of every residue run.
+    :param size: The number of records.
+    :param rows: The records carrying an alternate location.
+    :param runs: The residue run of each of these records.
+    :param names: The atom name of each of these records.
+    :param priority: The priority of each of these records.
+    :return: A boolean mask of the records to keep.
+    """
+    order = np.lexsort((np.arange(len(rows)), priority, names, runs))
+    repeated = (runs[order[1:]] == runs[order[:-1]]) & (names[order[1:]] == names[order[:-1]])
+    keep = np.ones(size, dtype=bool)
+    keep[rows[order[1:][repeated]]] = False
+    return keep
+
+
+def _residue_runs(rows: np.ndarray) -> np.ndarray:
+    """
+    Numbers runs of consecutive records sharing chain, residue number and insertion code.
+    :param rows: The record byte matrix, see _record_bytes.
+    :return: The run index of every record.
+    """
+    start, stop = COLUMNS["chain"][0], COLUMNS["icode"][1]
+    keys = np.ascontiguousarray(rows[:, start:stop]).view(f"S{stop - start}").ravel()
+    return np.concatenate(([0], np.cumsum(keys[1:] != keys[:-1])))
+
+
+def _records_to_structure(rows: np.ndarray, altloc: str = "first", dtype=np.float64, name: str = "") -> Structure:
+    """
+    Converts the ATOM/HETATM records of a single model into a Structure.
+    :param rows: The record byte matrix of the records, see _record_bytes.
+    :param altloc: The alternate location policy, see _altloc_keep.
+    :param dtype: The floating point type of the coordinate array.
+    :param name: The name of the structure.
+    :return: The Structure.
+    """
+    if len(rows) == 0:
+        # No coordinate record selected, e.g. a header-only file or a ligand read without HETATM records
+        return build_structure(np.empty((0, 3)), [], [], [], [], [], [], dtype=dtype, name=name)
+    residue_run = _residue_runs(rows)
+    keep = _altloc_keep(rows, residue_run, altloc)
+    if keep is not None:
+        rows, residue_run = rows[keep], residue_run[keep]
+
+    # Residue level columns are decoded once per residue run and broadcast back to the atoms
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(residue_run)) + 1))
+    run_lengths = np.diff(np.append(run_starts, len(rows)))
+    runs = rows[run_starts]
+    residue_number = np.char.add(_strings(runs, "resseq"), _strings(runs, "icode"))
+
+    # Numeric columns are decoded in one pass, falling back to a conversion of their text when not fixed-point
+    fixed = _fixed_point(rows, NUMERIC_COLUMNS)
+
+    def numbers(column, dtype, default=0):
+        values = fixed[column]
+        return _numeric_field(rows, column, dtype, default) if values is None else values.astype(dtype)
+
+    coords = np.empty((len(rows), 3), dtype=np.float64)
+    for axis, column in enumerate("xyz"):
+        coords[:, axis] = numbers(column, np.float64)
+    # Hybrid-36 or overflowing serial numbers are renumbered
+    serial = np.arange(1, len(rows) + 1) if fixed["serial"] is None else fixed["serial"].astype(np.int64)
+
+    return build_structure(
+        coords,
+        _strings(rows, "name"),
+        serial,
+        numbers("bfactor", np.float32),
+        np.repeat(_strings(runs, "chain"), run_lengths),
+        np.repeat(residue_number, run_lengths),
+        np.repeat(_strings(runs, "resname"), run_lengths),
+        occupancy=numbers("occupancy", np.float32, 1.0),
+        element=_strings(rows, "element"),
+        # Only ATOM and HETATM records reach here
+        hetero=rows[:, 0] == ord("H"),
+        dtype=dtype,
+        name=name,
+    )
+
+
+def _record_code(record: bytes) -> bytes:
+    """Pads a record name (e.g. b"ATOM") to the six columns _record_kinds gives."""
+    return record.ljust(COLUMNS["record"][1])
+
+
+def _record_kinds(lines: RecordTable) -> np.ndarray:
+    """
+    Gives the record name of every line, as padded by _record_code.
+    :param lines: The line table.
+    :return: An S6 array.
+    """
+    return _field(_record_bytes(lines, COLUMNS["record"][1]), "record")
+
+
+def _model_numbers(lines: RecordTable, first: int = 0) -> np.ndarray:
+    """
+    Reads the serial numbers of MODEL records, numbering models by position where it is missing.
+    :param lines: The MODEL records.
+    :param first: The number of models before these ones.
+    :return: The model numbers.
+    """
+    headers = np.ascontiguousarray(_record_bytes(lines, 14)[:, 10:14]).view("S4").ravel().tolist()
+    return np.array([_to_number(header, int, first + position + 1) for position, header in enumerate(headers)],
+                    dtype=np.int64)
+
+
+def _split_models(padded: np.ndarray, size: int, hetatm: bool = True) -> tuple:
+    """
+    Finds the coordinate records of a PDB file and the model each of them belongs to.
+    :param padded: The space-padded file content, see _read_padded.
+    :param size: The length of the file content.
+    :param hetatm: Whether HETATM records are kept.
+    :return: (records, model_of_record, model_numbers) for the selected records.
+    """
+    lines = RecordTable(padded, *_line_table(padded, size))
+    kinds = _record_kinds(lines)
+
+    selected = kinds == _record_code(b"ATOM")
+    if hetatm:
+        selected |= kinds == _record_code(b"HETATM")
+
+    is_model = kinds == _record_code(b"MODEL")
+    if is_model.any():
+        model_numbers = _model_numbers(lines.subset(is_model))
+        model_of_line = np.maximum(np.cumsum(is_model) - 1, 0)
+    else:
+        model_numbers = np.array([1])
+        model_of_line = np.zeros(len(kinds), dtype=np.int64)
+
+    return lines.subset(selected), model_of_line[selected], model_numbers
+
+
+def _structure_name(file: str) -> str:
+    return file.split("/")[-1].split(".")[0]
+
+
+@timed
+def parse_pdb(file: str, model: int = None, altloc: str = "first", hetatm: bool = True,
+              dtype=np.float64) -> Structure:
+    """
+    Vectorized fixed-column PDB parser.
+
+    The whole file is read at once into a byte array and every field is gathered from its fixed columns for all
+    ATOM/HETATM records in one indexing operation, so fused columns (negative coordinates, four digit residue
+    numbers) are handled correctly and no Python object is created per atom.
+
+    Files compressed with gzip, bzip2 or xz (.gz, .bz2, .xz) are decompressed while they are read, and mmCIF files
+    (.cif, .mmcif, possibly compressed) are read from their _atom_site table by pdb_mmcif into the same Structure.
+
+    :param file: The name of the PDB file to parse.
+    :param model: The MODEL number to read. Defaults to the first model of the file.
+    :param altloc: Alternate location policy: "first" keeps the first one listed, "occupancy" the most occupied one,
+    and a single letter (e.g. "B") keeps that alternate location where present.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate array.
+    :return: A Structure containing the parsed PDB data.
+    """
+    if is_mmcif(file):
+        import pdb_mmcif
+
+        return pdb_mmcif.parse_mmcif_data(read_data(file), file, model, altloc, hetatm, dtype)
+    return _parse_model(*_read_padded(file), file, model, altloc, hetatm, dtype)
+
+
+@timed
+def parse_pdb_data(data: bytes, name: str = "", model: int = None, altloc: str = "first", hetatm: bool = True,
+                   dtype=np.float64) -> Structure:
+    """
+    Parses PDB content already in memory, e.g. read asynchronously or decompressed, as parse_pdb parses a file.
+    mmCIF content, recognised by its leading data_ block header, is read by pdb_mmcif.
+    :param data: The content of the PDB (or mmCIF) file.
+    :param name: The name of the structure, e.g. its file name.
+    :param model: The MODEL number to read. Defaults to the first model.
+    :param altloc: Alternate location policy, see parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate array.
+    :return: A Structure containing the parsed PDB data.
+    """
+    if data[:256].lstrip().startswith(b"data_"):
+        import pdb_mmcif
+
+        return pdb_mmcif.parse_mmcif_data(data, name, model, altloc, hetatm, dtype)
+    return _parse_model(_pad(data), len(data), name, model, altloc, hetatm, dtype)
+
+
+def _parse_model(padded: np.ndarray, size: int, file: str, model: int, altloc: str, hetatm: bool,
+                 dtype) -> Structure:
+    """Parses one model of padded PDB content, see parse_pdb."""
+    records, model_of_record, model_numbers = _split_models(padded, size, hetatm)
+    position = 0
+    if model is not None:
+        matches = np.flatnonzero(model_numbers == model)
+        if len(matches) == 0:
+            raise ValueError(f"Model {model} not found in {file}.")
+        position = int(matches[0])
+    rows = _record_bytes(records.subset(model_of_record == position))
+    structure = _records_to_structure(rows, altloc, dtype, _structure_name(file))
+    count(atoms=structure.n_atoms, residues=structure.n_residues)
+    return structure
+
+
+@timed
+def parse_pdb_models(file: str, altloc: str = "first", hetatm: bool = True, dtype=np.float64) -> dict:
+    """
+    Parses every MODEL of a PDB file, e.g. an NMR ensemble.
+    :param file: The name of the PDB file to parse.
+    :param altloc: Alternate location policy, see parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate arrays.
+    :return: A dictionary mapping model numbers to Structures, in file order.
+    """
+    if is_mmcif(file):
+        import pdb_mmcif
+
+        return pdb_mmcif.parse_mmcif_models(read_data(file), file, altloc, hetatm, dtype)
+    records, model_of_record, model_numbers = _split_models(*_read_padded(file), hetatm)
+    models = {}
+    for position, number in enumerate(model_numbers.tolist()):
+        rows = _record_bytes(records.subset(model_of_record == position))
+        models[number] = _records_to_structure(rows, altloc, dtype, _structure_name(file))
+        count(atoms=models[number].n_atoms, residues=models[number].n_residues)
+    return models
+
+
+def pdb_parser_optimized(file: str, dtype=np.float64) -> Structure:
+    """
+    This function reads the "ATOM" records of the first model of a PDB file and returns them as a columnar
+    Structure: one N x 3 coordinate array with parallel per-atom arrays and residue/chain offset tables. The
+    Structure can still be indexed like the dictionary returned by pdb_parser_dict, e.g. pdb_data["A"]["8"]["CA"]["x"].
+
+    :param file: The name of the PDB file to parse.
+    :param dtype: The floating point type of the coordinate array (np.float64 or np.float32).
+    :return: A Structure containing the parsed PDB data.
+    """
+    return parse_pdb(file, hetatm=False, dtype=dtype)
@@ -0,0 +1,187 @@
+import numpy as np
+
+from pdb_parser import (COLUMNS, RECORD_WIDTH, RecordTable, _line_table, _model_numbers, _pad, _record_bytes,
+                        _record_code, _record_kinds, _records_to_structure, _structure_name, is_mmcif, open_structure)
+from pdb_structure import Structure
+
+# Number of bytes read from the file at once
+BLOCK_SIZE = 1 << 22
+_CHAIN_COLUMN = COLUMNS["chain"][0]
+
+
+def _blocks(file: str, block_size: int = BLOCK_SIZE):
+    """
+    Reads a file in blocks of whole lines, decompressing compressed files (.gz, .bz2, .xz) block by block.
+    :param file: The file name.
+    :param block_size: The number of (decompressed) bytes read at once.
+    :return: A generator of bytes objects, each ending at a line boundary (except possibly the last one).
+    """
+    if is_mmcif(file):
+        raise ValueError(f"{file} is an mmCIF file; only PDB files are streamed, parse it with pdb_parser.parse_pdb.")
+    with open_structure(file) as f:
+        remainder = b""
+        while True:
+            data = f.read(block_size)
+            if not data:
+                if remainder:
+                    yield remainder
+                return
+            data = remainder + data
+            cut = data.rfind(b"\n") + 1
+            remainder = data[cut:]
+            if cut:
+                yield data[:cut]
+
+
+def _chain_groups(file: str, chains: list = None, model: int = None, all_models: bool = False,
+                  hetatm: bool = True, block_size: int = BLOCK_SIZE):
+    """
+    Streams the coordinate records of a PDB file grouped by runs of consecutive records of the same model and chain.
+
+    Records of chains that are not selected are dropped as soon as their line is located, from the chain byte alone,
+    so only the selected records are ever decoded and held in memory. Reading stops at the end of the requested model.
+
+    :param file: The PDB file.
+    :param chains: The chain identifiers to keep. Defaults to every chain.
+    :param model: The MODEL number to read. Defaults to the first model.
+    :param all_models: Whether every model is read instead.
+    :param hetatm: Whether HETATM records are kept.
+    :param block_size: The number of bytes read at once.
+    :return: A generator of (model number, chain identifier, record byte matrix) tuples.
+    """
+    chain_codes = None if chains is None else np.frombuffer("".join(chains).encode(), dtype=np.uint8)
+    # MODEL records read so far, and the number of the model they leave open
+    model_count, open_number = 0, 1
+    target_seen = False
+    pending_key, pending = None, []
+
+    for block in _blocks(file, block_size):
+        padded = _pad(block)
+        lines = RecordTable(padded, *_line_table(padded, len(block)))
+        kinds = _record_kinds(lines)
+
+        is_model = kinds == _record_code(b"MODEL")
+        opened = np.cumsum(is_model)
+        numbers = np.concatenate(([open_number], _model_numbers(lines.subset(is_model), model_count)))
+        line_numbers = numbers[opened]
+        # Records before the first MODEL record belong to the first model
+        line_index = np.maximum(model_count + opened - 1, 0)
+        model_count += int(opened[-1]) if len(opened) else 0
+        open_number = int(numbers[-1])
+
+        selected = kinds == _record_code(b"ATOM")
+        if hetatm:
+            selected |= kinds == _record_code(b"HETATM")
+        chain_bytes = np.where(lines.lengths > _CHAIN_COLUMN, padded[lines.starts + _CHAIN_COLUMN], ord(" "))
+        if chain_codes is not None:
+            selected &= np.isin(chain_bytes, chain_codes)
+        finished = False
+        if not all_models and model is None:
+            selected &= line_index == 0
+            finished = model_count > 1
+        elif not all_models:
+            in_target = line_numbers == model
+            selected &= in_target
+            target_seen = target_seen or bool(in_target.any())
+            finished = target_seen and open_number != model
+
+        rows = np.flatnonzero(selected)
+        if len(rows):
+            records = _record_bytes(lines.subset(rows))
+            keys = line_index[rows] * 256 + chain_bytes[rows]
+            bounds = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(rows)]))
+            for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                key = (int(line_numbers[rows[start]]), chr(chain_bytes[rows[start]]), int(line_index[rows[start]]))
+                if key != pending_key and pending:
+                    yield pending_key[0], pending_key[1], np.concatenate(pending)
+                    pending = []
+                pending_key = key
+                pending.append(records[start:stop])
+        if finished:
+            break
+
+    if pending:
+        yield pending_key[0], pending_key[1], np.concatenate(pending)
+
+
+def iter_chains(file: str, chains: list = None, model: int = None, altloc: str = "first", hetatm: bool = True,
+                dtype=np.float64, block_size: int = BLOCK_SIZE):
+    """
+    Reads the chains of one model lazily, one Structure per chain, so that peak memory is bounded by the largest
+    selected chain rather than by the file. A chain whose records are not contiguous in the file is yielded once per
+    contiguous run.
+    :param file: The PDB file.
+    :param chains: The chain identifiers to read, skipping the others without decoding them. Defaults to every chain.
+    :param model: The MODEL number to read. Defaults to the first model.
+    :param altloc: The alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate arrays.
+    :param block_size: The number of bytes read at once.
+    :return: A generator of single-chain Structures.
+    """
+    name = _structure_name(file)
+    for _, _, records in _chain_groups(file, chains, model, False, hetatm, block_size):
+        yield _records_to_structure(records, altloc, dtype, name)
+
+
+def iter_residues(file: str, chains: list = None, model: int = None, altloc: str = "first", hetatm: bool = True,
+                  dtype=np.float64, block_size: int = BLOCK_SIZE):
+    """
+    Reads the residues of one model lazily, chain by chain, see iter_chains.
+    :return: A generator of residue views.
+    """
+    for structure in iter_chains(file, chains, model, altloc, hetatm, dtype, block_size):
+        yield from structure.residues()
+
+
+def iter_models(file: str, chains: list = None, altloc: str = "first", hetatm: bool = True, dtype=np.float64,
+                block_size: int = BLOCK_SIZE):
+    """
+    Reads the models of a PDB file (e.g. an NMR ensemble) lazily, holding one model in memory at a time.
+    :param file: The PDB file.
+    :param chains: The chain identifiers to read. Defaults to every chain.
+    :param altloc: The alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate arrays.
+    :param block_size: The number of bytes read at once.
+    :return: A generator of (model number, Structure) tuples.
+    """
+    name = _structure_name(file)
+    current, parts = None, []
+    for number, _, records in _chain_groups(file, chains, None, True, hetatm, block_size):
+        if number != current and parts:
+            yield current, _records_to_structure(np.concatenate(parts), altloc, dtype, name)
+            parts = []
+        current = number
+        parts.append(records)
+    if parts:
+        yield current, _records_to_structure(np.concatenate(parts), altloc, dtype, name)
+
+
+def read_chains(file: str, chains: list, model: int = None, altloc: str = "first", hetatm: bool = True,
+                dtype=np.float64, block_size: int = BLOCK_SIZE) -> Structure:
+    """
+    Reads only some chains of a PDB file into one Structure, e.g. the two chains of an interface. The other chains
+    are skipped at the byte level, so memory is bounded by the selected chains.
+
+    A requested chain without any selected record in the model (absent from the file, or holding only HETATM
+    records when hetatm is False) is an error rather than an empty part of the result, so that a mistyped chain
+    identifier is not silently ignored. An empty list of chains gives an empty Structure.
+
+    :param file: The PDB file.
+    :param chains: The chain identifiers to read.
+    :param model: The MODEL number to read. Defaults to the first model.
+    :param altloc: The alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :param dtype: The floating point type of the coordinate array.
+    :param block_size: The number of bytes read at once.
+    :return: The Structure holding the selected chains.
+    :raises KeyError: When a requested chain has no selected record.
+    """
+    groups = list(_chain_groups(file, chains, model, False, hetatm, block_size))
+    missing = sorted(set(chains) - {chain for _, chain, _ in groups})
+    if missing:
+        raise KeyError(f"Chains {', '.join(missing)} not found in {file}.")
+    records = np.concatenate([records for _, _, records in groups]) if groups \
+        else np.empty((0, RECORD_WIDTH), dtype=np.uint8)
+    return _records_to_structure(records, altloc, dtype, _structure_name(file))
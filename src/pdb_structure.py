@@ -0,0 +1,593 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from pdb_index import StructureIndex
+
+# Keys of the legacy residue dictionaries that are not atom names
+RESIDUE_KEYS = ("atomlist", "resname")
+# Array attributes of a Structure, in constructor order
+ARRAY_FIELDS = ("coords", "atom_name", "serial", "bfactor", "residue_starts", "residue_name", "residue_number",
+                "residue_chain", "chain_ids", "chain_starts", "occupancy", "element", "hetero")
+
+
+class Structure(Mapping):
+    """
+    Columnar, array-backed representation of a parsed PDB structure.
+
+    All atoms live in one contiguous N x 3 coordinate array with parallel per-atom arrays (atom name, serial,
+    B-factor, occupancy, element). Atoms are grouped by residue and residues by chain, so that the residue offset
+    table ``residue_starts`` (length R + 1) and the chain offset table ``chain_starts`` (length C + 1, in residue
+    units) are enough to slice any residue or chain out of the atom arrays.
+
+    The object also behaves like the nested dictionary returned by the original parser, so lookups such as
+    ``pdb_data["chains"]``, ``pdb_data["A"]["8"]["resname"]`` or ``pdb_data["A"]["8"]["CA"]["x"]`` keep working.
+    """
+
+    def __init__(self, coords, atom_name, serial, bfactor, residue_starts, residue_name, residue_number,
+                 residue_chain, chain_ids, chain_starts, occupancy=None, element=None, hetero=None,
+                 residue_data=None, name=""):
+        self.coords = coords
+        self.atom_name = atom_name
+        self.serial = serial
+        self.bfactor = bfactor
+        n_atoms = len(coords)
+        self.occupancy = np.ones(n_atoms, dtype=np.float32) if occupancy is None else occupancy
+        self.element = np.full(n_atoms, "", dtype="<U2") if element is None else element
+        self.hetero = np.zeros(n_atoms, dtype=bool) if hetero is None else hetero
+        self.residue_starts = residue_starts
+        self.residue_name = residue_name
+        self.residue_number = residue_number
+        self.residue_chain = residue_chain
+        self.chain_ids = chain_ids
+        self.chain_starts = chain_starts
+        # Optional per-residue float columns such as "SASA" and "rSASA"
+        self.residue_data = {} if residue_data is None else residue_data
+        self.name = name
+        self._residue_lookup = None
+        self._atom_lookup = None
+        self._index = None
+
+    # Sizes
+
+    @property
+    def n_atoms(self) -> int:
+        return len(self.coords)
+
+    @property
+    def n_residues(self) -> int:
+        return len(self.residue_name)
+
+    @property
+    def n_chains(self) -> int:
+        return len(self.chain_ids)
+
+    # Per-atom views of the residue level columns
+
+    @property
+    def atom_residue_index(self) -> np.ndarray:
+        """Index of the residue each atom belongs to."""
+        return np.repeat(np.arange(self.n_residues), np.diff(self.residue_starts))
+
+    @property
+    def atom_chain_id(self) -> np.ndarray:
+        return self.residue_chain[self.atom_residue_index]
+
+    @property
+    def atom_residue_number(self) -> np.ndarray:
+        return self.residue_number[self.atom_residue_index]
+
+    @property
+    def atom_residue_name(self) -> np.ndarray:
+        return self.residue_name[self.atom_residue_index]
+
+    # Lookup tables
+
+    @property
+    def index(self) -> StructureIndex:
+        """Residue type, chain and residue number lookup tables, built on first use and kept."""
+        if self._index is None:
+            self._index = StructureIndex(self)
+        return self._index
+
+    def select(self, expression: str) -> list:
+        """
+        Gives the residues matching a selection expression, see pdb_index.parse_selection
+        :param expression: The selection, e.g. "chain A and resname LYS"
+        :return: A list of residue views
+        """
+        return [ResidueView(self, index) for index in self.index.select(expression).tolist()]
+
+    # Slicing helpers
+
+    def chain_index(self, chain: str) -> int:
+        """
+        Gives the position of a chain in the chain table
+        :param chain: The chain identifier
+        :return: The chain position
+        """
+        matches = np.flatnonzero(self.chain_ids == chain)
+        if len(matches) == 0:
+            raise KeyError(chain)
+        return int(matches[0])
+
+    def chain_residues(self, chain: str) -> range:
+        """
+        Gives the residue indices of a chain
+        :param chain: The chain identifier
+        :return: A range over the residue indices of the chain
+        """
+        position = self.chain_index(chain)
+        return range(int(self.chain_starts[position]), int(self.chain_starts[position + 1]))
+
+    def residue_atoms(self, residue: int) -> slice:
+        """
+        Gives the atom slice of a residue
+        :param residue: The residue index
+        :return: A slice into the per-atom arrays
+        """
+        return slice(int(self.residue_starts[residue]), int(self.residue_starts[residue + 1]))
+
+    def residue_index(self, chain: str, number: str) -> int:
+        """
+        Gives the index of a residue from its chain and residue number
+        :param chain: The chain identifier
+        :param number: The residue number as written in the file, including any insertion code
+        :return: The residue index
+        """
+        if self._residue_lookup is None:
+            self._residue_lookup = {
+                (chain_id, number_id): index
+                for index, (chain_id, number_id) in enumerate(zip(self.residue_chain.tolist(),
+                                                                  self.residue_number.tolist()))
+            }
+        return self._residue_lookup[(chain, number)]
+
+    def atom_index(self, residue: int, atom: str) -> int:
+        """
+        Gives the index of a named atom inside a residue
+        :param residue: The residue index
+        :param atom: The atom name
+        :return: The atom index
+        """
+        if self._atom_lookup is None:
+            residues = self.atom_residue_index.tolist()
+            lookup = {}
+            for index, key in enumerate(zip(residues, self.atom_name.tolist())):
+                lookup.setdefault(key, index)
+            self._atom_lookup = lookup
+        return self._atom_lookup[(residue, atom)]
+
+    def residue_view(self, residue: int) -> "ResidueView":
+        return ResidueView(self, residue)
+
+    def residues(self, chain: str = None) -> list:
+        """
+        Gives the residues of the structure, or of one chain, as residue views
+        :param chain: Optional chain identifier
+        :return: A list of residue views
+        """
+        indices = range(self.n_residues) if chain is None else self.chain_residues(chain)
+        return [ResidueView(self, index) for index in indices]
+
+    def residue_coordinates(self, residue: int) -> np.ndarray:
+        return self.coords[self.residue_atoms(residue)]
+
+    def set_residue_data(self, key: str, residue: int, value: float) -> None:
+        """
+        Stores a per-residue float annotation, creating the column on first use
+        :param key: The annotation name, for example "SASA"
+        :param residue: The residue index
+        :param value: The value to store
+        """
+        column = self.residue_data.get(key)
+        if column is None:
+            column = np.full(self.n_residues, np.nan)
+            self.residue_data[key] = column
+        column[residue] = value
+
+    # Mapping interface mirroring the legacy nested dictionary
+
+    def __getitem__(self, key):
+        if key == "chains":
+            return self.chain_ids.tolist()
+        return ChainView(self, self.chain_index(key))
+
+    def __iter__(self):
+        yield "chains"
+        yield from self.chain_ids.tolist()
+
+    def __len__(self) -> int:
+        return self.n_chains + 1
+
+    def __contains__(self, key) -> bool:
+        return key == "chains" or bool(np.any(self.chain_ids == key))
+
+    def __eq__(self, other):
+        return self is other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"Structure({self.name!r}, chains={self.n_chains}, residues={self.n_residues}, atoms={self.n_atoms})"
+
+    def residue_slice(self, start: int, stop: int) -> "Structure":
+        """
+        Gives the structure restricted to a contiguous range of residues. The arrays of the new structure are views
+        of this one, so nothing is copied (or read, for memory-mapped structures) beyond the range itself.
+        :param start: The first residue index
+        :param stop: The residue index after the last one
+        :return: The sub-structure
+        """
+        first_atom, last_atom = int(self.residue_starts[start]), int(self.residue_starts[stop])
+        atoms = slice(first_atom, last_atom)
+        first_chain = int(np.searchsorted(self.chain_starts, start, side="right")) - 1
+        last_chain = int(np.searchsorted(self.chain_starts, stop, side="left"))
+        chain_starts = np.clip(self.chain_starts[first_chain:last_chain + 1], start, stop) - start
+        return Structure(
+            self.coords[atoms], self.atom_name[atoms], self.serial[atoms], self.bfactor[atoms],
+            self.residue_starts[start:stop + 1] - first_atom, self.residue_name[start:stop],
+            self.residue_number[start:stop], self.residue_chain[start:stop],
+            self.chain_ids[first_chain:last_chain], chain_starts,
+            occupancy=self.occupancy[atoms], element=self.element[atoms], hetero=self.hetero[atoms],
+            residue_data={key: column[start:stop] for key, column in self.residue_data.items()},
+            name=self.name,
+        )
+
+    def chain_structure(self, chain: str) -> "Structure":
+        """
+        Gives one chain as a structure of its own, see residue_slice
+        :param chain: The chain identifier
+        :return: The sub-structure
+        """
+        residues = self.chain_residues(chain)
+        return self.residue_slice(residues.start, residues.stop)
+
+    # Flat array form, used by the on-disk formats
+
+    def arrays(self) -> dict:
+        """
+        Gives every column of the structure as a flat dictionary of arrays, suitable for np.savez. Per-residue
+        annotations are stored under "residue_data/<key>".
+        :return: A dictionary of numpy arrays
+        """
+        arrays = {field: getattr(self, field) for field in ARRAY_FIELDS}
+        arrays.update({f"residue_data/{key}": column for key, column in self.residue_data.items()})
+        arrays["name"] = np.array(self.name)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "Structure":
+        """
+        Rebuilds a structure from the output of Structure.arrays
+        :param arrays: A mapping of names to arrays, such as a loaded .npz file
+        :return: The structure
+        """
+        residue_data = {key.split("/", 1)[1]: np.array(arrays[key]) for key in arrays.keys()
+                        if key.startswith("residue_data/")}
+        name = str(arrays["name"]) if "name" in arrays else ""
+        return cls(**{field: arrays[field] for field in ARRAY_FIELDS}, residue_data=residue_data, name=name)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_residue_lookup"] = None
+        state["_atom_lookup"] = None
+        state["_index"] = None
+        return state
+
+
+class ChainView(Mapping):
+    """Dictionary-like view of one chain, mapping residue numbers to residue views."""
+
+    def __init__(self, structure: Structure, position: int):
+        self.structure = structure
+        self.position = position
+        self.chain_id = str(structure.chain_ids[position])
+        self.residue_range = range(int(structure.chain_starts[position]), int(structure.chain_starts[position + 1]))
+
+    def __getitem__(self, number):
+        try:
+            index = self.structure.residue_index(self.chain_id, number)
+        except KeyError:
+            raise KeyError(number) from None
+        return ResidueView(self.structure, index)
+
+    def __iter__(self):
+        yield from self.structure.residue_number[self.residue_range.start:self.residue_range.stop].tolist()
+
+    def __len__(self) -> int:
+        return len(self.residue_range)
+
+    def __repr__(self) -> str:
+        return f"ChainView({self.chain_id!r}, residues={len(self)})"
+
+
+class ResidueView(Mapping):
+    """
+    Dictionary-like view of one residue.
+
+    It answers the legacy keys ("atomlist", "resname", atom names, per-residue annotations such as "SASA") and
+    exposes the residue's coordinate block through ``coords`` so distance code can skip the per-atom lookups.
+    """
+
+    __slots__ = ("structure", "index")
+
+    def __init__(self, structure: Structure, index: int):
+        self.structure = structure
+        self.index = index
+
+    @property
+    def atoms(self) -> slice:
+        return self.structure.residue_atoms(self.index)
+
+    @property
+    def coords(self) -> np.ndarray:
+        return self.structure.coords[self.atoms]
+
+    @property
+    def chain(self) -> str:
+        return str(self.structure.residue_chain[self.index])
+
+    @property
+    def number(self) -> str:
+        return str(self.structure.residue_number[self.index])
+
+    def __getitem__(self, key):
+        structure = self.structure
+        if key == "atomlist":
+            return structure.atom_name[self.atoms].tolist()
+        if key == "resname":
+            return str(structure.residue_name[self.index])
+        if key in structure.residue_data:
+            value = structure.residue_data[key][self.index]
+            if np.isnan(value):
+                raise KeyError(key)
+            return float(value)
+        try:
+            atom = structure.atom_index(self.index, key)
+        except KeyError:
+            raise KeyError(key) from None
+        return AtomView(structure, atom)
+
+    def __setitem__(self, key, value):
+        if key in RESIDUE_KEYS or key in self["atomlist"]:
+            raise KeyError(f"{key} is read-only on a residue view")
+        self.structure.set_residue_data(key, self.index, value)
+
+    def __iter__(self):
+        yield from RESIDUE_KEYS
+        yield from dict.fromkeys(self["atomlist"])
+        for key, column in self.structure.residue_data.items():
+            if not np.isnan(column[self.index]):
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, ResidueView):
+            return self.structure is other.structure and self.index == other.index
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        return hash((id(self.structure), self.index))
+
+    def __repr__(self) -> str:
+        return f"ResidueView({self.chain!r}, {self.number!r}, {self['resname']!r})"
+
+
+class AtomView(Mapping):
+    """Dictionary-like view of one atom with the legacy "id", "bfactor", "x", "y" and "z" keys."""
+
+    __slots__ = ("structure", "index")
+
+    _KEYS = ("id", "bfactor", "x", "y", "z")
+
+    def __init__(self, structure: Structure, index: int):
+        self.structure = structure
+        self.index = index
+
+    def __getitem__(self, key):
+        structure = self.structure
+        if key == "id":
+            return str(structure.serial[self.index])
+        if key == "bfactor":
+            return f"{structure.bfactor[self.index]:.2f}"
+        if key in ("x", "y", "z"):
+            return float(structure.coords[self.index, "xyz".index(key)])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+
+def string_codes(values: np.ndarray) -> np.ndarray:
+    """
+    Maps an array of short strings to integers that sort and compare like the strings themselves.
+    :param values: A numpy string array
+    :return: An int64 array of codes
+    """
+    values = np.asarray(values, dtype=str)
+    width = values.dtype.itemsize // 4
+    if width == 0:
+        return np.zeros(len(values), dtype=np.int64)
+    if width <= 9:
+        chars = np.ascontiguousarray(values).view(np.uint32).reshape(-1, width).astype(np.int64)
+        # As many bits per character as fit in 63, enough for any code point up to three characters
+        bits = min(21, 63 // width)
+        if len(chars) == 0 or chars.max() < (1 << bits):
+            codes = np.zeros(len(values), dtype=np.int64)
+            for column in range(width):
+                codes = (codes << bits) | chars[:, column]
+            return codes
+    return np.unique(values, return_inverse=True)[1].astype(np.int64)
+
+
+def first_appearance_rank(values: np.ndarray) -> np.ndarray:
+    """
+    Numbers the distinct values of an array in order of first appearance.
+    :param values: A one-dimensional array.
+    :return: For every element, the rank of its value (0 for the first distinct value met, 1 for the next, ...).
+    """
+    _, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    return rank[inverse.ravel()]
+
+
+def runs_are_grouped(chain: np.ndarray, number: np.ndarray) -> bool:
+    """
+    Tells whether runs of atoms are already grouped by chain and by residue: every chain makes one block of runs, and
+    no residue number comes back inside a chain.
+    :param chain: The chain code of every run, see string_codes.
+    :param number: The residue number code of every run, see string_codes.
+    :return: True when no run has to be moved or merged.
+    """
+    chain_changes = np.flatnonzero(chain[1:] != chain[:-1]) + 1
+    blocks = chain[np.concatenate(([0], chain_changes))]
+    if len(np.unique(blocks)) != len(blocks):
+        return False
+    block = np.zeros(len(chain), dtype=np.int64)
+    block[chain_changes] = 1
+    block = np.cumsum(block)
+    order = np.lexsort((number, block))
+    return not ((block[order[1:]] == block[order[:-1]]) & (number[order[1:]] == number[order[:-1]])).any()
+
+
+def build_structure(coords, atom_name, serial, bfactor, chain_id, residue_number, residue_name,
+                    occupancy=None, element=None, hetero=None, dtype=np.float64, name="") -> Structure:
+    """
+    Builds a Structure from per-atom arrays.
+
+    Atoms are grouped by chain then by residue, both in order of first appearance, and the first occurrence of a
+    duplicated atom name inside a residue is kept. Consecutive atoms of the same residue are expected to be
+    adjacent, which is the case in PDB and mmCIF files; the grouping only reorders atoms when a residue is split.
+
+    :param coords: N x 3 coordinates
+    :param atom_name: N atom names
+    :param serial: N atom serial numbers
+    :param bfactor: N B-factors
+    :param chain_id: N chain identifiers
+    :param residue_number: N residue numbers, including any insertion code
+    :param residue_name: N residue names
+    :param occupancy: Optional N occupancies
+    :param element: Optional N element symbols
+    :param hetero: Optional N booleans marking HETATM records
+    :param dtype: Floating point type of the coordinate array
+    :param name: Name of the structure, usually the PDB identifier
+    :return: The Structure
+    """
+    coords = np.ascontiguousarray(np.asarray(coords, dtype=dtype).reshape(-1, 3))
+    atom_name = np.asarray(atom_name, dtype=str)
+    chain_id = np.asarray(chain_id, dtype=str)
+    residue_number = np.asarray(residue_number, dtype=str)
+    residue_name = np.asarray(residue_name, dtype=str)
+    n_atoms = len(coords)
+    columns = {
+        "serial": np.asarray(serial, dtype=np.int64),
+        "bfactor": np.asarray(bfactor, dtype=np.float32),
+        "occupancy": np.ones(n_atoms, dtype=np.float32) if occupancy is None else np.asarray(occupancy,
+                                                                                              dtype=np.float32),
+        "element": np.full(n_atoms, "", dtype="<U2") if element is None else np.asarray(element, dtype=str),
+        "hetero": np.zeros(n_atoms, dtype=bool) if hetero is None else np.asarray(hetero, dtype=bool),
+    }
+
+    if n_atoms == 0:
+        empty = np.array([], dtype="<U1")
+        return Structure(coords, atom_name, columns["serial"], columns["bfactor"], np.zeros(1, dtype=np.int64),
+                         empty, empty, empty, empty, np.zeros(1, dtype=np.int64), columns["occupancy"],
+                         columns["element"], columns["hetero"], name=name)
+
+    # Runs of consecutive atoms sharing a chain and residue number
+    changed = (chain_id[1:] != chain_id[:-1]) | (residue_number[1:] != residue_number[:-1])
+    run_starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+
+    if not runs_are_grouped(string_codes(chain_id[run_starts]), string_codes(residue_number[run_starts])):
+        # Merge runs that belong to the same residue and order residues by chain of first appearance
+        run_chain = first_appearance_rank(chain_id[run_starts])
+        run_number = np.unique(residue_number[run_starts], return_inverse=True)[1].ravel()
+        run_residue = first_appearance_rank(run_chain * (run_number.max() + 1) + run_number)
+        # Sort the runs, then expand the sorted runs back into an atom permutation
+        run_lengths = np.diff(np.append(run_starts, n_atoms))
+        run_order = np.lexsort((run_residue, run_chain))
+        sorted_lengths = run_lengths[run_order]
+        sorted_offsets = np.concatenate(([0], np.cumsum(sorted_lengths)[:-1]))
+        order = np.repeat(run_starts[run_order] - sorted_offsets, sorted_lengths) + np.arange(n_atoms)
+        coords, atom_name, chain_id, residue_number, residue_name = (
+            coords[order], atom_name[order], chain_id[order], residue_number[order], residue_name[order])
+        columns = {key: value[order] for key, value in columns.items()}
+        changed = (chain_id[1:] != chain_id[:-1]) | (residue_number[1:] != residue_number[:-1])
+        run_starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+
+    # Drop repeated atom names inside a residue, keeping the first occurrence
+    atom_residue = np.repeat(np.arange(len(run_starts)), np.diff(np.append(run_starts, n_atoms)))
+    name_codes = string_codes(atom_name)
+    # Cheap screening on a 20-bit fold of the name codes; only collisions are checked exactly
+    folded = (name_codes ^ (name_codes >> 20) ^ (name_codes >> 40)) & ((1 << 20) - 1)
+    sorted_keys = np.sort((atom_residue << 20) | folded)
+    if (sorted_keys[1:] == sorted_keys[:-1]).any():
+        order = np.lexsort((np.arange(n_atoms), name_codes, atom_residue))
+        repeated = np.zeros(n_atoms, dtype=bool)
+        repeated[order[1:]] = ((atom_residue[order[1:]] == atom_residue[order[:-1]])
+                               & (name_codes[order[1:]] == name_codes[order[:-1]]))
+    else:
+        repeated = None
+    if repeated is not None and repeated.any():
+        keep = np.flatnonzero(~repeated)
+        coords, atom_name, chain_id, residue_number, residue_name, atom_residue = (
+            coords[keep], atom_name[keep], chain_id[keep], residue_number[keep], residue_name[keep],
+            atom_residue[keep])
+        columns = {key: value[keep] for key, value in columns.items()}
+        run_starts = np.concatenate(([0], np.flatnonzero(atom_residue[1:] != atom_residue[:-1]) + 1))
+
+    residue_starts = np.append(run_starts, len(coords)).astype(np.int64)
+    residue_chain = chain_id[run_starts]
+    chain_changes = np.concatenate(([0], np.flatnonzero(residue_chain[1:] != residue_chain[:-1]) + 1))
+    chain_starts = np.append(chain_changes, len(run_starts)).astype(np.int64)
+
+    return Structure(coords, atom_name, columns["serial"], columns["bfactor"], residue_starts,
+                     residue_name[run_starts], residue_number[run_starts], residue_chain,
+                     residue_chain[chain_changes], chain_starts, columns["occupancy"], columns["element"],
+                     columns["hetero"], name=name)
+
+
+def structure_from_dict(pdb_dict: dict, name: str = "") -> Structure:
+    """
+    Converts a nested dictionary produced by the original parser (optionally annotated with per-residue values
+    such as "SASA", and with or without "reslist" keys) into a Structure.
+    :param pdb_dict: The nested dictionary
+    :param name: The name of the structure
+    :return: The structure
+    """
+    coords, atom_name, serial, bfactor, chain_id, residue_number, residue_name = [], [], [], [], [], [], []
+    annotations = []
+    for chain in pdb_dict["chains"]:
+        chain_dict = pdb_dict[chain]
+        numbers = chain_dict["reslist"] if "reslist" in chain_dict else list(chain_dict)
+        for number in numbers:
+            residue = chain_dict[number]
+            atoms = list(dict.fromkeys(residue["atomlist"]))
+            annotations.append({key: value for key, value in residue.items()
+                                if key not in RESIDUE_KEYS and key not in atoms and isinstance(value, float)})
+            for atom in atoms:
+                coords.append((residue[atom]["x"], residue[atom]["y"], residue[atom]["z"]))
+                atom_name.append(atom)
+                serial.append(int(residue[atom]["id"]))
+                bfactor.append(float(residue[atom]["bfactor"]))
+                chain_id.append(chain)
+                residue_number.append(number)
+                residue_name.append(residue["resname"])
+
+    structure = build_structure(
+        np.array(coords, dtype=np.float64).reshape(-1, 3), np.array(atom_name, dtype=str),
+        np.array(serial, dtype=np.int64), np.array(bfactor, dtype=np.float32), np.array(chain_id, dtype=str),
+        np.array(residue_number, dtype=str), np.array(residue_name, dtype=str), name=name,
+    )
+    # Residues keep the order of the dictionary, which is already grouped by chain
+    for index, values in enumerate(annotations):
+        for key, value in values.items():
+            structure.set_residue_data(key, index, value)
+    return structure
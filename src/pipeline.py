@@ -0,0 +1,174 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+import pdb_parser
+
+# Structures waiting between two stages. With the structures being worked on by every stage, this bounds the
+# number held in memory whatever the size of the corpus.
+QUEUE_SIZE = 8
+# Files read at the same time
+READERS = 4
+# Marks the end of the items of a queue
+_END = object()
+
+
+def _plot(row: dict, directory: str) -> dict:
+    """
+    Draws the heat map of the contacts of an analysed structure, in a worker process of the plotting stage. The
+    heat map renderer of visualizations is created once per process and reused.
+    :param row: The result row, holding the atom mode contacts under the "contacts" key.
+    :param directory: The directory receiving the heat maps.
+    :return: The row without its contacts, with the heat map file under the "heatmap" key.
+    """
+    contacts = row.pop("contacts")
+    try:
+        import visualizations
+
+        output = os.path.join(directory, f"{row['structure']}_{row['chain_one']}_{row['chain_two']}_heatmap.png")
+        visualizations.heat_mapper(contacts, f"chain {row['chain_one']}", f"chain {row['chain_two']}", output)
+        row["heatmap"] = output
+    except Exception as error:
+        row["error"] = f"{type(error).__name__}: {error}"
+    return row
+
+
+async def _consume(inbox: asyncio.Queue, work):
+    """Runs work on the items of a queue until its end marker, which is put back for the other consumers."""
+    while True:
+        item = await inbox.get()
+        if item is _END:
+            inbox.put_nowait(_END)
+            return
+        await work(item)
+
+
+async def _stage(count: int, inbox: asyncio.Queue, work, outbox: asyncio.Queue):
+    """Runs count consumers of a queue, then marks the end of the next queue."""
+    await asyncio.gather(*(_consume(inbox, work) for _ in range(count)))
+    await outbox.put(_END)
+
+
+async def run_pipeline(files: list, output: str, fmt: str = None, workers: int = None, plot_dir: str = None,
+                       plot_workers: int = 1, queue_size: int = QUEUE_SIZE, readers: int = READERS,
+                       resume: bool = True, progress: bool = True, **options) -> list:
+    """
+    Analyses many structures like batch.run_batch, as a pipeline of stages connected by bounded queues so that
+    reading, analysis and plotting of different structures overlap:
+
+    - read: files (plain or gzipped) are read by ``readers`` threads, without blocking the event loop;
+    - analyse: parsing, counts, contacts and SASA (batch.analyze_structure) run in a pool of ``workers`` processes;
+    - plot: when plot_dir is given, the heat map of the atom mode contacts is drawn in a pool of ``plot_workers``
+      processes;
+    - write: rows are written to the output as they complete.
+
+    A stage waits when the queue after it is full, so a slow stage holds back the reads instead of letting
+    structures pile up in memory.
+
+    :param files: The structure files.
+    :param output: The result file.
+    :param fmt: The output format, see batch.sink_format.
+    :param workers: The number of analysis processes. Defaults to the number of CPUs.
+    :param plot_dir: Optional directory receiving a contact heat map per structure.
+    :param plot_workers: The number of plotting processes.
+    :param queue_size: The number of structures waiting between two stages.
+    :param readers: The number of files read at the same time.
+    :param resume: Whether files already recorded without error in the output are skipped. Otherwise the output is
+    overwritten.
+    :param progress: Whether progress is reported on stderr.
+    :param options: Keyword arguments of batch.analyze_structure.
+    :return: The rows produced by this run, in completion order.
+    """
+    fmt = batch.sink_format(output, fmt)
+    if not resume and os.path.exists(output):
+        os.remove(output)
+    done = batch.completed_files(output, fmt) if resume else set()
+    pending = [file for file in files if batch.input_key(file) not in done]
+    if progress and done:
+        print(f"Resuming: {len(files) - len(pending)} of {len(files)} structures already completed", file=sys.stderr)
+    workers = workers or os.cpu_count()
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+    options = dict(options, keep_contacts=plot_dir is not None)
+
+    loop = asyncio.get_running_loop()
+    loaded, analysed, plotted = (asyncio.Queue(queue_size) for _ in range(3))
+    sink = batch.SINKS[fmt](output, batch.result_columns(options.get("thresholds", tuple(range(1, 11))),
+                                                        options.get("aa", "LYS"), options.get("sasa", True)))
+    executor = ProcessPoolExecutor(max_workers=workers)
+    plot_executor = ProcessPoolExecutor(max_workers=plot_workers) if plot_dir is not None else None
+    rows = []
+    remaining = iter(pending)
+    start = time.perf_counter()
+
+    async def read():
+        for file in remaining:
+            try:
+                data = await asyncio.to_thread(pdb_parser.read_data, file)
+            except OSError as error:
+                await loaded.put({"structure": batch.structure_name(file), "file": file,
+                                  "error": f"{type(error).__name__}: {error}"})
+                continue
+            await loaded.put((file, data))
+
+    async def analyse(item):
+        if isinstance(item, tuple):
+            file, data = item
+            item = await loop.run_in_executor(executor, batch._safe_analyze, file, dict(options, data=data))
+        await analysed.put(item)
+
+    async def plot(row):
+        if "contacts" in row:
+            row = await loop.run_in_executor(plot_executor, _plot, row, plot_dir)
+        await plotted.put(row)
+
+    async def write(row):
+        sink.write(row)
+        rows.append(row)
+        if progress:
+            status = row["error"] if row.get("error") else f"{row['atoms']} atoms"
+            print(f"[{len(rows)}/{len(pending)}] {row['structure']}: {status}", file=sys.stderr)
+
+    async def readers_stage():
+        await asyncio.gather(*(read() for _ in range(readers)))
+        await loaded.put(_END)
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(readers_stage())
+            group.create_task(_stage(workers, loaded, analyse, analysed))
+            if plot_executor is not None:
+                group.create_task(_stage(plot_workers, analysed, plot, plotted))
+                group.create_task(_consume(plotted, write))
+            else:
+                group.create_task(_consume(analysed, write))
+    finally:
+        sink.close()
+        executor.shutdown(cancel_futures=True)
+        if plot_executor is not None:
+            plot_executor.shutdown(cancel_futures=True)
+    if progress and rows:
+        print(batch.throughput_report(rows, time.perf_counter() - start), file=sys.stderr)
+    return rows
+
+
+def main(argv: list = None):
+    parser = batch.argument_parser("Pipelined analysis of PDB files: reading, analysis and plotting overlap.")
+    parser.add_argument("--plot-dir", help="Draw the contact heat map of every structure into this directory.")
+    parser.add_argument("--plot-workers", type=int, default=1, help="The number of plotting processes.")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="The number of structures waiting between two stages.")
+    parser.add_argument("--readers", type=int, default=READERS, help="The number of files read at the same time.")
+    args = parser.parse_args(argv)
+
+    files, thresholds = batch.parse_inputs(parser, args)
+    asyncio.run(run_pipeline(files, args.output, args.format, args.workers, args.plot_dir, args.plot_workers,
+                             args.queue_size, args.readers, args.resume, chains=args.chains, thresholds=thresholds,
+                             aa=args.aa, sasa=args.sasa))
+
+
+if __name__ == "__main__":
+    main()
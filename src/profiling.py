@@ -0,0 +1,267 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import pstats
+import time
+import tracemalloc
+
+# Innermost open stage of the profiler active in this thread or task; None when nothing is being profiled
+_current = contextvars.ContextVar("profiling_stage", default=None)
+# Number of functions listed from the cProfile capture
+CPROFILE_TOP = 30
+LOGGER_NAME = "pdb_profile"
+
+
+class _Stage:
+    """One open stage of a Profiler: where it sits in the call tree and what it has accumulated so far."""
+    __slots__ = ("profiler", "path", "start", "base", "peak", "counters")
+
+    def __init__(self, profiler, path: str):
+        self.profiler = profiler
+        self.path = path
+        self.counters = {}
+        self.base = self.peak = 0
+        if profiler.memory:
+            self.base = self.peak = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+
+    def open(self, name: str):
+        """Opens a stage nested in this one."""
+        if self.profiler.memory:
+            # The peak reached so far belongs to this stage, the nested one starts from the current usage
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        path = f"{self.path}/{name}" if self.path else name
+        self.profiler._entry(path)
+        return _Stage(self.profiler, path)
+
+    def close(self, parent):
+        """Records this stage in its profiler and hands its peak memory to the enclosing stage."""
+        seconds = time.perf_counter() - self.start
+        if self.profiler.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            parent.peak = max(parent.peak, self.peak)
+        self.profiler._record(self.path, seconds, self.peak - self.base, self.counters)
+
+
+class Profiler:
+    """
+    Collects the time, peak memory and counters of the stages run while it is active.
+
+    Stages are opened by the ``timed`` decorator on the public functions of the pipeline and by the ``stage``
+    context manager; nested stages are recorded under their path, e.g. "compute_sasa/parse_pdb". Calls of the same
+    stage are aggregated. Outside of an active Profiler, stages and counters cost one context variable lookup.
+
+        with Profiler("1brs", memory=True) as profiler:
+            structure = compute_sasa("1brs.pdb")
+        profiler.to_json("1brs_profile.json")
+    """
+
+    def __init__(self, name: str = "", memory: bool = False, cprofile: bool = False):
+        """
+        :param name: The name of the profiled run, e.g. the structure analysed.
+        :param memory: Whether the peak traced memory of every stage is measured with tracemalloc (slows Python
+        allocations down while active).
+        :param cprofile: Whether the whole run is also captured with cProfile.
+        """
+        self.name = name
+        self.memory = memory
+        self.cprofile = cprofile
+        self.stages = {}
+        self.seconds = None
+        self.peak_bytes = None
+        self.counters = {}
+        self._root = None
+        self._token = None
+        self._tracing = False
+        self._profile = None
+
+    def __enter__(self):
+        if self.memory:
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._root = _Stage(self, "")
+        self._token = _current.set(self._root)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+        root = self._root
+        self.seconds = time.perf_counter() - root.start
+        self.counters = root.counters
+        if self._profile is not None:
+            self._profile.disable()
+        if self.memory:
+            self.peak_bytes = max(root.peak, tracemalloc.get_traced_memory()[1]) - root.base
+            if self._tracing:
+                tracemalloc.stop()
+        return False
+
+    def _entry(self, path: str) -> dict:
+        entry = self.stages.get(path)
+        if entry is None:
+            entry = self.stages[path] = {"stage": path, "calls": 0, "seconds": 0.0, "counters": {}}
+            if self.memory:
+                entry["peak_bytes"] = 0
+        return entry
+
+    def _record(self, path: str, seconds: float, peak_bytes: int, counters: dict):
+        entry = self._entry(path)
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        if self.memory:
+            entry["peak_bytes"] = max(entry["peak_bytes"], peak_bytes)
+        for key, value in counters.items():
+            entry["counters"][key] = entry["counters"].get(key, 0) + value
+
+    def cprofile_stats(self, top: int = CPROFILE_TOP) -> list:
+        """
+        Gives the functions that took the most cumulative time in the cProfile capture.
+        :param top: The number of functions listed.
+        :return: One dictionary per function, empty without a capture.
+        """
+        if self._profile is None:
+            return []
+        stats = pstats.Stats(self._profile).stats
+        rows = [{"function": f"{file}:{line}({function})", "calls": calls, "total_seconds": total,
+                 "cumulative_seconds": cumulative}
+                for (file, line, function), (_, calls, total, cumulative, _) in stats.items()]
+        return sorted(rows, key=lambda row: row["cumulative_seconds"], reverse=True)[:top]
+
+    def to_dict(self) -> dict:
+        """
+        Gives the profile as plain data.
+        :return: The run name, its total time, peak memory and counters, the stages in the order they were first
+        entered, and the cProfile summary when captured.
+        """
+        result = {"name": self.name, "seconds": self.seconds, "counters": dict(self.counters),
+                  "stages": [dict(entry, counters=dict(entry["counters"])) for entry in self.stages.values()]}
+        if self.memory:
+            result["peak_bytes"] = self.peak_bytes
+        if self._profile is not None:
+            result["cprofile"] = self.cprofile_stats()
+        return result
+
+    def to_json(self, file: str = None) -> str:
+        """
+        Serialises the profile as JSON.
+        :param file: Optional file the JSON is written to.
+        :return: The JSON text.
+        """
+        text = json.dumps(self.to_dict(), indent=1)
+        if file is not None:
+            with open(file, "w") as f:
+                f.write(text)
+        return text
+
+    def log(self, logger: logging.Logger = None, level: int = logging.INFO):
+        """
+        Emits one structured log record per stage, the stage data being both the JSON message and the "profile"
+        attribute of the record.
+        :param logger: The logger. Defaults to the "pdb_profile" logger.
+        :param level: The logging level.
+        """
+        logger = logger or logging.getLogger(LOGGER_NAME)
+        for entry in self.stages.values():
+            record = dict(entry, name=self.name)
+            logger.log(level, json.dumps(record), extra={"profile": record})
+
+    def report(self) -> str:
+        """
+        Formats the stages as a table.
+        :return: The text of the table.
+        """
+        lines = [f"{self.name or 'profile'}: {self.seconds or 0:.4f} s"
+                 + (f", peak {self.peak_bytes / 2 ** 20:.1f} MiB" if self.peak_bytes is not None else "")]
+        for entry in self.stages.values():
+            depth = entry["stage"].count("/")
+            memory = f" {entry['peak_bytes'] / 2 ** 20:9.1f} MiB" if "peak_bytes" in entry else ""
+            counters = " ".join(f"{key}={value}" for key, value in entry["counters"].items())
+            lines.append(f"  {'  ' * depth}{entry['stage'].rsplit('/', 1)[-1]:<{36 - 2 * depth}}"
+                         f"{entry['calls']:6d} x {entry['seconds']:9.4f} s{memory} {counters}".rstrip())
+        return "\n".join(lines)
+
+
+def active() -> Profiler:
+    """
+    Gives the profiler collecting stages in this thread or task.
+    :return: The Profiler, or None.
+    """
+    current = _current.get()
+    return None if current is None else current.profiler
+
+
+@contextlib.contextmanager
+def stage(name: str, **counters):
+    """
+    Times a block of code as a stage of the active profiler; does nothing when no profiler is active.
+    :param name: The stage name.
+    :param counters: Initial counters of the stage, e.g. atoms=structure.n_atoms.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield
+        return
+    current = parent.open(name)
+    current.counters.update(counters)
+    token = _current.set(current)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        current.close(parent)
+
+
+def timed(name=None):
+    """
+    Decorator making every call of a function a stage of the active profiler.
+
+        @timed
+        def parse_pdb(file): ...
+
+        @timed("sasa")
+        def residue_sasa(file): ...
+
+    :param name: The stage name. Defaults to the name of the function.
+    """
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            parent = _current.get()
+            if parent is None:
+                return function(*args, **kwargs)
+            current = parent.open(label)
+            token = _current.set(current)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                current.close(parent)
+        return wrapper
+
+    if callable(name):
+        function, name = name, None
+        return decorate(function)
+    return decorate
+
+
+def count(**counters):
+    """
+    Adds to the counters of the current stage, e.g. count(atoms=structure.n_atoms, pairs=len(contacts.first)); does
+    nothing when no profiler is active.
+    :param counters: The amounts added, by counter name.
+    """
+    current = _current.get()
+    if current is not None:
+        for key, value in counters.items():
+            current.counters[key] = current.counters.get(key, 0) + int(value)
@@ -1,58 +1,354 @@
-import os
+import functools
 import pickle
+import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint
 
 import freesasa
+import numpy as np
+
+import geometry
 import pdb_parser
-import pdb_analyzer
+from cache import default_cache
+from pdb_structure import Structure
+from profiling import count, timed
+
+# Version of the SASA results computed from parsed structures, part of their cache keys
+SASA_VERSION = 2
+SASA_ALGORITHMS = {"lee-richards": freesasa.LeeRichards, "shrake-rupley": freesasa.ShrakeRupley}
+# Parameter setting the resolution of each algorithm: slices per atom, or test points per atom
+_RESOLUTION_PARAMETER = {"lee-richards": "n-slices", "shrake-rupley": "n-points"}
+_HYDROGENS = ("H", "D")
+# Two-atom computation with two threads; freesasa builds without thread support crash on it instead of failing
+_THREAD_PROBE = """
+import freesasa
+structure = freesasa.Structure()
+structure.addAtom(" CA ", "ALA", "1", "A", 0.0, 0.0, 0.0)
+structure.addAtom(" CB ", "ALA", "1", "A", 1.5, 0.0, 0.0)
+freesasa.calc(structure, freesasa.Parameters({"n-threads": 2}))
+"""
 
 
-def compute_sasa(pdb_file):
+@functools.lru_cache(maxsize=None)
+def threads_supported():
     """
-    Computes the Solvent Accessible Surface Area (SASA) for each residue in a protein structure.
+    Tells whether the installed freesasa computes with more than one thread. A build without thread support logs an
+    error and crashes the interpreter, so the check runs once in a separate process.
+
+    Returns:
+    - supported (bool): Whether sasa_parameters accepts threads > 1.
+    """
+    return subprocess.run([sys.executable, "-c", _THREAD_PROBE], capture_output=True).returncode == 0
+
+
+def sasa_parameters(algorithm: str = "lee-richards", resolution: int = None, probe_radius: float = 1.4,
+                    threads: int = 1):
+    """
+    Builds the freesasa settings of a SASA computation.
+
+    Args:
+    - algorithm (str): "lee-richards" or "shrake-rupley".
+    - resolution (int): Slices per atom (Lee & Richards, default 20) or test points per atom (Shrake & Rupley,
+      default 100).
+    - probe_radius (float): The probe radius in angstroms.
+    - threads (int): The number of threads freesasa uses. Only builds of freesasa with thread support accept more
+      than one (see threads_supported); otherwise parallelise over structures with sasa_many.
+
+    Returns:
+    - parameters (freesasa.Parameters): The settings.
+    """
+    if algorithm not in SASA_ALGORITHMS:
+        raise ValueError(f"Algorithm must be one of {', '.join(SASA_ALGORITHMS)}.")
+    if threads < 1:
+        raise ValueError("The number of threads must be at least 1.")
+    if threads > 1 and not threads_supported():
+        raise ValueError(f"The installed freesasa does not support threads (threads={threads}); use threads=1 and "
+                         f"parallelise over structures with sasa_many.")
+    settings = {"algorithm": SASA_ALGORITHMS[algorithm], "probe-radius": probe_radius, "n-threads": threads}
+    if resolution is not None:
+        settings[_RESOLUTION_PARAMETER[algorithm]] = resolution
+    return freesasa.Parameters(settings)
+
+
+def _freesasa_input(structure):
+    """
+    Builds the freesasa structure of the heavy atoms of a parsed structure, without reading the file again.
+
+    Args:
+    - structure (Structure): The parsed structure.
+
+    Returns:
+    - fs (freesasa.Structure): The atoms, with the radii of the default classifier.
+    - atoms (np.ndarray): The index in the structure of every atom of fs.
+    """
+    atoms = np.flatnonzero(~np.isin(geometry.atom_elements(structure), _HYDROGENS))
+    residue_of_atom = np.repeat(np.arange(structure.n_residues), np.diff(structure.residue_starts))[atoms]
+    chain_of_residue = np.repeat(structure.chain_ids, np.diff(structure.chain_starts))
+    # freesasa guesses elements from PDB-formatted (four character, element-aligned) atom names
+    names = structure.atom_name[atoms]
+    elements = np.char.strip(structure.element[atoms])
+    aligned = (np.char.str_len(names) < 4) & (np.char.str_len(elements) <= 1)
+    names = np.char.ljust(np.where(aligned, np.char.add(" ", names), names), 4)
+    coords = structure.coords[atoms].astype(np.float64, copy=False)
+    fs = freesasa.Structure()
+    fs.addAtoms(names.tolist(), structure.residue_name[residue_of_atom].tolist(),
+                structure.residue_number[residue_of_atom].tolist(), chain_of_residue[residue_of_atom].tolist(),
+                coords[:, 0].tolist(), coords[:, 1].tolist(), coords[:, 2].tolist())
+    return fs, atoms
+
+
+def _residue_totals(structure, atoms, areas):
+    """Sums the areas of a subset of atoms over every residue of the structure."""
+    residue_of_atom = np.repeat(np.arange(structure.n_residues), np.diff(structure.residue_starts))
+    return np.bincount(residue_of_atom[atoms], weights=areas, minlength=structure.n_residues)
+
+
+def _atom_areas(result):
+    return np.array([result.atomArea(i) for i in range(result.nAtoms())], dtype=np.float64)
+
+
+def _residue_labels(structure):
+    """Gives the chain and residue number of every residue of the structure."""
+    chains = np.repeat(structure.chain_ids, np.diff(structure.chain_starts)).astype(str)
+    return chains, structure.residue_number.astype(str)
+
+
+@timed
+def structure_sasa(structure, parameters=None):
+    """
+    Computes the SASA of every residue of an already parsed structure, building the freesasa input from its
+    coordinates instead of parsing the file a second time. Hydrogens are ignored, as freesasa does by default.
+
+    Args:
+    - structure (Structure): The parsed structure, e.g. from pdb_parser.parse_pdb(file, hetatm=False).
+    - parameters (freesasa.Parameters): The settings, see sasa_parameters. Defaults to freesasa's.
+
+    Returns:
+    - areas (dict): Arrays "chain", "residue", "SASA" (absolute) and "rSASA" (relative, NaN for residue types
+      without reference area), aligned with the residues of the structure.
+    """
+    chains, residues = _residue_labels(structure)
+    fs, atoms = _freesasa_input(structure)
+    total = np.zeros(structure.n_residues)
+    relative = np.full(structure.n_residues, np.nan)
+    if len(atoms):
+        result = freesasa.calc(fs, parameters) if parameters is not None else freesasa.calc(fs)
+        total = _residue_totals(structure, atoms, _atom_areas(result))
+        reference = result.residueAreas()
+        for position, (chain, residue) in enumerate(zip(chains.tolist(), residues.tolist())):
+            area = reference.get(chain, {}).get(residue)
+            if area is not None and area.hasRelativeAreas:
+                relative[position] = area.relativeTotal
+    count(atoms=len(atoms), residues=structure.n_residues)
+    return {'chain': chains, 'residue': residues, 'SASA': total, 'rSASA': relative}
+
+
+@timed
+def interface_sasa(structure, groups=None, parameters=None):
+    """
+    Computes the SASA of every residue in the complex and with its chains isolated, and the area buried at the
+    interfaces (delta SASA), in one call: the freesasa input and radii are built once and reused for every
+    isolated group.
+
+    Args:
+    - structure (Structure): The parsed complex.
+    - groups (list): The partners, each a chain identifier or a list of chain identifiers, e.g. ["A", "D"] or
+      [["A", "B"], ["C"]]. Defaults to every chain on its own. Residues of chains in no group keep their complex
+      area when isolated.
+    - parameters (freesasa.Parameters): The settings, see sasa_parameters.
+
+    Returns:
+    - areas (dict): Arrays "chain", "residue", "complex", "isolated" and "delta" (isolated - complex), aligned with
+      the residues of the structure.
+    """
+    chains, residues = _residue_labels(structure)
+    groups = [[chain] for chain in structure.chain_ids.tolist()] if groups is None else \
+        [[group] if isinstance(group, str) else list(group) for group in groups]
+    fs, atoms = _freesasa_input(structure)
+    complex_areas = isolated_areas = np.zeros(0)
+    if len(atoms):
+        coords = structure.coords[atoms].astype(np.float64)
+        radii = np.array([fs.radius(i) for i in range(fs.nAtoms())])
+        complex_areas = _atom_areas(freesasa.calcCoord(coords.ravel(), radii, parameters))
+        isolated_areas = complex_areas.copy()
+        chain_of_atom = np.repeat(np.repeat(structure.chain_ids, np.diff(structure.chain_starts)),
+                                  np.diff(structure.residue_starts))[atoms]
+        for group in groups:
+            members = np.flatnonzero(np.isin(chain_of_atom, group))
+            if len(members):
+                result = freesasa.calcCoord(coords[members].ravel(), radii[members], parameters)
+                isolated_areas[members] = _atom_areas(result)
+    complex_total = _residue_totals(structure, atoms, complex_areas)
+    isolated_total = _residue_totals(structure, atoms, isolated_areas)
+    count(atoms=len(atoms), residues=structure.n_residues, groups=len(groups))
+    return {'chain': chains, 'residue': residues, 'complex': complex_total, 'isolated': isolated_total,
+            'delta': isolated_total - complex_total}
+
+
+def _file_sasa(pdb_file, settings):
+    """Parses a file and computes its residue SASA, in a worker process."""
+    structure = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    return structure_sasa(structure, sasa_parameters(**settings))
+
+
+def sasa_many(pdb_files, workers=None, **settings):
+    """
+    Computes the residue SASA of many structures across a process pool, one structure per task.
+
+    Args:
+    - pdb_files (list): The PDB files.
+    - workers (int): The number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    - settings: Keyword arguments of sasa_parameters.
+
+    Returns:
+    - areas (list): The per-residue SASA arrays of every file, see structure_sasa, in the order of pdb_files.
+    """
+    if workers == 1:
+        return [_file_sasa(pdb_file, settings) for pdb_file in pdb_files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_file_sasa, pdb_files, [settings] * len(pdb_files)))
+
+
+@timed
+def residue_sasa(pdb_file):
+    """
+    Computes the Solvent Accessible Surface Area (SASA) of every residue with freesasa. Compressed and mmCIF files,
+    which freesasa cannot open, are parsed and computed with structure_sasa.
 
     Args:
     - pdb_file (str): Path to the PDB file to analyze.
 
     Returns:
-    - d_pdb (dict): Updated dictionary with SASA information for each residue.
+    - areas (dict): Parallel arrays "chain", "residue" (residue number as written in the file), "SASA" (absolute)
+      and "rSASA" (relative), one entry per residue.
+    """
+    if pdb_parser.compression(pdb_file) or pdb_parser.is_mmcif(pdb_file):
+        return structure_sasa(pdb_parser.parse_pdb(pdb_file, hetatm=False))
+    structure = freesasa.Structure(pdb_file)
+    outASA = freesasa.calc(structure)
+    sasa = outASA.residueAreas()
+    rows = [(ch, res, area.total, area.relativeTotal) for ch in sasa for res, area in sasa[ch].items()]
+    chains, residues, total, relative = zip(*rows) if rows else ((), (), (), ())
+    count(atoms=structure.nAtoms(), residues=len(rows))
+    return {
+        'chain': np.array(chains, dtype=str),
+        'residue': np.array(residues, dtype=str),
+        'SASA': np.array(total, dtype=np.float64),
+        'rSASA': np.array(relative, dtype=np.float64),
+    }
+
+
+def annotate_sasa(d_pdb, areas):
     """
+    Stores per-residue SASA values on a parsed structure.
+
+    Args:
+    - d_pdb (Structure or dict): The parsed structure.
+    - areas (dict): Per-residue SASA arrays, as returned by residue_sasa.
+
+    Returns:
+    - common_chains (set): The chains present both in the structure and in the SASA results.
+    """
+    pdb_chains = set(d_pdb['chains'])
+    common_chains = set(areas['chain'].tolist()) & pdb_chains
+    if isinstance(d_pdb, Structure) and _aligned(d_pdb, areas):
+        # Areas computed from this structure map one to one onto its residues
+        d_pdb.residue_data['rSASA'] = np.asarray(areas['rSASA'], dtype=np.float64).copy()
+        d_pdb.residue_data['SASA'] = np.asarray(areas['SASA'], dtype=np.float64).copy()
+        return common_chains
+    for ch, res, total, relative in zip(areas['chain'].tolist(), areas['residue'].tolist(), areas['SASA'].tolist(),
+                                        areas['rSASA'].tolist()):
+        if ch in pdb_chains and res in d_pdb[ch]:
+            d_pdb[ch][res]['rSASA'] = relative  # Relative SASA
+            d_pdb[ch][res]['SASA'] = total  # Absolute SASA
+    return common_chains
 
-    # Extract the base name of the PDB file without the extension
-    rootname = os.path.basename(pdb_file).split(".")[0]
 
-    # Define the output file name for the serialized data
-    outfile = os.path.splitext(pdb_file)[0] + ".pkl"
-    print(f"Processing PDB file: {pdb_file} -> Output: {outfile}")
+def _aligned(structure, areas):
+    """Tells whether per-residue SASA arrays list exactly the residues of a structure, in order."""
+    if len(areas['residue']) != structure.n_residues:
+        return False
+    chains, residues = _residue_labels(structure)
+    return bool(np.array_equal(areas['chain'], chains) and np.array_equal(areas['residue'], residues))
+
+
+def sasa_threshold_counts(values, thresholds, chains=None):
+    """
+    Counts the residues whose SASA is strictly below each threshold, overall and per chain, in one pass: every
+    residue is placed among the sorted thresholds with searchsorted and the counts are cumulative sums of the bins.
+
+    Args:
+    - values (np.ndarray): Per-residue SASA, absolute (e.g. areas['SASA'] or structure.residue_data['SASA']) or
+      relative ('rSASA'), in the unit of the thresholds. NaN values are never counted.
+    - thresholds (list): The thresholds, in any order.
+    - chains (np.ndarray): Optional chain identifier of every residue, e.g. areas['chain'].
+
+    Returns:
+    - counts (dict): {"all": counts} and, with chains, {chain: counts} for every chain, each an int array with one
+      count per threshold.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    order = np.argsort(thresholds, kind="stable")
+    # Number of thresholds at or below every value: the residue is counted for all the later ones
+    bins = np.searchsorted(thresholds[order], values, side="right")
+    bins[np.isnan(values)] = len(thresholds)
+    labels, chain_of_residue = np.unique(np.asarray(chains if chains is not None else np.zeros(len(values), dtype=str)),
+                                         return_inverse=True)
+    counts = np.bincount(chain_of_residue.reshape(-1) * (len(thresholds) + 1) + bins,
+                         minlength=len(labels) * (len(thresholds) + 1)).reshape(len(labels), len(thresholds) + 1)
+    below = np.empty((len(labels), len(thresholds)), dtype=np.int64)
+    below[:, order] = np.cumsum(counts, axis=1)[:, :len(thresholds)]
+    result = {"all": below.sum(axis=0)}
+    if chains is not None:
+        result.update(zip(labels.tolist(), below))
+    return result
+
+
+@timed
+def compute_sasa(pdb_file, cache=None, outfile=None, **settings):
+    """
+    Computes the Solvent Accessible Surface Area (SASA) for each residue in a protein structure.
+
+    Parsing and SASA results are read from the content-addressed cache when the same file was processed before, so
+    nothing is written next to the input unless a pickle file is asked for.
+
+    Args:
+    - pdb_file (str): Path to the PDB file to analyze.
+    - cache (StructureCache): The cache to use. Defaults to the shared cache of the process.
+    - outfile (str): Optional file receiving the annotated Structure as a pickle, e.g. for pdb_binary.convert.
+    - settings: Keyword arguments of sasa_parameters (algorithm, resolution, probe_radius, threads).
+
+    Returns:
+    - d_pdb (Structure): Updated structure with SASA information for each residue.
+    """
+    cache = cache or default_cache()
+    print(f"Processing PDB file: {pdb_file}")
 
     # Parse the PDB file to get a dictionary representation of the structure
-    d_pdb = pdb_parser.pdb_parser_optimized(pdb_file)
+    d_pdb = cache.parse_pdb(pdb_file, hetatm=False)
 
-    # Use freesasa to calculate SASA for the structure
-    strpdb = freesasa.Structure(pdb_file)
-    outASA = freesasa.calc(strpdb)
-    sasa = outASA.residueAreas()
+    # Use freesasa to calculate SASA from the parsed coordinates
+    areas = cache.residue_sasa(pdb_file, structure=d_pdb, **settings)
 
     # Get the chains present in both the parsed structure and the SASA results
     pdb_chains = set(d_pdb['chains'])
-    sasa_chains = set(sasa.keys())
-    common_chains = sasa_chains & pdb_chains
+    sasa_chains = set(areas['chain'].tolist())
+
+    # Update the parsed structure with SASA information for each residue
+    common_chains = annotate_sasa(d_pdb, areas)
 
     # Warn if there's a mismatch in the chains between the parsed structure and SASA results
     if common_chains != sasa_chains or common_chains != pdb_chains:
         print(f"WARNING: Not all chains have SASA ({', '.join(common_chains)} out of {', '.join(pdb_chains)})")
 
-    # Update the parsed structure dictionary with SASA information for each residue
-    for ch in common_chains:
-        for res in d_pdb[ch]:
-            if res in sasa[ch]:
-                d_pdb[ch][res]['rSASA'] = sasa[ch][res].relativeTotal  # Relative SASA
-                d_pdb[ch][res]['SASA'] = sasa[ch][res].total  # Absolute SASA
-
-    # Serialize the updated dictionary to a file for later use
-    pickle.dump(d_pdb, open(outfile, 'wb'))
+    # Serialize the updated structure to a file for later use, when asked to
+    if outfile is not None:
+        with open(outfile, 'wb') as f:
+            pickle.dump(d_pdb, f)
     print("SASA calculation successful!")
+    return d_pdb
 
 
 if __name__ == "__main__":
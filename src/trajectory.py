@@ -0,0 +1,250 @@
+from typing import NamedTuple
+
+import numpy as np
+
+import contact_engine
+import pdb_parser
+import pdb_stream
+from contact_engine import ResidueContacts
+from pdb_structure import Structure
+from profiling import count, timed
+
+# Default extra distance searched around the cutoff when the neighbour list is built
+DEFAULT_SKIN = 2.0
+# Fraction of moved points above which the neighbour list is rebuilt from scratch instead of patched
+REBUILD_FRACTION = 0.25
+
+
+class ContactFrequency(NamedTuple):
+    """
+    Sparse contact counts across frames: for every residue pair in contact in at least one frame, its index in the
+    first and second selection and the number of frames it was in contact, sorted by first then second index.
+    """
+    first: np.ndarray
+    second: np.ndarray
+    frames: np.ndarray
+    n_frames: int
+    shape: tuple
+
+    def fraction(self) -> np.ndarray:
+        """
+        Gives the fraction of frames in which every pair is in contact.
+        :return: One value per pair.
+        """
+        return self.frames / max(self.n_frames, 1)
+
+    def matrix(self) -> np.ndarray:
+        """
+        Gives the contact frequency map.
+        :return: A dense first x second array of fractions, 0 for pairs never in contact.
+        """
+        frequency = np.zeros(self.shape)
+        frequency[self.first, self.second] = self.fraction()
+        return frequency
+
+
+def _residue_indices(topology: Structure, selection) -> np.ndarray:
+    """Resolves a residue selection: None for every residue, a selection expression or residue indices."""
+    if selection is None:
+        return np.arange(topology.n_residues)
+    if isinstance(selection, str):
+        return topology.index.select(selection)
+    return np.asarray(selection, dtype=np.int64)
+
+
+class TrajectoryContacts:
+    """
+    Residue-residue contacts over successive coordinate frames of a fixed topology (trajectory snapshots, NMR models).
+
+    A Verlet neighbour list holds every pair of points (atoms, or residue centroids in centroid mode) closer than
+    cutoff + skin at their reference positions. While no point has moved more than skin / 2 from its reference
+    position, the list contains every pair that can be closer than the cutoff, so a frame only evaluates the listed
+    pairs. Points that move further are re-searched on their own and their pairs replaced; the list is rebuilt when
+    more than REBUILD_FRACTION of the points moved. Every frame gives exactly the contacts of
+    contact_engine.residue_distances on the same coordinates.
+
+        contacts = TrajectoryContacts(topology, "chain A", "chain D", cutoff=8.0)
+        for frame in contacts.run(frames):
+            ...
+        frequency = contacts.frequency()
+    """
+
+    def __init__(self, topology: Structure, first=None, second=None, cutoff: float = 8.0, skin: float = DEFAULT_SKIN,
+                 mode: str = "atom"):
+        """
+        :param topology: The structure whose atoms every frame gives coordinates for, in the same order.
+        :param first: The first residue selection: a selection expression, residue indices, or None for every residue.
+        :param second: The second residue selection. Defaults to the first one.
+        :param cutoff: Only distances strictly below the cutoff are contacts.
+        :param skin: The margin of the neighbour list; larger skins rebuild less often but evaluate more pairs.
+        :param mode: "atom" for minimum atom-atom distances, "centroid" for centroid-centroid distances.
+        """
+        if mode not in ["atom", "centroid"]:
+            raise ValueError("Mode must be 'atom' or 'centroid'.")
+        if not np.isfinite(cutoff) or cutoff <= 0:
+            raise ValueError("The cutoff must be a positive finite distance.")
+        self.topology = topology
+        self.mode = mode
+        self.cutoff = cutoff
+        self.skin = skin
+        self.residues1 = _residue_indices(topology, first)
+        self.residues2 = self.residues1 if second is None else _residue_indices(topology, second)
+        self.shape = (len(self.residues1), len(self.residues2))
+        self.points1, self.owner1 = self._points(self.residues1)
+        self.points2, self.owner2 = self._points(self.residues2)
+        # In atom mode, residues present in both selections are never compared with themselves, as in
+        # contact_engine.residue_contacts
+        self._same_residue = np.full(self.shape[1], -1, dtype=np.int64)
+        if mode == "atom":
+            _, positions1, positions2 = np.intersect1d(self.residues1, self.residues2, return_indices=True)
+            self._same_residue[positions2] = positions1
+        self.frames = 0
+        self.rebuilds = 0
+        self.updates = 0
+        self._reference1 = self._reference2 = None
+        self._rows = self._columns = np.empty(0, dtype=np.int64)
+        self._keys, self._counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    def _points(self, residues: np.ndarray) -> tuple:
+        """Gives the atoms (or residues) whose positions are compared and the selection position of their residue."""
+        if self.mode == "centroid":
+            return residues, np.arange(len(residues))
+        starts, stops = self.topology.residue_starts[residues], self.topology.residue_starts[residues + 1]
+        lengths = stops - starts
+        owner = np.repeat(np.arange(len(residues)), lengths)
+        atoms = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        return atoms, owner
+
+    def _positions(self, coords: np.ndarray) -> tuple:
+        """Gives the positions of the compared points in a frame."""
+        coords = np.asarray(coords, dtype=np.float64)
+        if coords.shape != (self.topology.n_atoms, 3):
+            raise ValueError(f"Frame has shape {coords.shape}, the topology has {self.topology.n_atoms} atoms.")
+        if self.mode == "atom":
+            return coords[self.points1], coords[self.points2]
+        topology = self.topology
+        centroids = np.add.reduceat(coords, topology.residue_starts[:-1], axis=0) \
+            / np.diff(topology.residue_starts)[:, np.newaxis] if topology.n_residues else np.empty((0, 3))
+        return centroids[self.points1], centroids[self.points2]
+
+    def _search(self, points1: np.ndarray = None, points2: np.ndarray = None) -> tuple:
+        """Lists the pairs of the given points (default all) closer than cutoff + skin at their reference positions."""
+        points1 = np.arange(len(self._reference1)) if points1 is None else points1
+        points2 = np.arange(len(self._reference2)) if points2 is None else points2
+        rows, columns = [], []
+        for chunk_rows, chunk_columns, _ in contact_engine.close_pairs(self._reference1[points1],
+                                                                       self._reference2[points2],
+                                                                       self.cutoff + self.skin):
+            rows.append(points1[chunk_rows])
+            columns.append(points2[chunk_columns])
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        keep = self._same_residue[self.owner2[columns]] != self.owner1[rows]
+        return rows[keep], columns[keep]
+
+    def _rebuild(self, positions1: np.ndarray, positions2: np.ndarray):
+        self._reference1, self._reference2 = positions1.copy(), positions2.copy()
+        self._rows, self._columns = self._search()
+        self.rebuilds += 1
+
+    def _patch(self, moved1: np.ndarray, moved2: np.ndarray, positions1: np.ndarray, positions2: np.ndarray):
+        """Moves the reference position of the moved points and replaces their pairs."""
+        keep = ~(moved1[self._rows] | moved2[self._columns])
+        self._reference1[moved1] = positions1[moved1]
+        self._reference2[moved2] = positions2[moved2]
+        rows, columns = [self._rows[keep]], [self._columns[keep]]
+        # Moved points of the first set against every point of the second, then the rest against moved points
+        moved_rows, still_rows, moved_columns = np.flatnonzero(moved1), np.flatnonzero(~moved1), np.flatnonzero(moved2)
+        for found_rows, found_columns in (self._search(moved_rows, None), self._search(still_rows, moved_columns)):
+            rows.append(found_rows)
+            columns.append(found_columns)
+        self._rows, self._columns = np.concatenate(rows), np.concatenate(columns)
+        self.updates += 1
+
+    @timed("trajectory_frame")
+    def update(self, coords: np.ndarray) -> ResidueContacts:
+        """
+        Computes the contacts of the next frame.
+        :param coords: The (n_atoms, 3) coordinates of the frame, in the atom order of the topology.
+        :return: The sparse residue-residue distances below the cutoff, indexed by position in the selections.
+        """
+        positions1, positions2 = self._positions(coords)
+        if self._reference1 is None:
+            self._rebuild(positions1, positions2)
+        else:
+            limit = (self.skin / 2) ** 2
+            moved1 = contact_engine._squared_distances(positions1, self._reference1) > limit
+            moved2 = contact_engine._squared_distances(positions2, self._reference2) > limit
+            n_moved = int(moved1.sum() + moved2.sum())
+            count(moved=n_moved)
+            if n_moved > REBUILD_FRACTION * (len(positions1) + len(positions2)):
+                self._rebuild(positions1, positions2)
+            elif n_moved:
+                self._patch(moved1, moved2, positions1, positions2)
+
+        squared = contact_engine._squared_distances(positions1[self._rows], positions2[self._columns])
+        close = squared < self.cutoff * self.cutoff
+        n_second = self.shape[1]
+        keys, squared = contact_engine._pair_minimum(self.owner1[self._rows[close]] * n_second
+                                                     + self.owner2[self._columns[close]], squared[close])
+        self._accumulate(keys)
+        self.frames += 1
+        count(frames=1, pairs=len(self._rows), contacts=len(keys))
+        return ResidueContacts(keys // n_second, keys % n_second, np.sqrt(squared), self.shape)
+
+    def _accumulate(self, keys: np.ndarray):
+        """Adds the contacts of a frame to the running counts."""
+        merged = np.concatenate((self._keys, keys))
+        self._keys, inverse = np.unique(merged, return_inverse=True)
+        self._counts = np.bincount(inverse.reshape(-1), weights=np.concatenate((self._counts, np.ones(len(keys)))),
+                                   minlength=len(self._keys)).astype(np.int64)
+
+    def run(self, frames):
+        """
+        Computes the contacts of successive frames lazily.
+        :param frames: An iterable of (n_atoms, 3) coordinate arrays, e.g. from pdb_frames.
+        :return: A generator of per-frame ResidueContacts.
+        """
+        for coords in frames:
+            yield self.update(coords)
+
+    def frequency(self) -> ContactFrequency:
+        """
+        Gives how often every residue pair was in contact over the frames seen so far.
+        :return: The sparse contact counts.
+        """
+        n_second = self.shape[1]
+        return ContactFrequency(self._keys // n_second, self._keys % n_second, self._counts.copy(), self.frames,
+                                self.shape)
+
+
+def pdb_frames(files, chains: list = None, altloc: str = "first", hetatm: bool = True) -> tuple:
+    """
+    Reads the frames of a trajectory stored as PDB: the MODEL records of one file (e.g. an NMR ensemble) or the
+    first model of each of several snapshot files. Every frame must hold the atoms of the first one, in order.
+    :param files: One PDB file, or a list of PDB files.
+    :param chains: The chain identifiers to read. Defaults to every chain.
+    :param altloc: The alternate location policy, see pdb_parser.parse_pdb.
+    :param hetatm: Whether HETATM records are kept.
+    :return: (topology, frames): the Structure of the first frame and a generator of the coordinate arrays of every
+    frame, including the first.
+    """
+    if isinstance(files, str):
+        models = (structure for _, structure in pdb_stream.iter_models(files, chains, altloc, hetatm))
+    elif chains is None:
+        models = (pdb_parser.parse_pdb(file, altloc=altloc, hetatm=hetatm) for file in files)
+    else:
+        models = (pdb_stream.read_chains(file, chains, altloc=altloc, hetatm=hetatm) for file in files)
+    topology = next(models, None)
+    if topology is None:
+        raise ValueError(f"No atoms found in {files}.")
+
+    def frames():
+        yield topology.coords
+        for position, structure in enumerate(models, start=2):
+            if structure.n_atoms != topology.n_atoms or not np.array_equal(structure.atom_name, topology.atom_name):
+                raise ValueError(f"Frame {position} does not have the atoms of the first frame.")
+            yield structure.coords
+
+    return topology, frames()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+DATA = os.path.join(ROOT, "data")
+# The modules of src/ import each other by their flat names, as when run from src/
+sys.path.insert(0, SRC)
+
+PDB_FILES = [os.path.join(DATA, "1brs.pdb"), os.path.join(DATA, "1FFW_AB_c.pdb")]
+
+
+@pytest.fixture(params=PDB_FILES, ids=lambda file: os.path.basename(file))
+def pdb_file(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def write_pdb(tmp_path):
+    """Writes PDB content to a file of the temporary directory and gives its path."""
+
+    def write(content: str, name: str = "test.pdb") -> str:
+        path = tmp_path / name
+        path.write_text(content)
+        return str(path)
+
+    return write
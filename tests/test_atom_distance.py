@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import atom_distance
+import pdb_parser
+from pdb_structure import Structure
+
+
+@pytest.fixture
+def structure(pdb_file):
+    return pdb_parser.parse_pdb(pdb_file, hetatm=False)
+
+
+def residue_pairs(structure, n_pairs=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, structure.n_residues, size=(n_pairs, 2)).tolist()
+
+
+@pytest.mark.parametrize("mode", ["atom", "centroid"])
+def test_distances_match_calculate_distance(structure, mode):
+    service = atom_distance.DistanceService(structure)
+    residues = structure.residues()
+    pairs = residue_pairs(structure)
+    expected = [atom_distance.calculate_distance(mode, residues[first], residues[second]) for first, second in pairs]
+    np.testing.assert_allclose(service.distances(mode, pairs), expected, rtol=1e-12)
+    # The same pairs are answered from the cache, in either order and from any residue reference
+    first, second = pairs[0]
+    references = [(residues[second], residues[first]), ((residues[first].chain, residues[first].number), second)]
+    for one, two in references:
+        assert service.distance(mode, one, two) == pytest.approx(expected[0], rel=1e-12)
+    assert service.cache_info()["hits"] >= len(references)
+
+
+def test_cache_counts_and_eviction(structure):
+    service = atom_distance.DistanceService(structure, max_pairs=2)
+    service.distance("atom", 0, 1)
+    service.distance("atom", 1, 0)
+    service.distance("centroid", 0, 1)
+    assert service.cache_info() == {"hits": 1, "misses": 2, "pairs": 2, "max_pairs": 2}
+    service.distances("atom", [(0, 2), (0, 1)])
+    assert service.cache_info() == {"hits": 2, "misses": 3, "pairs": 2, "max_pairs": 2}
+    # The centroid pair was the least recently used and was evicted
+    service.distance("centroid", 0, 1)
+    assert service.cache_info()["misses"] == 4
+    service.clear()
+    assert service.cache_info() == {"hits": 0, "misses": 0, "pairs": 0, "max_pairs": 2}
+
+
+def test_errors(structure):
+    service = atom_distance.DistanceService(structure)
+    with pytest.raises(ValueError):
+        service.distance("closest", 0, 1)
+    with pytest.raises(ValueError, match="another structure"):
+        service.distance("atom", Structure.from_arrays(structure.arrays()).residues()[0], 0)
+    with pytest.raises(KeyError):
+        service.distance("atom", ("?", "1"), 0)
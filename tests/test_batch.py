@@ -0,0 +1,78 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+import batch
+
+
+@pytest.fixture
+def inputs(tmp_path, pdb_file):
+    """The same structure under one name in two directories."""
+    files = []
+    for directory in ("one", "two"):
+        os.makedirs(tmp_path / directory)
+        files.append(str(shutil.copy(pdb_file, tmp_path / directory / "same.pdb")))
+    return files
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_resume_skips_completed_files(tmp_path, inputs):
+    output = str(tmp_path / "results.csv")
+    rows = batch.run_batch(inputs[:1], output, workers=1, progress=False, sasa=False)
+    assert len(rows) == 1 and not rows[0].get("error")
+
+    # Files sharing a name are distinct inputs; the completed one is skipped
+    rows = batch.run_batch(inputs, output, workers=1, progress=False, sasa=False)
+    assert [row["file"] for row in rows] == inputs[1:]
+    assert sorted(row["file"] for row in read_rows(output)) == sorted(inputs)
+    assert batch.run_batch(inputs, output, workers=1, progress=False, sasa=False) == []
+
+
+def test_resume_retries_failed_files(tmp_path, inputs):
+    output = str(tmp_path / "results.csv")
+    broken = str(tmp_path / "broken.pdb")
+    batch.run_batch([broken], output, workers=1, progress=False, sasa=False)
+    assert read_rows(output)[0]["error"].startswith("FileNotFoundError")
+    with open(broken, "w") as f, open(inputs[0]) as source:
+        f.write(source.read())
+    rows = batch.run_batch([broken], output, workers=1, progress=False, sasa=False)
+    assert len(rows) == 1 and not rows[0].get("error")
+
+
+def test_restart_overwrites(tmp_path, inputs):
+    output = str(tmp_path / "results.jsonl")
+    batch.run_batch(inputs, output, workers=1, progress=False, sasa=False)
+    rows = batch.run_batch(inputs, output, workers=1, resume=False, progress=False, sasa=False)
+    assert len(rows) == 2
+    with open(output) as f:
+        assert len(f.readlines()) == 2
+
+
+def test_csv_header_mismatch(tmp_path, inputs):
+    output = str(tmp_path / "results.csv")
+    batch.run_batch(inputs[:1], output, workers=1, progress=False, sasa=False, thresholds=(4, 8))
+    with pytest.raises(ValueError, match="has the columns"):
+        batch.run_batch(inputs, output, workers=1, progress=False, sasa=False, thresholds=(4, 8, 12))
+    assert len(read_rows(output)) == 1
+
+
+def test_parquet_schema_mismatch(tmp_path, inputs):
+    pytest.importorskip("pyarrow")
+    output = str(tmp_path / "results.parquet")
+    batch.run_batch(inputs[:1], output, workers=1, progress=False, sasa=False, thresholds=(4, 8))
+    with pytest.raises(ValueError, match="has the columns"):
+        batch.run_batch(inputs, output, workers=1, progress=False, sasa=False, thresholds=(4, 8, 12))
+    assert batch.completed_files(output, "parquet") == {batch.input_key(inputs[0])}
+    assert not os.path.exists(output + ".partial")
+
+
+def test_structure_name_and_input_key(tmp_path):
+    assert batch.structure_name("a/1abc.pdb") == batch.structure_name("b/1abc.cif.gz") == "1abc"
+    assert batch.input_key("a/1abc.pdb") != batch.input_key("b/1abc.pdb")
+    assert batch.input_key("a/../a/1abc.pdb") == batch.input_key(os.path.abspath("a/1abc.pdb"))
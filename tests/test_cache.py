@@ -0,0 +1,120 @@
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+
+import pdb_parser
+import profiling
+from cache import StructureCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StructureCache(directory=str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def copied_pdb(tmp_path, pdb_file):
+    return str(shutil.copy(pdb_file, tmp_path / os.path.basename(pdb_file)))
+
+
+def assert_same_structure(one, two):
+    first, second = one.arrays(), two.arrays()
+    assert first.keys() == second.keys()
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name], err_msg=name)
+
+
+def test_parse_pdb_hits_after_a_miss(cache, copied_pdb):
+    with profiling.Profiler("cache") as profiler:
+        first = cache.parse_pdb(copied_pdb)
+        second = cache.parse_pdb(copied_pdb)
+    counters = profiler.stages["cached_parse_pdb"]["counters"]
+    assert counters["cache_misses"] == 1 and counters["cache_hits"] == 1
+    assert len(cache.entries()) == 1
+    assert_same_structure(first, pdb_parser.parse_pdb(copied_pdb))
+    assert_same_structure(second, first)
+
+
+def test_parameters_and_content_miss(cache, copied_pdb):
+    cache.parse_pdb(copied_pdb)
+    cache.parse_pdb(copied_pdb, hetatm=False)
+    assert len(cache.entries()) == 2
+
+    # Editing the file changes its content digest, the old entries are not returned
+    with open(copied_pdb) as f:
+        lines = f.readlines()
+    with open(copied_pdb, "w") as f:
+        f.writelines(line for line in lines if not line.startswith(("ATOM", "HETATM")) or line[21] != "A")
+    structure = cache.parse_pdb(copied_pdb)
+    assert len(cache.entries()) == 3
+    assert "A" not in structure.chain_ids
+
+
+def test_eviction_keeps_the_cache_under_max_bytes(tmp_path, copied_pdb):
+    cache = StructureCache(directory=str(tmp_path / "cache"), max_bytes=1)
+    cache.parse_pdb(copied_pdb)
+    assert cache.entries() == []
+
+
+def test_compute_sasa_writes_no_pickle_by_default(tmp_path, cache, copied_pdb):
+    pytest.importorskip("freesasa")
+    from sasaumure import compute_sasa
+
+    structure = compute_sasa(copied_pdb, cache=cache)
+    assert sorted(os.listdir(tmp_path)) == sorted(["cache", os.path.basename(copied_pdb)])
+    assert len(structure.residue_data["SASA"]) == len(structure.residue_name)
+
+    outfile = str(tmp_path / "annotated.pkl")
+    compute_sasa(copied_pdb, cache=cache, outfile=outfile)
+    with open(outfile, "rb") as f:
+        assert_same_structure(pickle.load(f), structure)
+
+
+def test_sasa_entries_depend_on_the_freesasa_version(cache, copied_pdb, monkeypatch):
+    pytest.importorskip("freesasa")
+    import cache as cache_module
+
+    assert cache_module._sasa_version() not in ("", "unknown")
+    cache.residue_sasa(copied_pdb)
+    cache.residue_sasa(copied_pdb)
+    # The structure and the SASA entries
+    assert len(cache.entries()) == 2
+    monkeypatch.setattr(cache_module.metadata, "version", lambda name: "0.0.0")
+    cache.residue_sasa(copied_pdb)
+    assert len(cache.entries()) == 3
+
+
+@pytest.mark.parametrize("damage", ["truncate", "garbage", "remove"])
+def test_unreadable_entries_are_misses(cache, copied_pdb, damage):
+    expected = cache.parse_pdb(copied_pdb)
+    (_, _, path), = cache.entries()
+    if damage == "remove":
+        os.unlink(path)
+    else:
+        with open(path, "rb") as f:
+            content = f.read()
+        with open(path, "wb") as f:
+            f.write(content[:len(content) // 2] if damage == "truncate" else b"PK\x03\x04" + bytes(100))
+    key = os.path.splitext(os.path.basename(path))[0]
+    assert cache.load(key) is None
+    assert not os.path.exists(path)
+    # The entry is stored again by the next parse
+    assert_same_structure(cache.parse_pdb(copied_pdb), expected)
+    assert [entry_path for _, _, entry_path in cache.entries()] == [path]
+    assert cache.load(key) is not None
+
+
+def test_entry_evicted_while_read_is_a_miss(cache, copied_pdb, monkeypatch):
+    import cache as cache_module
+
+    cache.parse_pdb(copied_pdb)
+    (_, _, path), = cache.entries()
+
+    def evicted(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(cache_module.os, "utime", evicted)
+    assert cache.load(os.path.splitext(os.path.basename(path))[0]) is None
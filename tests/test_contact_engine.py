@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+import atom_distance
+import contact_engine
+import pdb_parser
+
+
+@pytest.fixture
+def structure(pdb_file):
+    return pdb_parser.parse_pdb(pdb_file, hetatm=False)
+
+
+def chain_pairs(structure):
+    chains = structure.chain_ids.tolist()
+    # Two different chains, and a chain against itself to cover the exclusion of identical residues
+    return [(chains[0], chains[-1]), (chains[0], chains[0])]
+
+
+@pytest.mark.parametrize("threshold", [4.0, 8.0, float("inf")])
+def test_grid_backend_matches_pairwise(structure, threshold):
+    for one, two in chain_pairs(structure):
+        residues1, residues2 = structure.residues(one), structure.residues(two)
+        grid = atom_distance.residue_residue(residues1, residues2, threshold, "atom", backend="grid")
+        pairwise = atom_distance.residue_residue(residues1, residues2, threshold, "atom", backend="pairwise")
+        assert [len(row) for row in grid] == [len(row) for row in pairwise]
+        np.testing.assert_allclose(np.concatenate(grid), np.concatenate(pairwise), rtol=1e-12)
+
+
+def test_sparse_contacts_match_the_distance_matrix(structure):
+    one, two = chain_pairs(structure)[0]
+    residues1, residues2 = structure.residues(one), structure.residues(two)
+    contacts = atom_distance.residue_residue(residues1, residues2, 8.0, sparse=True)
+    expected = np.array([[atom_distance.minimum_distance(first.coords, second.coords) for second in residues2]
+                         for first in residues1])
+    first, second = np.nonzero(expected < 8.0)
+    np.testing.assert_array_equal(contacts.first, first)
+    np.testing.assert_array_equal(contacts.second, second)
+    np.testing.assert_allclose(contacts.distance, expected[first, second], rtol=1e-12)
+    assert contacts.shape == expected.shape
+
+
+def test_unknown_backend(structure):
+    residues = structure.residues()
+    with pytest.raises(ValueError):
+        atom_distance.residue_residue(residues, residues, backend="kdtree")
+    assert contact_engine.residue_contacts([], residues, 8.0).shape == (0, len(residues))
+
+
+@pytest.mark.parametrize("mode", ["atom", "centroid"])
+@pytest.mark.parametrize("cutoff", [5.0, 10.0])
+def test_chain_interfaces_match_per_pair_distances(structure, mode, cutoff):
+    interfaces = contact_engine.chain_interfaces(structure, cutoff, mode)
+    chains = structure.chain_ids.tolist()
+    expected = {}
+    for position, one in enumerate(chains):
+        for two in chains[position + 1:]:
+            residues1, residues2 = structure.residues(one), structure.residues(two)
+            contacts = contact_engine.residue_distances(residues1, residues2, cutoff, mode)
+            if len(contacts.distance):
+                expected[one, two] = contacts, residues1, residues2
+    assert list(interfaces) == list(expected)
+
+    for (one, two), (contacts, residues1, residues2) in expected.items():
+        interface = interfaces[one, two]
+        assert (interface.chain1, interface.chain2) == (one, two)
+        np.testing.assert_array_equal(interface.contacts.first, contacts.first)
+        np.testing.assert_array_equal(interface.contacts.second, contacts.second)
+        np.testing.assert_allclose(interface.contacts.distance, contacts.distance, rtol=1e-12)
+        assert interface.contacts.shape == contacts.shape
+        assert interface.min_distance == pytest.approx(contacts.distance.min())
+        if mode == "atom":
+            coords1, _ = contact_engine.atom_table(residues1)
+            coords2, _ = contact_engine.atom_table(residues2)
+            atom_pairs = sum(len(rows) for rows, _, _ in contact_engine.close_pairs(coords1, coords2, cutoff))
+            assert interface.atom_contacts == atom_pairs
+        else:
+            assert interface.atom_contacts == len(contacts.distance)
+
+
+def test_chain_interfaces_of_selected_chains(structure):
+    chains = structure.chain_ids.tolist()[:2]
+    interfaces = contact_engine.chain_interfaces(structure, 10.0, chains=chains)
+    assert set(interfaces) <= {tuple(chains)}
+    assert contact_engine.chain_interfaces(structure, 10.0, chains=chains[:1]) == {}
+    with pytest.raises(ValueError):
+        contact_engine.chain_interfaces(structure, float("inf"))
+    with pytest.raises(KeyError):
+        contact_engine.chain_interfaces(structure, 10.0, chains=["?"])
+
+
+@pytest.mark.parametrize("mode", ["atom", "centroid"])
+def test_contact_cards_match_per_threshold_contacts(structure, mode):
+    one, two = chain_pairs(structure)[0]
+    residues1, residues2 = structure.residues(one), structure.residues(two)
+    thresholds = list(range(1, 11))
+    contacts = contact_engine.residue_distances(residues1, residues2, max(thresholds), mode)
+    cards = contact_engine.contact_cards(contacts, thresholds)
+    for threshold, card in zip(thresholds, cards):
+        expected = atom_distance.residue_residue(residues1, residues2, threshold, mode)
+        assert [len(row) for row in card] == [len(row) for row in expected]
+        np.testing.assert_allclose(np.concatenate(card), np.concatenate(expected), rtol=1e-12)
+        interface = sum(1 for row in expected if row) + len({column for column, distance in
+                                                            zip(contacts.second, contacts.distance)
+                                                            if distance < threshold})
+        assert contact_engine.interface_residue_counts(contacts, [threshold]) == [interface]
+
+
+@pytest.fixture
+def contact_map(structure):
+    """The contacts of the first pair of chains in contact."""
+    one, two = next(iter(contact_engine.chain_interfaces(structure, 10.0)))
+    residues1, residues2 = structure.residues(one), structure.residues(two)
+    return contact_engine.residue_distances(residues1, residues2, 10.0), residues1, residues2
+
+
+def test_dense_and_csr_match_the_masked_distances(contact_map):
+    contacts, residues1, residues2 = contact_map
+    every_pair = contact_engine.residue_distances(residues1, residues2, float("inf")).dense()
+    assert not np.isnan(every_pair).any()
+    expected = np.where(every_pair < 10.0, every_pair, np.nan)
+    np.testing.assert_allclose(contacts.dense(), expected, rtol=1e-12)
+    np.testing.assert_array_equal(contacts.dense(fill=-1.0) == -1.0, np.isnan(expected))
+
+    indptr, indices, distances = contacts.csr()
+    assert len(indptr) == len(residues1) + 1 and indptr[-1] == len(contacts.distance)
+    for row in range(len(residues1)):
+        columns = np.flatnonzero(~np.isnan(expected[row]))
+        np.testing.assert_array_equal(indices[indptr[row]:indptr[row + 1]], columns)
+        np.testing.assert_allclose(distances[indptr[row]:indptr[row + 1]], expected[row, columns], rtol=1e-12)
+
+
+def test_save_and_load(tmp_path, contact_map):
+    contacts = contact_map[0]
+    for dtype, tolerance in ((np.float32, 1e-6), (np.float64, 0)):
+        file = str(tmp_path / f"contacts_{np.dtype(dtype).name}.npz")
+        contacts.save(file, dtype=dtype)
+        loaded = contact_engine.ResidueContacts.load(file)
+        assert loaded.shape == contacts.shape
+        np.testing.assert_array_equal(loaded.first, contacts.first)
+        np.testing.assert_array_equal(loaded.second, contacts.second)
+        assert loaded.first.dtype == loaded.second.dtype == np.int64 and loaded.distance.dtype == np.float64
+        np.testing.assert_allclose(loaded.distance, contacts.distance, rtol=tolerance)
+
+
+def test_interface_residues_and_frame(contact_map):
+    contacts, residues1, residues2 = contact_map
+    matrix = contacts.dense()
+    for threshold in (4.0, 6.0, float("inf")):
+        close = matrix < threshold
+        first, second = contacts.interface_residues(threshold)
+        np.testing.assert_array_equal(first, np.flatnonzero(close.any(axis=1)))
+        np.testing.assert_array_equal(second, np.flatnonzero(close.any(axis=0)))
+
+    pytest.importorskip("pandas")
+    frame = contacts.to_frame(residues1, residues2)
+    assert len(frame) == len(contacts.distance)
+    np.testing.assert_array_equal(frame["distance"], contacts.distance)
+    row = frame.iloc[-1]
+    first, second = residues1[row["first"]], residues2[row["second"]]
+    assert (row["first_chain"], row["first_number"], row["first_name"]) == (first.chain, first.number,
+                                                                           first["resname"])
+    assert (row["second_chain"], row["second_number"], row["second_name"]) == (second.chain, second.number,
+                                                                               second["resname"])
+    assert list(contacts.to_frame().columns) == ["first", "second", "distance"]
+
+
+def test_interface_residue_counts_match_a_brute_force_count(contact_map):
+    contacts, residues1, residues2 = contact_map
+    thresholds = [3.0, 4.5, 8.0, 10.0]
+    expected = []
+    for threshold in thresholds:
+        first = {row for row, residue in enumerate(residues1) for other in residues2
+                 if atom_distance.minimum_distance(residue.coords, other.coords) < threshold}
+        second = {column for column, residue in enumerate(residues2) for other in residues1
+                  if atom_distance.minimum_distance(residue.coords, other.coords) < threshold}
+        expected.append(len(first) + len(second))
+    assert contact_engine.interface_residue_counts(contacts, thresholds) == expected
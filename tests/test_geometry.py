@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import geometry
+import pdb_parser
+
+
+@pytest.fixture
+def structure(pdb_file):
+    return pdb_parser.parse_pdb(pdb_file)
+
+
+def residue_atoms(structure):
+    """The coordinates, element masses and atom names of every residue, one residue at a time."""
+    for start, stop in zip(structure.residue_starts[:-1].tolist(), structure.residue_starts[1:].tolist()):
+        elements = [element.strip().upper() or name.lstrip("0123456789")[:1].upper()
+                    for element, name in zip(structure.element[start:stop].tolist(),
+                                             structure.atom_name[start:stop].tolist())]
+        masses = np.array([geometry.ATOMIC_MASSES.get(element, geometry.ATOMIC_MASSES["C"]) for element in elements])
+        yield structure.coords[start:stop], masses, [name.strip() for name in structure.atom_name[start:stop]]
+
+
+def test_residue_centres_match_numpy(structure):
+    centroids, centres, radii, weighted_radii, side_chains = [], [], [], [], []
+    for coords, masses, names in residue_atoms(structure):
+        centroid = coords.mean(axis=0)
+        centre = np.average(coords, axis=0, weights=masses)
+        centroids.append(centroid)
+        centres.append(centre)
+        radii.append(np.sqrt(np.mean(np.sum((coords - centroid) ** 2, axis=1))))
+        weighted_radii.append(np.sqrt(np.average(np.sum((coords - centre) ** 2, axis=1), weights=masses)))
+        side = [position for position, name in enumerate(names) if name not in geometry.BACKBONE_ATOMS]
+        alpha = [position for position, name in enumerate(names) if name == "CA"]
+        side_chains.append(coords[side or alpha].mean(axis=0) if side or alpha else centroid)
+
+    np.testing.assert_allclose(geometry.residue_centroids(structure), centroids, rtol=1e-12)
+    np.testing.assert_allclose(geometry.residue_centres_of_mass(structure), centres, rtol=1e-12)
+    np.testing.assert_allclose(geometry.radius_of_gyration(structure), radii, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(geometry.radius_of_gyration(structure, mass_weighted=True), weighted_radii,
+                               rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(geometry.side_chain_centroids(structure), side_chains, rtol=1e-12)
+    np.testing.assert_allclose(geometry.residues_centroids(structure.residues()), centroids, rtol=1e-12)
+
+
+def test_bounding_spheres_enclose_every_atom(structure):
+    centres, radii = geometry.bounding_spheres(structure)
+    np.testing.assert_allclose(centres, geometry.residue_centroids(structure), rtol=1e-12)
+    expected = [np.linalg.norm(coords - coords.mean(axis=0), axis=1).max() for coords, _, _ in
+                residue_atoms(structure)]
+    np.testing.assert_allclose(radii, expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, geometry.CENTROID_CHUNK, 100000])
+def test_chunked_centroid_distances_match_cdist(structure, chunk):
+    distance = pytest.importorskip("scipy.spatial.distance")
+    centroids = geometry.residue_centroids(structure)
+    first, second = centroids[::2], centroids[1::3]
+    np.testing.assert_allclose(geometry.centroid_distances(first, second, chunk), distance.cdist(first, second),
+                               rtol=1e-12, atol=1e-12)
+    assert geometry.centroid_distances(first[:0], second, chunk).shape == (0, len(second))
@@ -0,0 +1,54 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import pdb_binary
+import pdb_parser
+
+
+def assert_same_structure(one, two):
+    first, second = one.arrays(), two.arrays()
+    assert first.keys() == second.keys()
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name], err_msg=name)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, pdb_file, mmap):
+    structure = pdb_parser.parse_pdb(pdb_file)
+    structure.residue_data["SASA"] = np.arange(len(structure.residue_name), dtype=np.float64)
+    file = str(tmp_path / "structure.pdbbin")
+    pdb_binary.write_structure(structure, file)
+    assert_same_structure(pdb_binary.read_structure(file, mmap=mmap), structure)
+
+
+def test_read_chains(tmp_path, pdb_file):
+    structure = pdb_parser.parse_pdb(pdb_file)
+    file = str(tmp_path / "structure.pdbbin")
+    pdb_binary.write_structure(structure, file)
+    chains = list(structure.chain_ids[::-1])
+    for chain, part in zip(chains, pdb_binary.read_chains(file, chains)):
+        assert_same_structure(part, structure.chain_structure(chain))
+
+
+def test_load_any_skips_hetatm_by_default(pdb_file):
+    assert_same_structure(pdb_binary.load_any(pdb_file), pdb_parser.parse_pdb(pdb_file, hetatm=False))
+    assert_same_structure(pdb_binary.load_any(pdb_file, hetatm=True), pdb_parser.parse_pdb(pdb_file, hetatm=True))
+
+
+def test_convert_matches_the_pickle_of_compute_sasa(tmp_path, pdb_file):
+    # compute_sasa pickles the structure parsed without HETATM records, converting the PDB file gives the same
+    structure = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    pickled = str(tmp_path / "structure.pkl")
+    with open(pickled, "wb") as f:
+        pickle.dump(structure, f)
+    from_pickle = pdb_binary.read_structure(pdb_binary.convert(pickled))
+    from_pdb = pdb_binary.read_structure(pdb_binary.convert(pdb_file, str(tmp_path / "from_pdb.pdbbin")))
+    assert_same_structure(from_pdb, from_pickle)
+
+    pdb_binary.main([pdb_file, "-d", str(tmp_path / "hetatm"), "--hetatm"])
+    name = os.path.splitext(os.path.basename(pdb_file))[0] + pdb_binary.EXTENSION
+    converted = pdb_binary.read_structure(str(tmp_path / "hetatm" / name))
+    assert_same_structure(converted, pdb_parser.parse_pdb(pdb_file, hetatm=True))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import pdb_parser
+from pdb_index import parse_selection
+
+
+@pytest.fixture
+def structure(pdb_file):
+    return pdb_parser.parse_pdb(pdb_file)
+
+
+@pytest.mark.parametrize("expression, message", [
+    ("", "Unexpected end of selection"),
+    ("chain A and", "Unexpected end of selection"),
+    ("not", "Unexpected end of selection"),
+    ("chain", "Missing value after 'chain'"),
+    ("resi and chain A", "Missing value after 'resid'"),
+    ("(chain A or chain B", "Missing closing parenthesis"),
+    ("chian A", "Unknown selection keyword 'chian'"),
+    ("A", "Unknown selection keyword 'A'"),
+    ("chain A )", "Unexpected '\\)'"),
+    ("chain A (all)", "Unexpected '\\('"),
+])
+def test_parse_selection_errors(expression, message):
+    with pytest.raises(ValueError, match=message):
+        parse_selection(expression)
+
+
+def test_select_matches_residue_arrays(structure):
+    index = structure.index
+    chain = np.repeat(structure.chain_ids, np.diff(structure.chain_starts))
+    first, last = structure.chain_ids[0], structure.chain_ids[-1]
+    name = structure.residue_name[0]
+    seq = np.array([int(number.rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")) for number in structure.residue_number])
+    hetero = np.array([structure.hetero[start:stop].any() for start, stop in
+                       zip(structure.residue_starts[:-1], structure.residue_starts[1:])])
+    cases = {
+        "all": np.ones(structure.n_residues, dtype=bool),
+        f"chain {first} {last}": np.isin(chain, [first, last]),
+        f"CHAIN {first} and resname {name}": (chain == first) & (structure.residue_name == name),
+        f"not chain {first}": chain != first,
+        "resid 10-20 30": ((seq >= 10) & (seq <= 20)) | (seq == 30),
+        f"resseq 5:8 and (chain {last} or hetero)": (seq >= 5) & (seq <= 8) & ((chain == last) | hetero),
+        "hetero and not resname HOH": hetero & (structure.residue_name != "HOH"),
+        "chain ? or resname XYZ": np.zeros(structure.n_residues, dtype=bool),
+    }
+    for expression, expected in cases.items():
+        np.testing.assert_array_equal(index.select(expression), np.flatnonzero(expected), err_msg=expression)
+
+
+def test_counts(structure):
+    index = structure.index
+    for chain in structure.chain_ids.tolist():
+        names = structure.residue_name[structure.chain_starts[structure.chain_index(chain)]:
+                                       structure.chain_starts[structure.chain_index(chain) + 1]]
+        expected = dict(zip(*np.unique(names, return_counts=True)))
+        assert index.counts_per_chain()[chain] == {str(name): int(value) for name, value in expected.items()}
+        assert index.count("LYS", chain) == int(np.sum(names == "LYS"))
+    assert index.count("LYS") == int(np.sum(structure.residue_name == "LYS"))
+    assert index.count("XYZ") == 0
+    with pytest.raises(KeyError):
+        index.count("LYS", "?")
@@ -0,0 +1,126 @@
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+import pdb_mmcif
+import pdb_parser
+from conftest import DATA
+
+ITEMS = ["group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id", "label_asym_id",
+         "label_seq_id", "pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy", "B_iso_or_equiv",
+         "auth_seq_id", "auth_comp_id", "auth_asym_id", "auth_atom_id", "pdbx_PDB_model_num", "pdbx_note"]
+# A ligand whose atom names hold quotes and whose residue has an insertion code
+LIGAND = [("C1'", "C", 10.0), ("O5'", "O", 11.5)]
+
+
+def ligand_records(serial):
+    return [f"HETATM{serial + position:5d}  {name:<3s} NAG X 901A   {x:8.3f}{x + 1:8.3f}{x + 2:8.3f}  1.00 25.00"
+            f"           {element:>2s}  \n" for position, (name, element, x) in enumerate(LIGAND)]
+
+
+def atom_records():
+    with open(os.path.join(DATA, "1brs.pdb")) as f:
+        records = [line.rstrip("\n").ljust(80) + "\n" for line in f if line.startswith(("ATOM", "HETATM"))]
+    return records + ligand_records(9001)
+
+
+def shifted(records, shift):
+    return [f"{line[:30]}{float(line[30:38]) + shift:8.3f}{line[38:]}" for line in records]
+
+
+def cif_value(value, position):
+    if value == "":
+        return "?"
+    if "'" in value:
+        return f'"{value}"'
+    # Values with blanks must be quoted; some plain ones are too, as mmCIF writers may
+    return f"'{value}'" if " " in value or position % 7 == 0 else value
+
+
+def cif_row(line, model, position):
+    hetero = line.startswith("HETATM")
+    values = {
+        "group_PDB": line[:6].strip(), "id": line[6:11].strip(), "type_symbol": line[76:78].strip(),
+        "label_atom_id": line[12:16].strip(), "label_alt_id": line[16].strip() or ".",
+        "label_comp_id": line[17:20].strip(), "label_asym_id": line[21],
+        "label_seq_id": "." if hetero else line[22:26].strip(), "pdbx_PDB_ins_code": line[26].strip(),
+        "Cartn_x": line[30:38].strip(), "Cartn_y": line[38:46].strip(), "Cartn_z": line[46:54].strip(),
+        "occupancy": line[54:60].strip(), "B_iso_or_equiv": line[60:66].strip(), "auth_seq_id": line[22:26].strip(),
+        "auth_comp_id": line[17:20].strip(), "auth_asym_id": line[21], "auth_atom_id": line[12:16].strip(),
+        "pdbx_PDB_model_num": str(model), "pdbx_note": "a note",
+    }
+    return " ".join(cif_value(values[item], position + column) for column, item in enumerate(ITEMS)) + "\n"
+
+
+@pytest.fixture(scope="module")
+def models():
+    """The atoms of data/1brs.pdb and a ligand, in two models, as PDB and as mmCIF content."""
+    first = atom_records()
+    second = shifted(first, 1.0)
+    pdb = "MODEL        1\n" + "".join(first) + "ENDMDL\nMODEL        2\n" + "".join(second) + "ENDMDL\nEND\n"
+    rows = [cif_row(line, model, position) for model, records in ((1, first), (2, second))
+            for position, line in enumerate(records)]
+    cif = ("data_1BRS\n#\nloop_\n" + "".join(f"_atom_site.{item}\n" for item in ITEMS) + "".join(rows)
+           + "#\nloop_\n_atom_type.symbol\nC\nN\n#\n")
+    return pdb.encode(), cif.encode()
+
+
+def assert_same(structure, expected):
+    assert structure.chain_ids.tolist() == expected.chain_ids.tolist()
+    assert structure.arrays().keys() == expected.arrays().keys()
+    for name, array in expected.arrays().items():
+        np.testing.assert_array_equal(structure.arrays()[name], array, err_msg=name)
+
+
+def test_atom_site_table(models):
+    pdb, cif = models
+    table = pdb_mmcif.atom_site_table(cif)
+    assert list(table) == ITEMS
+    assert all(len(values) == 2 * len(atom_records()) for values in table.values())
+    assert set(table["pdbx_note"].tolist()) == {b"a note"}
+    assert set(table["auth_atom_id"][-len(LIGAND):].tolist()) == {name.encode() for name, _, _ in LIGAND}
+    assert b"?" in table["pdbx_PDB_ins_code"] and b"." in table["label_alt_id"]
+
+
+def test_atom_site_table_single_row_and_errors():
+    table = pdb_mmcif.atom_site_table(b"data_X\n_atom_site.id 1\n_atom_site.auth_atom_id \"O5'\"\n"
+                                      b"_atom_site.Cartn_x 1.5\n#\n")
+    assert {name: values.tolist() for name, values in table.items()} == {
+        "id": [b"1"], "auth_atom_id": [b"O5'"], "Cartn_x": [b"1.5"]}
+    with pytest.raises(ValueError, match="No _atom_site"):
+        pdb_mmcif.atom_site_table(b"data_X\n_cell.length_a 10\n")
+    with pytest.raises(ValueError, match="3 values for 2 items"):
+        pdb_mmcif.atom_site_table(b"data_X\nloop_\n_atom_site.id\n_atom_site.Cartn_x\n1 1.5 2\n#\n")
+
+
+@pytest.mark.parametrize("options", [{}, {"hetatm": False}, {"altloc": "occupancy"}, {"altloc": "B"}])
+def test_matches_the_pdb_parser(models, options):
+    pdb, cif = models
+    for model in (None, 2):
+        assert_same(pdb_mmcif.parse_mmcif_data(cif, "1brs.cif", model, **options),
+                    pdb_parser.parse_pdb_data(pdb, "1brs.pdb", model, **options))
+    expected = pdb_parser.parse_pdb_data(pdb, "1brs.pdb", 2, **options)
+    assert_same(pdb_parser.parse_pdb_data(cif, "1brs.cif", 2, **options), expected)
+
+
+def test_models(models):
+    pdb, cif = models
+    structures = pdb_mmcif.parse_mmcif_models(cif, "1brs.cif")
+    assert list(structures) == [1, 2]
+    for number, structure in structures.items():
+        assert structure.name == "1brs"
+        assert_same(structure, pdb_parser.parse_pdb_data(pdb, "1brs.pdb", number))
+    np.testing.assert_allclose(structures[2].coords - structures[1].coords,
+                               np.tile([1.0, 0.0, 0.0], (structures[1].n_atoms, 1)), atol=1e-9)
+    with pytest.raises(ValueError, match="Model 3 not found"):
+        pdb_mmcif.parse_mmcif_data(cif, "1brs.cif", 3)
+
+
+def test_compressed_mmcif_file(tmp_path, models):
+    pdb, cif = models
+    path = str(tmp_path / "1brs.cif.gz")
+    with gzip.open(path, "wb") as f:
+        f.write(cif)
+    assert_same(pdb_parser.parse_pdb(path), pdb_parser.parse_pdb_data(pdb, "1brs.pdb"))
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+import pdb_parser
+from conftest import DATA
+
+ATOM = "ATOM      1  N   ALA A   1      11.104  13.207   2.100  1.00 20.00           N\n"
+HETATM = "HETATM    2  C1  LIG B 101      -1.250   0.500  10.000  1.00 30.00           C\n"
+
+
+def assert_empty(structure):
+    assert structure.n_atoms == 0
+    assert structure.n_residues == 0
+    assert structure.n_chains == 0
+    assert structure.coords.shape == (0, 3)
+    assert structure.residues() == []
+
+
+def test_header_only_file(write_pdb):
+    assert_empty(pdb_parser.parse_pdb(write_pdb("HEADER    EMPTY\nEND\n")))
+
+
+def test_empty_content():
+    assert_empty(pdb_parser.parse_pdb_data(b""))
+
+
+def test_hetatm_only_file_without_hetatm(write_pdb):
+    file = write_pdb(HETATM + "END\n")
+    assert_empty(pdb_parser.parse_pdb(file, hetatm=False))
+    assert_empty(pdb_parser.pdb_parser_optimized(file))
+    assert pdb_parser.parse_pdb(file).n_atoms == 1
+
+
+def test_model_without_atoms(write_pdb):
+    file = write_pdb("MODEL        1\n" + ATOM + "ENDMDL\nMODEL        2\nENDMDL\nEND\n")
+    assert_empty(pdb_parser.parse_pdb(file, model=2))
+    models = pdb_parser.parse_pdb_models(file)
+    assert list(models) == [1, 2]
+    assert models[1].n_atoms == 1
+    assert_empty(models[2])
+
+
+def alternate_atoms(file):
+    """The (chain, residue number, atom name) of the ATOM records with an alternate location indicator."""
+    with open(file) as f:
+        return {(line[21], line[22:26].strip(), line[12:16].strip()) for line in f
+                if line.startswith("ATOM") and line[16] != " "}
+
+
+def test_matches_the_dictionary_parser(pdb_file):
+    legacy = pdb_parser.pdb_parser_dict(pdb_file)
+    structure = pdb_parser.pdb_parser_optimized(pdb_file)
+    alternates = alternate_atoms(pdb_file)
+    assert structure["chains"] == legacy["chains"]
+    for chain in legacy["chains"]:
+        assert [str(number) for number in structure[chain]] == list(legacy[chain])
+        for number, residue in legacy[chain].items():
+            view = structure[chain][number]
+            assert view["resname"] == residue["resname"]
+            assert view["atomlist"] == residue["atomlist"]
+            for atom in residue["atomlist"]:
+                expected, actual = residue[atom], dict(view[atom])
+                assert (actual["id"], actual["bfactor"]) == (expected["id"], expected["bfactor"])
+                # The dictionary parser overwrites the coordinates with those of the last alternate location
+                if (chain, number, atom) not in alternates:
+                    assert [actual[axis] for axis in "xyz"] == [expected[axis] for axis in "xyz"]
+
+
+@pytest.mark.parametrize("extension", sorted(pdb_parser.COMPRESSIONS))
+def test_compressed_files(tmp_path, extension):
+    source = os.path.join(DATA, "1brs.pdb")
+    compressed = str(tmp_path / f"1brs.pdb{extension}")
+    with open(source, "rb") as f, pdb_parser.COMPRESSIONS[extension](compressed, "wb") as out:
+        out.write(f.read())
+    expected, structure = pdb_parser.parse_pdb(source), pdb_parser.parse_pdb(compressed)
+    assert structure.name == expected.name
+    assert structure.arrays().keys() == expected.arrays().keys()
+    for name, array in expected.arrays().items():
+        np.testing.assert_array_equal(structure.arrays()[name], array, err_msg=name)
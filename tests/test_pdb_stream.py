@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import pdb_parser
+import pdb_stream
+
+
+def test_read_chains_absent_chain(pdb_file):
+    with pytest.raises(KeyError, match="Chains Z not found"):
+        pdb_stream.read_chains(pdb_file, ["Z"])
+
+
+def test_read_chains_reports_only_missing_chains(pdb_file):
+    with pytest.raises(KeyError, match="Chains Y, Z not found"):
+        pdb_stream.read_chains(pdb_file, ["A", "Z", "Y"])
+
+
+def test_read_chains_no_chain(pdb_file):
+    structure = pdb_stream.read_chains(pdb_file, [])
+    assert structure.n_atoms == 0
+    assert structure.n_chains == 0
+
+
+def test_read_chains_hetatm_only_chain(write_pdb):
+    file = write_pdb("HETATM    1  C1  LIG B 101      -1.250   0.500  10.000  1.00 30.00           C\nEND\n")
+    assert pdb_stream.read_chains(file, ["B"]).n_atoms == 1
+    with pytest.raises(KeyError):
+        pdb_stream.read_chains(file, ["B"], hetatm=False)
+
+
+def test_read_chains_matches_parse_pdb(pdb_file):
+    structure = pdb_parser.parse_pdb(pdb_file)
+    chains = structure.chain_ids.tolist()[:2]
+    selected = pdb_stream.read_chains(pdb_file, chains)
+    assert selected.chain_ids.tolist() == chains
+    atoms = slice(0, int(structure.residue_starts[structure.chain_starts[2]]))
+    np.testing.assert_array_equal(selected.coords, structure.coords[atoms])
+    np.testing.assert_array_equal(selected.atom_name, structure.atom_name[atoms])
+
+
+def assert_same_structure(one, two):
+    first, second = one.arrays(), two.arrays()
+    assert first.keys() == second.keys()
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name], err_msg=name)
+
+
+@pytest.mark.parametrize("block_size", [pdb_stream.BLOCK_SIZE, 4096, 100])
+def test_iter_chains_matches_parse_pdb(pdb_file, block_size):
+    structure = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    chains = list(pdb_stream.iter_chains(pdb_file, hetatm=False, block_size=block_size))
+    assert [chain.chain_ids.tolist() for chain in chains] == [[chain] for chain in structure.chain_ids.tolist()]
+    for chain in chains:
+        assert_same_structure(chain, structure.chain_structure(chain.chain_ids[0]))
+
+    selected = [chain.chain_ids[0] for chain in pdb_stream.iter_chains(pdb_file, chains=["B", "A"],
+                                                                         block_size=block_size)]
+    assert sorted(set(selected)) == sorted({"A", "B"} & set(structure.chain_ids.tolist()))
+
+
+def test_iter_chains_with_hetatm_keeps_every_atom(pdb_file):
+    structure = pdb_parser.parse_pdb(pdb_file)
+    chains = list(pdb_stream.iter_chains(pdb_file, block_size=4096))
+    # Chains are yielded per run of records, e.g. waters after the last chain, where parse_pdb groups them by chain
+    serial = np.concatenate([chain.serial for chain in chains])
+    order, expected_order = np.argsort(serial, kind="stable"), np.argsort(structure.serial, kind="stable")
+    np.testing.assert_array_equal(serial[order], structure.serial[expected_order])
+    np.testing.assert_array_equal(np.concatenate([chain.coords for chain in chains])[order],
+                                  structure.coords[expected_order])
+    residues = list(pdb_stream.iter_residues(pdb_file, block_size=4096))
+    assert [(residue.chain, residue.number) for residue in residues] == \
+        [(residue.chain, residue.number) for chain in chains for residue in chain.residues()]
+
+
+def test_iter_models_matches_parse_pdb_models(write_pdb, pdb_file):
+    with open(pdb_file) as f:
+        atoms = [line for line in f if line.startswith("ATOM")][:200]
+    file = write_pdb("".join(f"MODEL     {number:4d}\n" + "".join(atoms) + "ENDMDL\n" for number in (1, 2, 5)))
+    expected = pdb_parser.parse_pdb_models(file)
+    models = list(pdb_stream.iter_models(file, block_size=1000))
+    assert [number for number, _ in models] == list(expected) == [1, 2, 5]
+    for number, structure in models:
+        assert_same_structure(structure, expected[number])
+    assert_same_structure(next(pdb_stream.iter_chains(file, model=5)), pdb_parser.parse_pdb(file, model=5))
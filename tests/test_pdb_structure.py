@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import pdb_analyzer
+import pdb_parser
+from pdb_structure import Structure, build_structure, string_codes, structure_from_dict
+
+
+@pytest.fixture
+def legacy(pdb_file):
+    return pdb_parser.pdb_parser_dict(pdb_file)
+
+
+@pytest.fixture
+def structure(pdb_file):
+    return pdb_parser.pdb_parser_optimized(pdb_file)
+
+
+def test_analyzer_gives_the_same_answers_on_both_models(legacy, structure):
+    assert pdb_analyzer.chain_count(structure) == pdb_analyzer.chain_count(legacy)
+    assert pdb_analyzer.residue_count(structure) == pdb_analyzer.residue_count(legacy)
+    for name in ("LYS", "GLY", "XYZ"):
+        assert pdb_analyzer.total_aa(structure, name) == pdb_analyzer.total_aa(legacy, name)
+        assert pdb_analyzer.total_aa_per_chain(structure, name) == pdb_analyzer.total_aa_per_chain(legacy, name)
+    assert pdb_analyzer.aa_counts_per_chain(structure) == pdb_analyzer.aa_counts_per_chain(legacy)
+    chain = legacy["chains"][0]
+    assert [residue["resname"] for residue in pdb_analyzer.residues_in_chain(structure, chain)] == \
+        [residue["resname"] for residue in pdb_analyzer.residues_in_chain(legacy, chain)]
+    assert len(pdb_analyzer.residue_list(structure)) == len(pdb_analyzer.residue_list(legacy))
+    expression = f"chain {chain} and resname LYS"
+    assert [(residue.chain, residue.number) for residue in pdb_analyzer.select_residues(legacy, expression)] == \
+        [(residue.chain, residue.number) for residue in pdb_analyzer.select_residues(structure, expression)]
+
+
+def test_structure_from_dict(legacy, structure):
+    converted = structure_from_dict(legacy, "converted")
+    assert converted.name == "converted"
+    assert converted.chain_ids.tolist() == structure.chain_ids.tolist()
+    np.testing.assert_array_equal(converted.residue_number, structure.residue_number)
+    np.testing.assert_array_equal(converted.residue_name, structure.residue_name)
+    np.testing.assert_array_equal(converted.atom_name, structure.atom_name)
+    np.testing.assert_array_equal(converted.serial, structure.serial)
+
+
+def test_residue_data_and_array_round_trip(structure):
+    chain = structure.chain_ids[0]
+    number = structure.residues(chain)[0].number
+    structure[chain][number]["SASA"] = 12.5
+    assert structure[chain][number]["SASA"] == 12.5
+    assert "SASA" not in structure[chain][structure.residues(chain)[1].number]
+    with pytest.raises(KeyError):
+        structure[chain][number]["atomlist"] = []
+
+    copy = Structure.from_arrays(structure.arrays())
+    assert copy.arrays().keys() == structure.arrays().keys()
+    for name, array in structure.arrays().items():
+        np.testing.assert_array_equal(copy.arrays()[name], array, err_msg=name)
+    part = copy.chain_structure(chain)
+    assert part.chain_ids.tolist() == [chain]
+    assert part[chain][number]["SASA"] == 12.5
+    assert part.n_atoms == int(structure.residue_starts[structure.chain_starts[1]])
+
+
+def test_views(structure):
+    chain = structure.chain_ids[0]
+    residue = structure.residues(chain)[0]
+    assert structure[chain][residue.number] == residue
+    assert list(structure) == ["chains", *structure.chain_ids.tolist()]
+    assert "chains" in structure and chain in structure and "?" not in structure
+    atom = residue[residue["atomlist"][0]]
+    assert [atom[axis] for axis in "xyz"] == residue.coords[0].tolist()
+    with pytest.raises(KeyError):
+        structure["?"]
+    with pytest.raises(KeyError):
+        structure[chain]["not a residue"]
+
+
+def test_build_structure_groups_split_chains_and_residues():
+    chains = ["A", "A", "B", "B", "A", "A"]
+    numbers = ["1", "1", "1", "1", "2", "1"]
+    names = ["N", "CA", "N", "CA", "N", "CB"]
+    structure = build_structure(np.zeros((6, 3)), names, np.arange(6), np.zeros(6), chains, numbers, ["GLY"] * 6)
+    assert structure.chain_ids.tolist() == ["A", "B"]
+    assert structure.residue_number.tolist() == ["1", "2", "1"]
+    assert structure.residue_starts.tolist() == [0, 3, 4, 6]
+    assert structure.serial.tolist() == [0, 1, 5, 4, 2, 3]
+    # Grouped atoms keep their order
+    grouped = build_structure(np.zeros((5, 3)), ["N", "CA", "N", "N", "CA"], np.arange(5), np.zeros(5),
+                              ["A", "A", "A", "B", "B"], ["1", "1", "10", "1", "1"], ["GLY"] * 5)
+    assert grouped.serial.tolist() == list(range(5))
+    assert grouped.residue_starts.tolist() == [0, 2, 3, 5]
+
+
+@pytest.mark.parametrize("width", [1, 4, 5, 9, 12])
+def test_string_codes_sort_like_the_strings(width):
+    rng = np.random.default_rng(width)
+    alphabet = np.array(list("0123456789AZ "))
+    values = np.array(["".join(word).rstrip() for word in rng.choice(alphabet, size=(500, width))])
+    codes = string_codes(values)
+    assert np.array_equal(np.sign(codes[:, np.newaxis] - codes), np.sign(
+        np.searchsorted(np.unique(values), values)[:, np.newaxis] - np.searchsorted(np.unique(values), values)))
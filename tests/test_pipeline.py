@@ -0,0 +1,55 @@
+import asyncio
+import gzip
+import json
+import shutil
+
+import pytest
+
+import batch
+import pipeline
+from conftest import PDB_FILES
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """The structures of data/, the second one gzipped."""
+    plain = str(shutil.copy(PDB_FILES[0], tmp_path / "plain.pdb"))
+    compressed = str(tmp_path / "compressed.pdb.gz")
+    with open(PDB_FILES[1], "rb") as f, gzip.open(compressed, "wb") as out:
+        out.write(f.read())
+    return [plain, compressed]
+
+
+def run(files, output, **options):
+    return asyncio.run(pipeline.run_pipeline(files, output, workers=1, progress=False, sasa=False, **options))
+
+
+def results(rows):
+    """The rows by input file, without their timings."""
+    return {row["file"]: {key: value for key, value in row.items() if not key.startswith("time_")} for row in rows}
+
+
+def test_rows_match_run_batch(tmp_path, inputs):
+    output = str(tmp_path / "pipeline.jsonl")
+    rows = run(inputs, output)
+    assert not any(row.get("error") for row in rows)
+    expected = batch.run_batch(inputs, str(tmp_path / "batch.jsonl"), workers=1, progress=False, sasa=False)
+    assert results(rows) == results(expected)
+    with open(output) as f:
+        assert results(json.loads(line) for line in f) == results(expected)
+
+    # Every file is recorded, so a second run resumes all of them
+    assert run(inputs, output) == []
+    assert len(run(inputs, output, resume=False)) == len(inputs)
+
+
+def test_read_errors_become_error_rows(tmp_path, inputs):
+    missing = str(tmp_path / "missing.pdb")
+    output = str(tmp_path / "pipeline.csv")
+    rows = results(run([missing] + inputs, output))
+    assert sorted(rows) == sorted([missing] + inputs)
+    assert rows[missing]["structure"] == "missing"
+    assert rows[missing]["error"].startswith("FileNotFoundError")
+    assert not any(rows[file].get("error") for file in inputs)
+    # Only the failed file is retried
+    assert [row["file"] for row in run([missing] + inputs, output)] == [missing]
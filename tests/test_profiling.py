@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import profiling
+
+
+@profiling.timed
+def inner(seconds=0.0):
+    profiling.count(calls_seen=1)
+    time.sleep(seconds)
+    return seconds
+
+
+@profiling.timed("failing")
+def failing():
+    profiling.count(attempts=1)
+    raise RuntimeError("failed")
+
+
+def entries(profiler):
+    return {entry["stage"]: entry for entry in profiler.to_dict()["stages"]}
+
+
+def test_nested_stages_accumulate_in_their_context():
+    with profiling.Profiler("nested") as profiler:
+        profiling.count(files=1)
+        for _ in range(2):
+            with profiling.stage("outer", atoms=10):
+                profiling.count(atoms=5)
+                assert inner(0.01) == 0.01
+                inner()
+        inner()
+    stages = entries(profiler)
+    assert list(stages) == ["outer", "outer/inner", "inner"]
+    assert stages["outer"]["calls"] == 2 and stages["outer"]["counters"] == {"atoms": 30}
+    assert stages["outer/inner"]["calls"] == 4 and stages["outer/inner"]["counters"] == {"calls_seen": 4}
+    assert stages["inner"]["calls"] == 1 and stages["inner"]["counters"] == {"calls_seen": 1}
+    assert profiler.counters == {"files": 1}
+    assert stages["outer/inner"]["seconds"] >= 0.02
+    assert stages["outer"]["seconds"] >= stages["outer/inner"]["seconds"]
+    assert profiler.seconds >= stages["outer"]["seconds"] + stages["inner"]["seconds"]
+    assert profiling.active() is None
+
+
+def test_stages_do_nothing_without_a_profiler():
+    with profiling.stage("ignored", atoms=1):
+        profiling.count(atoms=1)
+    assert inner() == 0.0
+    assert profiling.active() is None
+
+
+def test_exceptions_are_recorded():
+    with profiling.Profiler() as profiler:
+        with pytest.raises(RuntimeError):
+            with profiling.stage("outer"):
+                profiling.count(atoms=3)
+                failing()
+        with pytest.raises(RuntimeError):
+            failing()
+        # The failed stages are closed, so new stages open at the top level again
+        assert profiling.active() is profiler
+        inner()
+    stages = entries(profiler)
+    assert list(stages) == ["outer", "outer/failing", "failing", "inner"]
+    assert stages["outer"]["calls"] == 1 and stages["outer"]["counters"] == {"atoms": 3}
+    assert stages["outer/failing"]["calls"] == 1 and stages["outer/failing"]["counters"] == {"attempts": 1}
+    assert stages["failing"]["calls"] == 1
+    assert profiler.seconds is not None
+
+
+def test_concurrent_tasks_record_their_own_paths():
+    async def task(name):
+        with profiling.stage(name):
+            await asyncio.sleep(0.01)
+            inner()
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(task("one"), task("two"))
+
+    with profiling.Profiler() as profiler:
+        asyncio.run(run())
+    stages = entries(profiler)
+    assert sorted(stages) == ["one", "one/inner", "two", "two/inner"]
+    assert all(entry["calls"] == 1 for entry in stages.values())
+
+
+def test_memory_peaks_reach_the_enclosing_stages():
+    with profiling.Profiler(memory=True) as profiler:
+        with profiling.stage("outer"):
+            with profiling.stage("allocate"):
+                block = np.ones(1 << 20)
+                del block
+    stages = entries(profiler)
+    assert stages["outer/allocate"]["peak_bytes"] >= 8 << 20
+    assert stages["outer"]["peak_bytes"] >= stages["outer/allocate"]["peak_bytes"]
+    assert profiler.peak_bytes >= stages["outer"]["peak_bytes"]
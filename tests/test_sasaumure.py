@@ -0,0 +1,83 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import pdb_parser
+from cache import StructureCache
+from conftest import PDB_FILES, SRC
+
+pytest.importorskip("freesasa")
+import sasaumure  # noqa: E402
+
+# Run in a separate interpreter: freesasa builds without thread support crash the process on threads > 1
+_THREADS = """
+import sys
+import pdb_parser, sasaumure
+structure = pdb_parser.parse_pdb(sys.argv[1], hetatm=False)
+try:
+    parameters = sasaumure.sasa_parameters(threads=2)
+except ValueError as error:
+    print("rejected", error)
+else:
+    serial = sasaumure.structure_sasa(structure, sasaumure.sasa_parameters())["SASA"]
+    threaded = sasaumure.structure_sasa(structure, parameters)["SASA"]
+    print("computed", abs(serial - threaded).max())
+"""
+
+
+def test_threads_are_rejected_or_computed(pdb_file):
+    process = subprocess.run([sys.executable, "-c", _THREADS, pdb_file], cwd=SRC, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+    outcome, detail = process.stdout.split(" ", 1)
+    if sasaumure.threads_supported():
+        assert outcome == "computed" and float(detail) < 1e-6
+    else:
+        assert outcome == "rejected" and "does not support threads" in detail
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        sasaumure.sasa_parameters(threads=0)
+    with pytest.raises(ValueError):
+        sasaumure.sasa_parameters(algorithm="voronoi")
+
+
+def test_interface_sasa_matches_isolated_chains(pdb_file):
+    structure = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    areas = sasaumure.interface_sasa(structure)
+    complex_areas = sasaumure.structure_sasa(structure)
+    np.testing.assert_array_equal(areas["chain"], complex_areas["chain"])
+    np.testing.assert_array_equal(areas["residue"], complex_areas["residue"])
+    np.testing.assert_allclose(areas["complex"], complex_areas["SASA"], rtol=1e-9, atol=1e-9)
+    for chain in structure.chain_ids.tolist():
+        isolated = sasaumure.structure_sasa(structure.chain_structure(chain))
+        np.testing.assert_allclose(areas["isolated"][areas["chain"] == chain], isolated["SASA"], rtol=1e-9,
+                                   atol=1e-9)
+    # Burying a residue in an interface never exposes more of it
+    assert (areas["delta"] >= -1e-9).all()
+    np.testing.assert_allclose(areas["delta"], areas["isolated"] - areas["complex"])
+    assert areas["delta"].sum() > 0
+
+
+def test_sasa_many_matches_compute_sasa(tmp_path):
+    cache = StructureCache(directory=str(tmp_path / "cache"))
+    expected = [sasaumure.compute_sasa(file, cache=cache) for file in PDB_FILES]
+    for areas, structure in zip(sasaumure.sasa_many(PDB_FILES, workers=2), expected):
+        np.testing.assert_allclose(areas["SASA"], structure.residue_data["SASA"], rtol=1e-9)
+        np.testing.assert_allclose(areas["rSASA"], structure.residue_data["rSASA"], rtol=1e-9, equal_nan=True)
+
+
+def test_sasa_threshold_counts_match_a_hand_count(pdb_file):
+    areas = sasaumure.residue_sasa(pdb_file)
+    thresholds = [50.0, 5.0, 20.0, 20.0, 0.0]
+    for key in ("SASA", "rSASA"):
+        counts = sasaumure.sasa_threshold_counts(areas[key], thresholds, chains=areas["chain"])
+        assert set(counts) == {"all", *areas["chain"].tolist()}
+        for label, values in [("all", areas[key].tolist())] + [
+                (chain, areas[key][areas["chain"] == chain].tolist()) for chain in set(areas["chain"].tolist())]:
+            expected = [sum(1 for value in values if value < threshold) for threshold in thresholds]
+            assert counts[label].tolist() == expected, (key, label)
+        unfiltered = sasaumure.sasa_threshold_counts(areas[key], thresholds)
+        assert list(unfiltered) == ["all"] and unfiltered["all"].tolist() == counts["all"].tolist()
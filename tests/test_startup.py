@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SRC
+
+# Modules loaded only by the plotting and SASA stages, see benchmarks/bench_startup.py for the timing budget
+HEAVY_MODULES = ("matplotlib", "seaborn", "pandas", "freesasa")
+
+_PROBE = """
+import importlib, json, sys
+importlib.import_module(sys.argv[1])
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[2:]))))
+"""
+
+
+def imported_heavy_modules(module: str) -> list:
+    """Imports a module in a fresh interpreter run from src/, as the entry points are, and gives the heavy modules
+    it loaded."""
+    process = subprocess.run([sys.executable, "-c", _PROBE, module, *HEAVY_MODULES], cwd=SRC, capture_output=True,
+                             text=True)
+    assert process.returncode == 0, process.stderr
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", [
+    pytest.param("main", marks=pytest.mark.skipif(sys.version_info < (3, 12), reason="main.py needs Python 3.12")),
+    "pdb_parser", "pdb_stream", "batch", "pipeline", "contact_engine", "visualizations",
+])
+def test_entry_points_do_not_import_heavy_modules(module):
+    assert imported_heavy_modules(module) == []
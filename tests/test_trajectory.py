@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import contact_engine
+import pdb_parser
+import trajectory
+from pdb_structure import Structure
+
+
+def moved_frames(topology, n_frames=6, seed=0):
+    """
+    Frames translating a few residues beyond half the skin (patching the neighbour list), with one frame moving
+    every atom (rebuilding it).
+    """
+    rng = np.random.default_rng(seed)
+    coords = topology.coords.copy()
+    frames = [coords.copy()]
+    residue_of_atom = np.repeat(np.arange(topology.n_residues), np.diff(topology.residue_starts))
+    for position in range(1, n_frames):
+        if position == 3:
+            coords += rng.normal(scale=3.0, size=coords.shape)
+        else:
+            shifts = rng.normal(scale=1.5, size=(topology.n_residues, 3))
+            shifts[rng.random(topology.n_residues) > 0.05] = 0
+            coords += shifts[residue_of_atom]
+        frames.append(coords.copy())
+    return frames
+
+
+def expected_contacts(topology, coords, first, second, cutoff, mode):
+    structure = Structure.from_arrays(dict(topology.arrays(), coords=coords))
+    return contact_engine.residue_distances(structure.residues(first), structure.residues(second), cutoff, mode)
+
+
+@pytest.mark.parametrize("mode", ["atom", "centroid"])
+def test_frames_match_per_frame_recomputation(pdb_file, mode):
+    topology = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    first, second = topology.chain_ids[0], topology.chain_ids[-1]
+    contacts = trajectory.TrajectoryContacts(topology, f"chain {first}", f"chain {second}", cutoff=8.0, mode=mode)
+    frames = moved_frames(topology)
+    counts = {}
+    for coords, found in zip(frames, contacts.run(frames)):
+        expected = expected_contacts(topology, coords, first, second, 8.0, mode)
+        np.testing.assert_array_equal(found.first, expected.first)
+        np.testing.assert_array_equal(found.second, expected.second)
+        np.testing.assert_allclose(found.distance, expected.distance, rtol=1e-12)
+        assert found.shape == expected.shape
+        for pair in zip(expected.first.tolist(), expected.second.tolist()):
+            counts[pair] = counts.get(pair, 0) + 1
+    assert contacts.frames == len(frames)
+    assert contacts.rebuilds >= 2 and contacts.updates >= 1
+
+    frequency = contacts.frequency()
+    assert list(zip(frequency.first.tolist(), frequency.second.tolist())) == sorted(counts)
+    assert frequency.frames.tolist() == [counts[pair] for pair in sorted(counts)]
+    assert frequency.matrix().max() <= 1.0
+
+
+def test_selection_against_itself_skips_identical_residues(pdb_file):
+    topology = pdb_parser.parse_pdb(pdb_file, hetatm=False)
+    chain = topology.chain_ids[0]
+    contacts = trajectory.TrajectoryContacts(topology, f"chain {chain}", cutoff=5.0)
+    frames = moved_frames(topology, n_frames=3)
+    for coords, found in zip(frames, contacts.run(frames)):
+        expected = expected_contacts(topology, coords, chain, chain, 5.0, "atom")
+        np.testing.assert_array_equal(found.first, expected.first)
+        np.testing.assert_array_equal(found.second, expected.second)
+        assert not np.any(found.first == found.second)
+
+
+def test_pdb_frames_of_an_ensemble(write_pdb, pdb_file):
+    with open(pdb_file) as f:
+        atoms = [line for line in f if line.startswith("ATOM")][:50]
+    shifted = [f"{line[:30]}{float(line[30:38]) + 1:8.3f}{line[38:]}" for line in atoms]
+    file = write_pdb("MODEL        1\n" + "".join(atoms) + "ENDMDL\nMODEL        2\n" + "".join(shifted) + "ENDMDL\n")
+    topology, frames = trajectory.pdb_frames(file)
+    frames = list(frames)
+    assert len(frames) == 2 and topology.n_atoms == len(frames[0])
+    np.testing.assert_allclose(frames[1] - frames[0], np.tile([1.0, 0.0, 0.0], (len(frames[0]), 1)), atol=1e-9)
+
+    broken = write_pdb("MODEL        1\n" + "".join(atoms) + "ENDMDL\nMODEL        2\n" + "".join(atoms[:-1])
+                       + "ENDMDL\n", "broken.pdb")
+    with pytest.raises(ValueError):
+        list(trajectory.pdb_frames(broken)[1])
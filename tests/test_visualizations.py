@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+import contact_engine
+import pdb_parser
+import visualizations
+from conftest import DATA
+
+
+def sparse_map(matrix):
+    first, second = np.nonzero(~np.isnan(matrix))
+    return contact_engine.ResidueContacts(first, second, matrix[first, second], matrix.shape)
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(2.0, 10.0, size=(53, 31))
+    values[rng.random(values.shape) < 0.7] = np.nan
+    return values
+
+
+@pytest.mark.parametrize("grid", [(10, 7), (53, 31), (100, 100), (1, 1)])
+def test_pooling_keeps_the_block_minimum(matrix, grid):
+    pooled, factors = visualizations.pool_contact_map(matrix, grid)
+    assert pooled.shape[0] <= grid[0] and pooled.shape[1] <= grid[1]
+    for row in range(pooled.shape[0]):
+        for column in range(pooled.shape[1]):
+            block = matrix[row * factors[0]:(row + 1) * factors[0], column * factors[1]:(column + 1) * factors[1]]
+            expected = np.nan if np.isnan(block).all() else np.nanmin(block)
+            np.testing.assert_equal(pooled[row, column], expected)
+    sparse, sparse_factors = visualizations.pool_contact_map(sparse_map(matrix), grid)
+    assert sparse_factors == factors
+    np.testing.assert_array_equal(sparse, pooled)
+
+
+def test_renderer_pools_every_map_to_the_axes_grid(tmp_path, matrix):
+    pytest.importorskip("matplotlib")
+    renderer = visualizations.HeatmapRenderer(figsize=(3, 2), dpi=20)
+    grid = renderer.pixel_grid()
+    large = np.tile(matrix, (4, 4))
+    for position, data in enumerate((large, sparse_map(large))):
+        renderer.render(data, output=str(tmp_path / f"map_{position}.png"))
+        assert renderer.pixel_grid() == grid
+        assert renderer.image.get_array().shape == visualizations.pool_contact_map(large, grid)[0].shape
+
+
+def test_render_heatmaps_writes_one_file_per_map(tmp_path, matrix):
+    pytest.importorskip("matplotlib")
+    structure = pdb_parser.parse_pdb(os.path.join(DATA, "1brs.pdb"))
+    one, two = next(iter(contact_engine.chain_interfaces(structure, 8.0)))
+    contacts = contact_engine.residue_distances(structure.residues(one), structure.residues(two), 8.0)
+    outputs = [str(tmp_path / name) for name in ("dense.png", "sparse.png", "empty.png")]
+    empty = contact_engine.ResidueContacts(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0),
+                                           (5, 5))
+    visualizations.render_heatmaps([matrix, contacts, empty], outputs, [("one", "two"), (one, two), ("a", "b")])
+    for output in outputs:
+        with open(output, "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"